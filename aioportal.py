@@ -0,0 +1,230 @@
+import asyncio
+import concurrent.futures
+import typing
+
+import aiohttp
+
+from .multipart import MultipartEncoder
+from .portal import backoff_delay, submission_params, status_params, parse_status_response, SubmissionResult, \
+    SubmissionResponseParser
+
+
+class AsyncPortalClient(object):
+    """asyncio client for the SALT portal with bounded concurrency.
+
+    At most 'concurrency' requests are sent at the same time, all others wait for a free slot. Each request, including
+    its retries and the time waiting for a slot, must finish within 'deadline' seconds. Retries work as in
+    PortalSession.
+
+    Use it as an asynchronous context manager:
+
+        async with AsyncPortalClient.from_config(cfg) as client:
+            await client.submit_many(zip_files)
+    """
+
+    def __init__(self, cfg: dict, concurrency: int = 4, deadline: float = 120.):
+        """Creates a new client.
+
+        Args:
+            cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+            concurrency: Maximum number of concurrent requests.
+            deadline: Maximum time in seconds for a single request.
+        """
+        self.cfg = cfg
+        self.url = cfg['portal_url']
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.retries = cfg.get('retries', 3)
+        self.retry_backoff = cfg.get('retry_backoff', 0.5)
+        self.retry_backoff_max = cfg.get('retry_backoff_max', 10.)
+        self.retry_status = set(cfg.get('retry_status', (500, 502, 503, 504)))
+        self._timeout = aiohttp.ClientTimeout(sock_connect=cfg.get('connect_timeout', 5.),
+                                              sock_read=cfg.get('read_timeout', 60.))
+        self._session = None
+        self._semaphore = None
+
+    @staticmethod
+    def from_config(cfg: dict) -> 'AsyncPortalClient':
+        """Creates a new client from the SALT facility settings.
+
+        Args:
+            cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+        Returns:
+            New client.
+        """
+        return AsyncPortalClient(cfg, concurrency=cfg.get('concurrency', 4), deadline=cfg.get('deadline', 120.))
+
+    async def open(self):
+        """Opens the HTTP session."""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                              timeout=self._timeout)
+
+    async def close(self):
+        """Closes the HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> 'AsyncPortalClient':
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def submit_block(self, zip_file: typing.Union[bytes, str]) -> SubmissionResult:
+        """Submit a ZIP file with one or more blocks.
+
+        Args:
+            zip_file: Bytes array containing ZIP file with proposal or filename.
+
+        Returns:
+            Result of submission.
+
+        Raises:
+            ValueError: If server returned an error.
+            asyncio.TimeoutError: If request did not finish within deadline.
+        """
+        result = await self._post(submission_params(self.cfg), [zip_file], AsyncPortalClient._read_submission)
+        result.raise_for_error()
+        return result
+
+    async def submit_many(self, zip_files: typing.List[typing.Union[bytes, str]]) \
+            -> typing.List[typing.Union[SubmissionResult, Exception]]:
+        """Submit many ZIP files concurrently.
+
+        Args:
+            zip_files: List of ZIP files as in submit_block().
+
+        Returns:
+            List with one entry per ZIP file, which is the result on success or the exception on failure.
+        """
+        return await asyncio.gather(*[self.submit_block(z) for z in zip_files], return_exceptions=True)
+
+    async def get_status(self, block_codes: typing.List[str]) -> typing.Dict[str, str]:
+        """Query status of blocks.
+
+        Args:
+            block_codes: Codes of blocks to query.
+
+        Returns:
+            Dictionary mapping block codes to their status.
+        """
+        content = await self._post(status_params(self.cfg, block_codes), [])
+        return parse_status_response(content)
+
+    async def _post(self, fields: typing.Dict[str, str], files: list,
+                    read: typing.Callable[[aiohttp.ClientResponse], typing.Awaitable] = None) -> typing.Any:
+        """Send a request within the concurrency limit and the deadline.
+
+        Args:
+            fields: Form fields to send.
+            files: Files to send.
+            read: Coroutine function for reading the response, defaults to reading the whole body.
+
+        Returns:
+            Body of response or result of read.
+        """
+        if self._session is None:
+            raise ValueError('Client is not open.')
+        return await asyncio.wait_for(self._post_limited(fields, files, read or AsyncPortalClient._read_all),
+                                      self.deadline)
+
+    async def _post_limited(self, fields: typing.Dict[str, str], files: list,
+                            read: typing.Callable[[aiohttp.ClientResponse], typing.Awaitable]) -> typing.Any:
+        """Send a request, when a slot is free, and retry it if necessary.
+
+        Args:
+            fields: Form fields to send.
+            files: Files to send.
+            read: Coroutine function for reading the response.
+
+        Returns:
+            Result of read.
+        """
+        body = MultipartEncoder(fields, files)
+        headers = {"Content-Type": body.content_type, 'content-length': str(len(body))}
+
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    # send request, streaming the body
+                    body.seek(0)
+                    async with self._session.post(self.url, data=AsyncPortalClient._stream(body),
+                                                  headers=headers) as response:
+                        # success or no retries left?
+                        if response.status not in self.retry_status:
+                            return await read(response)
+                        if attempt == self.retries:
+                            response.raise_for_status()
+
+                except aiohttp.ClientConnectionError:
+                    # no retries left?
+                    if attempt == self.retries:
+                        raise
+
+                # wait a little
+                await asyncio.sleep(backoff_delay(attempt, self.retry_backoff, self.retry_backoff_max))
+
+    @staticmethod
+    async def _read_all(response: aiohttp.ClientResponse) -> bytes:
+        """Read the whole body of a response.
+
+        Args:
+            response: Response to read from.
+
+        Returns:
+            Body of response.
+        """
+        return await response.read()
+
+    @staticmethod
+    async def _read_submission(response: aiohttp.ClientResponse) -> SubmissionResult:
+        """Parse the response to a submission while streaming it.
+
+        Args:
+            response: Response to read from.
+
+        Returns:
+            Result of submission.
+        """
+        parser = SubmissionResponseParser()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            if parser.feed(chunk):
+                break
+        return parser.close()
+
+    @staticmethod
+    async def _stream(body: MultipartEncoder) -> typing.AsyncIterator[bytes]:
+        """Yield the chunks of a body.
+
+        Args:
+            body: Encoder to read from.
+        """
+        for chunk in body:
+            yield chunk
+
+
+def run_sync(coro: typing.Awaitable) -> typing.Any:
+    """Run a coroutine from synchronous code and return its result.
+
+    If there is already an event loop running in this thread, e.g. in an async Django view, the coroutine is run in a
+    new event loop in a separate thread.
+
+    Args:
+        coro: Coroutine to run.
+
+    Returns:
+        Result of coroutine.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+__all__ = ['AsyncPortalClient', 'run_sync']
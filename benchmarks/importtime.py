@@ -0,0 +1,64 @@
+"""Benchmark for the time it takes to import modules of the package, measured with python -X importtime.
+
+Run with:
+    python -m saltofi.benchmarks.importtime [module ...]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import typing
+
+
+"""Modules to measure, if none are given."""
+MODULES = ['saltofi.xml', 'saltofi.portal', 'saltofi.multipart', 'saltofi.outbox']
+
+"""Heavy dependencies, which are reported, if a module imports them."""
+HEAVY = ['astropy', 'numpy', 'django', 'requests', 'aiohttp']
+
+
+def measure(module: str) -> typing.Dict[str, int]:
+    """Imports a module in a fresh interpreter and returns the cumulative import times.
+
+    Args:
+        module: Name of module to import.
+
+    Returns:
+        Dictionary mapping names of all imported modules to their cumulative import time in microseconds.
+    """
+
+    # run in neutral directory, so that nothing in the current directory shadows other modules
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=env,
+                          cwd=tempfile.gettempdir(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+    # parse lines like "import time:       859 |     379981 |     astropy.time"
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[12:].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(modules: typing.List[str] = None, repeat: int = 5):
+    """Runs the benchmark and prints best import time per module.
+
+    Args:
+        modules: Names of modules to import, defaults to MODULES.
+        repeat: Number of measurements per module.
+    """
+
+    # run it
+    print('%-20s %10s  %s' % ('module', 'time [ms]', 'heavy dependencies'))
+    for module in modules or MODULES:
+        runs = [measure(module) for _ in range(repeat)]
+        best = min(r[module] for r in runs) / 1000.
+        heavy = ['%s (%.1fms)' % (h, runs[0][h] / 1000.) for h in HEAVY if h in runs[0]]
+        print('%-20s %10.1f  %s' % (module, best, ', '.join(heavy) or '-'))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
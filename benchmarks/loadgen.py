@@ -0,0 +1,131 @@
+"""Load generator, which drives SaltFacility at a given rate of submissions against a local PortalStub.
+
+Submissions are started on a fixed schedule independent of how fast earlier ones finish, and latencies are measured
+from the scheduled start, so that a slow portal shows up in the latencies instead of just lowering the rate.
+
+Run with:
+    python -m saltofi.benchmarks.loadgen [--rate 10] [--duration 10] [--threads 16] [--blocks 1]
+                                         [--latency 0.1] [--jitter 0.1] [--reject-rate 0] [--failure-rate 0]
+                                         [--max-rate 20]
+
+Settings for the facility, e.g. retries and timeouts, are taken from the Django settings, see
+saltofi.benchmarks.pipeline.configure().
+"""
+import argparse
+import concurrent.futures
+import threading
+import time
+import types
+import typing
+
+from saltofi.benchmarks.pipeline import configure
+from saltofi.stub import PortalStub
+
+
+def percentile(values: typing.List[float], p: float) -> float:
+    """Returns the p-th percentile of the given values.
+
+    Args:
+        values: Sorted list of values.
+        p: Percentile between 0 and 100.
+
+    Returns:
+        Value at percentile, using the nearest rank.
+    """
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(p / 100. * len(values))) - 1))]
+
+
+def run(rate: float, duration: float, threads: int = 16, blocks: int = 1) -> dict:
+    """Submits blocks at the given rate and collects latencies.
+
+    Args:
+        rate: Number of submissions per second.
+        duration: Duration of test in seconds.
+        threads: Maximum number of concurrent submissions.
+        blocks: Number of blocks per submission.
+
+    Returns:
+        Dictionary with sorted 'latencies' of successful submissions in seconds, number of 'rejected' and 'failed'
+        submissions, and 'elapsed' time in seconds.
+    """
+    from saltofi.facility import SaltFacility, SaltFacilityGrbForm, SubmissionError
+
+    # create payloads in advance, so that building them does not limit the rate
+    count = int(rate * duration)
+    n = count * blocks
+    targets = [types.SimpleNamespace(id=i, name='Target %d' % i, ra=i * 360. / n, dec=-80. + i * 160. / n)
+               for i in range(n)]
+    payloads = SaltFacilityGrbForm.create_payloads(targets)
+
+    # results
+    latencies, rejected, failed = [], [0], [0]
+    lock = threading.Lock()
+
+    def submit(scheduled: float, batch: typing.List[dict]):
+        try:
+            SaltFacility().submit_observations(batch)
+        except SubmissionError:
+            with lock:
+                rejected[0] += 1
+        except Exception:
+            with lock:
+                failed[0] += 1
+        else:
+            with lock:
+                latencies.append(time.monotonic() - scheduled)
+
+    # start submissions on schedule
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for i in range(count):
+            scheduled = start + i / rate
+            time.sleep(max(0., scheduled - time.monotonic()))
+            executor.submit(submit, scheduled, payloads[i * blocks:(i + 1) * blocks])
+    elapsed = time.monotonic() - start
+
+    # finished
+    return {'latencies': sorted(latencies), 'rejected': rejected[0], 'failed': failed[0], 'elapsed': elapsed}
+
+
+def main(args: typing.List[str] = None):
+    """Runs the load generator and prints a report.
+
+    Args:
+        args: Command line arguments.
+    """
+
+    # parse arguments
+    parser = argparse.ArgumentParser(description='Load generator for SALT submissions.')
+    parser.add_argument('--rate', type=float, default=10., help='Submissions per second.')
+    parser.add_argument('--duration', type=float, default=10., help='Duration in seconds.')
+    parser.add_argument('--threads', type=int, default=16, help='Maximum number of concurrent submissions.')
+    parser.add_argument('--blocks', type=int, default=1, help='Number of blocks per submission.')
+    parser.add_argument('--latency', type=float, default=0.1, help='Minimum latency of portal in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Maximum additional latency in seconds.')
+    parser.add_argument('--reject-rate', type=float, default=0., help='Fraction of blocks rejected by portal.')
+    parser.add_argument('--failure-rate', type=float, default=0., help='Fraction of requests failing with HTTP 500.')
+    parser.add_argument('--max-rate', type=float, help='Maximum number of requests per second for portal.')
+    parser.add_argument('--seed', type=int, help='Seed for random numbers in portal.')
+    opts = parser.parse_args(args)
+
+    # run against local portal
+    with PortalStub('127.0.0.1', latency=opts.latency, jitter=opts.jitter, reject_rate=opts.reject_rate,
+                    failure_rate=opts.failure_rate, max_rate=opts.max_rate, seed=opts.seed) as stub:
+        configure(stub.url)
+        result = run(opts.rate, opts.duration, threads=opts.threads, blocks=opts.blocks)
+
+    # report
+    latencies = result['latencies']
+    print('submissions:  %d ok, %d rejected, %d failed' % (len(latencies), result['rejected'], result['failed']))
+    print('portal:       %d requests, %d failed, %d throttled' % (stub.requests, stub.failed, stub.throttled))
+    print('throughput:   %.2f submissions/s, %.2f blocks/s' % (len(latencies) / result['elapsed'],
+                                                              len(latencies) * opts.blocks / result['elapsed']))
+    print('latency [ms]: p50=%.1f p95=%.1f p99=%.1f max=%.1f' % tuple(
+        v * 1e3 for v in (percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+                          latencies[-1] if latencies else float('nan'))))
+
+
+if __name__ == '__main__':
+    main()
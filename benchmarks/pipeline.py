@@ -0,0 +1,275 @@
+"""Benchmark suite for the whole pipeline from loading a block template to submitting blocks to a local fake portal.
+
+Every case is run for several numbers of blocks. Results can be stored as a baseline in a JSON file and later runs
+are compared to it, flagging all cases that got slower than the given tolerance. The exit code is 1 in that case.
+
+Run with:
+    python -m saltofi.benchmarks.pipeline [--scales 1,10,100,1000,10000] [--cases template,zip,...]
+                                          [--baseline baseline.json] [--save] [--tolerance 0.25] [--backend lxml]
+
+Cases that use the facility require Django settings. If DJANGO_SETTINGS_MODULE is not set, minimal settings are
+configured. In any case, the portal URL is replaced with the URL of a local PortalStub and the outbox is disabled.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import types
+import typing
+
+from saltofi.stub import PortalStub
+from saltofi.xml import Block
+from saltofi.xml.backend import available_backends, set_default_backend
+
+
+"""Block template used in all cases."""
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'templates', 'grb.xml')
+
+"""Default numbers of blocks to run each case with."""
+SCALES = [1, 10, 100, 1000, 10000]
+
+
+def configure(url: str):
+    """Configure Django settings for the facility, so that it talks to the portal at the given URL.
+
+    Args:
+        url: URL of portal.
+    """
+    from django.conf import settings
+    import django
+
+    # configure minimal settings, if we're not running within a TOM
+    if not settings.configured:
+        settings.configure(FACILITIES={}, USE_TZ=True)
+        django.setup()
+
+    # set portal and disable outbox
+    salt = dict(settings.FACILITIES.get('SALT', {}), portal_url=url, outbox=None)
+    salt.setdefault('username', 'benchmark')
+    salt.setdefault('password', 'benchmark')
+    salt.setdefault('proposal_code', 'BENCHMARK')
+    settings.FACILITIES = dict(settings.FACILITIES, SALT=salt)
+
+
+def _blocks(n: int) -> typing.List[Block]:
+    """Returns n blocks created from the template."""
+    return [Block.from_template(TEMPLATE) for _ in range(n)]
+
+
+def _targets(n: int) -> list:
+    """Returns n fake targets with the attributes of TOM targets used by the forms."""
+    return [types.SimpleNamespace(id=i, name='Target %d' % i, ra=i * 360. / n, dec=-80. + i * 160. / n)
+            for i in range(n)]
+
+
+def case_parse(n: int) -> typing.Callable:
+    """Parse template file into n blocks."""
+    return lambda: [Block(TEMPLATE) for _ in range(n)]
+
+
+def case_template(n: int) -> typing.Callable:
+    """Load n blocks from cached template."""
+    return lambda: _blocks(n)
+
+
+def case_properties(n: int) -> typing.Callable:
+    """Get and set some properties of Block and Target in n blocks."""
+    blocks = _blocks(n)
+
+    def run():
+        for block in blocks:
+            block.code = 'code'
+            block.name = block.code
+            target = block.targets[0]
+            target.name = 'name'
+            target.mag_min = target.mag_max
+    return run
+
+
+def case_to_string(n: int) -> typing.Callable:
+    """Serialize n blocks."""
+    blocks = _blocks(n)
+    return lambda: [block.to_string() for block in blocks]
+
+
+def case_render(n: int) -> typing.Callable:
+    """Render n blocks with new codes, names and coordinates from a compiled template."""
+    from astropy.coordinates import SkyCoord
+    from saltofi.xml import renderers, Target
+    renderer = renderers.get(TEMPLATE)
+    targets = _targets(n)
+    coords = Target.format_coordinates(SkyCoord([t.ra for t in targets], [t.dec for t in targets], unit='deg'))
+
+    def run():
+        for t, c in zip(targets, coords):
+            renderer.render({'code': 'code', 'name': t.name},
+                            [{'name': t.name, 'coordinates': c, 'finding_charts': ['auto-generated']}])
+    return run
+
+
+def case_zip(n: int) -> typing.Callable:
+    """Pack n serialized blocks into a single ZIP file."""
+    from saltofi.facility import SaltFacility
+    xml = [block.to_string() for block in _blocks(n)]
+    return lambda: SaltFacility._create_zip_from_xml(xml).close()
+
+
+def case_multipart(n: int) -> typing.Callable:
+    """Encode and read a multipart body for a ZIP file with n blocks."""
+    from django.conf import settings
+    from saltofi.facility import SaltFacility
+    from saltofi.portal import submission_params
+    with SaltFacility._create_zip_from_xml([block.to_string() for block in _blocks(n)]) as f:
+        zip_file = f.read()
+    fields = submission_params(settings.FACILITIES['SALT'])
+
+    def run():
+        _, body = SaltFacility._encode_multipart_formdata(fields, [zip_file])
+        while body.read(65536):
+            pass
+    return run
+
+
+def case_end_to_end(n: int) -> typing.Callable:
+    """Create payloads for n targets and submit them to the fake portal."""
+    from saltofi.facility import SaltFacility, SaltFacilityGrbForm
+    targets = _targets(n)
+    return lambda: SaltFacility().submit_observations([SaltFacilityGrbForm.create_payload(t) for t in targets])
+
+
+def case_bulk(n: int) -> typing.Callable:
+    """Create payloads for n targets at once and submit them to the fake portal."""
+    from saltofi.facility import SaltFacility, SaltFacilityGrbForm
+    targets = _targets(n)
+    return lambda: SaltFacility().submit_observations(SaltFacilityGrbForm.create_payloads(targets))
+
+
+def case_observability(n: int) -> typing.Callable:
+    """Compute windows for n targets in a night, with the grid of the night cached."""
+    import datetime
+    from saltofi.observability import windows
+    targets = _targets(n)
+    ra, dec = [t.ra for t in targets], [t.dec for t in targets]
+    night = datetime.date(2024, 6, 1)
+    windows(ra[:1], dec[:1], night)
+    return lambda: windows(ra, dec, night)
+
+
+"""All cases by name."""
+CASES = {
+    'parse': case_parse,
+    'template': case_template,
+    'properties': case_properties,
+    'to_string': case_to_string,
+    'render': case_render,
+    'zip': case_zip,
+    'multipart': case_multipart,
+    'end_to_end': case_end_to_end,
+    'bulk': case_bulk,
+    'observability': case_observability,
+}
+
+
+def measure(func: typing.Callable, repeat: int = 5, budget: float = 2.) -> float:
+    """Measures the best time for calling the given function.
+
+    Args:
+        func: Function to measure.
+        repeat: Maximum number of calls.
+        budget: Stop repeating after this many seconds.
+
+    Returns:
+        Best time in seconds.
+    """
+    times = []
+    while len(times) < repeat and sum(times) < budget:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> typing.List[str]:
+    """Compares results to a baseline.
+
+    Args:
+        results: Times by case name and number of blocks.
+        baseline: Baseline in same format.
+        tolerance: Allowed relative slowdown.
+
+    Returns:
+        List of regressions as '<case>[<n>]'.
+    """
+    regressions = []
+    for name, times in results.items():
+        for n, t in times.items():
+            base = baseline.get(name, {}).get(n)
+            if base is not None and t > base * (1. + tolerance):
+                regressions.append('%s[%s]' % (name, n))
+    return regressions
+
+
+def main(args: typing.List[str] = None) -> int:
+    """Runs the benchmark suite.
+
+    Args:
+        args: Command line arguments.
+
+    Returns:
+        Exit code, 1 if regressions were found.
+    """
+
+    # parse arguments
+    parser = argparse.ArgumentParser(description='Benchmarks for the block pipeline.')
+    parser.add_argument('--scales', type=lambda s: [int(x) for x in s.split(',')], default=SCALES,
+                        help='Comma-separated numbers of blocks.')
+    parser.add_argument('--cases', type=lambda s: s.split(','), default=list(CASES.keys()),
+                        help='Comma-separated names of cases, out of %s.' % ', '.join(CASES.keys()))
+    parser.add_argument('--baseline', help='JSON file with baseline.')
+    parser.add_argument('--save', action='store_true', help='Store results as new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown.')
+    parser.add_argument('--backend', choices=available_backends(), help='XML backend to use.')
+    opts = parser.parse_args(args)
+    if opts.backend:
+        set_default_backend(opts.backend)
+
+    # load baseline
+    baseline = {}
+    if opts.baseline and os.path.exists(opts.baseline):
+        with open(opts.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    # run cases against local portal
+    results = {}
+    with PortalStub('127.0.0.1') as stub:
+        configure(stub.url)
+        print('%-12s %8s %12s %14s %12s' % ('case', 'blocks', 'time [ms]', 'per block [us]', 'baseline'))
+        for name in opts.cases:
+            results[name] = {}
+            for n in opts.scales:
+                # measure, keys are strings to match JSON
+                t = measure(CASES[name](n))
+                results[name][str(n)] = t
+
+                # compare to baseline
+                base = baseline.get(name, {}).get(str(n))
+                diff = '-' if base is None else '%+.1f%%' % ((t / base - 1.) * 100.)
+                print('%-12s %8d %12.2f %14.2f %12s' % (name, n, t * 1e3, t / n * 1e6, diff))
+
+    # store or compare
+    if opts.save:
+        if not opts.baseline:
+            parser.error('--save requires --baseline.')
+        with open(opts.baseline, 'w') as f:
+            json.dump(dict(baseline, **results), f, indent=2, sort_keys=True)
+        return 0
+    regressions = compare(results, baseline, opts.tolerance)
+    if regressions:
+        print('Regressions: ' + ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Micro-benchmark for property access on elements with and without compiled XPaths.
+
+Run with:
+    python -m saltofi.benchmarks.xpath
+"""
+import os
+import timeit
+
+from saltofi.xml import Block, Target
+
+
+def main(number: int = 100000):
+    """Runs the benchmark and prints time per access.
+
+    Args:
+        number: Number of accesses per measurement.
+    """
+
+    # load block and get target
+    block = Block(os.path.join(os.path.dirname(__file__), '..', 'templates', 'grb.xml'))
+    target = block.targets[0]
+
+    # define accesses to measure, first with namespaces resolved on each access like before, then compiled
+    cases = [
+        ('Block.semester get',
+         lambda: block.root.find(Block.SEMESTER.format(**block.namespaces)).text,
+         lambda: block.get(Block.SEMESTER)),
+        ('Block.code set',
+         lambda: setattr(block.root.find(Block.BLOCK_CODE.format(**block.namespaces)), 'text', 'code'),
+         lambda: block.set(Block.BLOCK_CODE, 'code')),
+        ('Target.mag_min get',
+         lambda: target.root.find(Target.MAG_MIN.format(**target.namespaces)).text,
+         lambda: target.get(Target.MAG_MIN)),
+        ('Target.name set',
+         lambda: setattr(target.root.find(Target.NAME.format(**target.namespaces)), 'text', 'name'),
+         lambda: target.set(Target.NAME, 'name')),
+        ('Block.targets',
+         lambda: [Target(t, namespaces=block.namespaces)
+                  for t in block.root.findall(Block.TARGET.format(**block.namespaces))],
+         lambda: block.targets),
+    ]
+
+    # run them
+    print('%-20s %13s %13s %8s' % ('access', 'format [us]', 'compiled [us]', 'speedup'))
+    for name, formatted, compiled in cases:
+        t_formatted = min(timeit.repeat(formatted, number=number, repeat=3)) / number * 1e6
+        t_compiled = min(timeit.repeat(compiled, number=number, repeat=3)) / number * 1e6
+        print('%-20s %13.3f %13.3f %7.1fx' % (name, t_formatted, t_compiled, t_formatted / t_compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import typing
+from xml.etree import ElementTree as ET
+
+from saltofi.xml import Block, Target
+from saltofi.xml.element import Element
+
+
+def _local_path(xpath: str) -> typing.Tuple[str, ...]:
+    """Converts an XPath of simple child steps into a tuple of local tag names.
+
+    Args:
+        xpath: XPath like './{/PIPT/Proposal/Phase2}BlockSemester/{/PIPT/Proposal/Phase2}Comments'.
+
+    Returns:
+        Local names like ('BlockSemester', 'Comments').
+    """
+    return tuple(re.sub(r'\{[^}]*\}', '', xpath).split('/')[1:])
+
+
+"""Paths of nodes relative to the block that change with every submission of the same block, and are ignored."""
+VOLATILE_PATHS = {_local_path(x) for x in (Block.BLOCK_CODE, Block.NAME, Block.COMMENTS, Block.EXPIRYDATE)}
+
+"""Local names of nodes that are ignored anywhere in the block."""
+VOLATILE_TAGS = {_local_path(Target.TARGET_CODE)[-1]}
+
+
+def canonical_hash(xml: typing.Union[str, bytes, Element]) -> str:
+    """Computes a hash of a block, which is the same for all blocks that only differ in volatile fields.
+
+    The hash covers tags with their full namespaces, sorted attributes and texts without surrounding whitespace, so
+    it does not depend on namespace prefixes, attribute order or indentation. The nodes in VOLATILE_PATHS and
+    VOLATILE_TAGS, i.e. the codes of the block and its targets, the name of the block, its comment and its expiry date,
+    are skipped.
+
+    Args:
+        xml: XML of block as string, bytes or Element.
+
+    Returns:
+        Hex digest of SHA-256 hash.
+    """
+    root = xml.root if isinstance(xml, Element) else ET.fromstring(xml)
+    h = hashlib.sha256()
+
+    def walk(el, path: typing.Tuple[str, ...]):
+        # tag, attributes and text
+        h.update(('<%s' % el.tag).encode('utf-8'))
+        for key in sorted(el.attrib):
+            h.update((' %s=%s' % (key, el.attrib[key])).encode('utf-8'))
+        h.update(b'>')
+        if el.text and el.text.strip():
+            h.update(el.text.strip().encode('utf-8'))
+
+        # children, unless volatile
+        for child in el:
+            local = child.tag[child.tag.find('}') + 1:] if isinstance(child.tag, str) else ''
+            child_path = path + (local,)
+            if local in VOLATILE_TAGS or child_path in VOLATILE_PATHS:
+                continue
+            walk(child, child_path)
+            if child.tail and child.tail.strip():
+                h.update(child.tail.strip().encode('utf-8'))
+        h.update(b'</>')
+
+    walk(root, ())
+    return h.hexdigest()
+
+
+class SubmissionIndex(object):
+    """Persistent index of recently submitted blocks by their canonical hash, stored in SQLite.
+
+    Claiming a hash is atomic, so of several processes submitting the same block at the same time, only one gets to
+    submit it, while the others get its block code. Entries expire after a given time, after which the same block can
+    be submitted again.
+    """
+
+    """Number of claims between removals of expired entries."""
+    EVICT_INTERVAL = 100
+
+    def __init__(self, filename: str, ttl: float = 86400.):
+        """Opens or creates an index.
+
+        Args:
+            filename: Name of SQLite database file.
+            ttl: Time in seconds, for which a submitted block counts as duplicate.
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._claims = 0
+
+        # open database, autocommit mode, so that we can control transactions ourselves
+        self._db = sqlite3.connect(filename, timeout=30., isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS submissions ('
+                         'hash TEXT PRIMARY KEY, '
+                         'block_code TEXT NOT NULL, '
+                         'created REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS submissions_created ON submissions (created)')
+
+    def close(self):
+        """Close database."""
+        with self._lock:
+            self._db.close()
+
+    def claim(self, block_hash: str, block_code: str) -> typing.Union[str, None]:
+        """Claim a hash for a block that is about to be submitted.
+
+        Args:
+            block_hash: Canonical hash of block.
+            block_code: Code of block.
+
+        Returns:
+            None, if the hash has been claimed for this block, otherwise the code of the block submitted before.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                # remove expired entry for this hash and try to insert ours
+                self._db.execute('DELETE FROM submissions WHERE hash=? AND created<?', (block_hash, now - self.ttl))
+                cur = self._db.execute('INSERT OR IGNORE INTO submissions (hash, block_code, created) VALUES (?, ?, ?)',
+                                       (block_hash, block_code, now))
+                existing = None
+                if cur.rowcount == 0:
+                    existing = self._db.execute('SELECT block_code FROM submissions WHERE hash=?',
+                                                (block_hash,)).fetchone()[0]
+
+                # remove all expired entries from time to time
+                self._claims += 1
+                if self._claims % SubmissionIndex.EVICT_INTERVAL == 0:
+                    self._db.execute('DELETE FROM submissions WHERE created<?', (now - self.ttl,))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return existing
+
+    def release(self, block_hash: str, block_code: str):
+        """Release a claim for a block whose submission failed, so that it can be submitted again.
+
+        Args:
+            block_hash: Canonical hash of block.
+            block_code: Code of block, the claim is only released, if it belongs to this block.
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM submissions WHERE hash=? AND block_code=?', (block_hash, block_code))
+
+    def evict(self) -> int:
+        """Removes all expired entries.
+
+        Returns:
+            Number of removed entries.
+        """
+        with self._lock:
+            return self._db.execute('DELETE FROM submissions WHERE created<?', (time.time() - self.ttl,)).rowcount
+
+
+"""Submission indices in this process by filename, see get_index()."""
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def get_index(cfg: dict) -> SubmissionIndex:
+    """Returns the process-wide submission index for the given SALT facility settings.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'], with the filename of the database in 'dedup' and
+            the time in seconds for which blocks count as duplicates in 'dedup_ttl'.
+
+    Returns:
+        Submission index.
+    """
+    filename = cfg['dedup']
+    with _indices_lock:
+        if filename not in _indices:
+            _indices[filename] = SubmissionIndex(filename, ttl=cfg.get('dedup_ttl', 86400.))
+        return _indices[filename]
+
+
+__all__ = ['VOLATILE_PATHS', 'VOLATILE_TAGS', 'canonical_hash', 'SubmissionIndex', 'get_index']
@@ -1,43 +1,76 @@
-import base64
-import io
-
+import logging
 import os
-import random
-import string
-import time
+import tempfile
 import uuid
 import zipfile
 from datetime import datetime
-import requests
-import xmltodict
 import typing
-from astropy.coordinates import SkyCoord
-import astropy.units as u
-from astropy.time import Time, TimeDelta
+from xml.etree import ElementTree as ET
+import requests
 from django import forms
+from django.conf import settings
 from tom_observations.facility import GenericObservationForm, GenericObservationFacility
-from tom_targets.models import Target
 
-from mastertom import settings
-from saltofi.xml import Block
+from saltofi import sites
+from saltofi.dedup import canonical_hash, get_index
+from saltofi.metrics import get_metrics
+from saltofi.multipart import MultipartEncoder
+from saltofi.outbox import Outbox, OutboxWorkers, get_outbox
+from saltofi.portal import get_session, submission_params, parse_submission_response, status_params, \
+    parse_status_response, StatusCache, SubmissionResult
+from saltofi.xml import Block, Target, renderers
+from saltofi.xml.element import Element
+
+# astropy is expensive to import, so it is only imported when times are actually used
+if typing.TYPE_CHECKING:
+    from astropy.time import Time
+    import numpy as np
+
+
+log = logging.getLogger(__name__)
+
+
+class SubmissionError(ValueError):
+    """Error raised when the SALT server rejects a block."""
+
+    def __init__(self, message: str, index: int, block_code: str, submitted: typing.List[str]):
+        """Creates a new submission error.
+
+        Args:
+            message: Error message from server.
+            index: Index of failed block in list of submitted payloads.
+            block_code: Code of failed block.
+            submitted: Codes of blocks that have been submitted successfully before the error occurred.
+        """
+        ValueError.__init__(self, 'Block %s: %s' % (block_code, message))
+        self.message = message
+        self.index = index
+        self.block_code = block_code
+        self.submitted = submitted
+
+        # codes of blocks, whose request failed without an answer from the server, see SaltFacility._send_observations
+        self.unconfirmed = []
 
 
 class SaltFacilityBaseForm(GenericObservationForm):
     """Base form for all SALT observations."""
     exposure_time = forms.IntegerField(initial=1500)
 
+    """Path to block templates."""
+    TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templates')
+
     def __init__(self, *args, **kwargs):
         GenericObservationForm.__init__(self, *args, **kwargs)
 
         # get template path
-        self.tpl_path = os.path.join(os.path.dirname(__file__), 'templates')
+        self.tpl_path = SaltFacilityBaseForm.TEMPLATE_PATH
 
     @staticmethod
-    def _set_current_semester(block: Block):
-        """Updated the given block with the current semester.
+    def _current_semester() -> typing.Tuple[int, int]:
+        """Returns the current semester.
 
-        Args:
-            block: The block to update.
+        Returns:
+            Year and semester.
         """
 
         # get today
@@ -45,15 +78,32 @@ class SaltFacilityBaseForm(GenericObservationForm):
 
         # decide on year and semester
         if 5 <= now.month <= 10:
-            semester = 1
-            year = now.year
+            return now.year, 1
         else:
-            semester = 2
-            year = now.year if now.month > 10 else now.year - 1
+            return now.year if now.month > 10 else now.year - 1, 2
 
-        # set it
-        block.year = year
-        block.semester = semester
+    @staticmethod
+    def _set_current_semester(block: Block):
+        """Updated the given block with the current semester.
+
+        Args:
+            block: The block to update.
+        """
+        block.year, block.semester = SaltFacilityBaseForm._current_semester()
+
+    @staticmethod
+    def _expiry_date(hours: float) -> 'Time':
+        """Returns an expiry date in the given number of hours.
+
+        Args:
+            hours: Number of hours in the future for the expiry date.
+
+        Returns:
+            Expiry date.
+        """
+        from astropy.time import Time, TimeDelta
+        import astropy.units as u
+        return Time.now() + TimeDelta(hours * u.hour)
 
     @staticmethod
     def _set_expiry_date(block: Block, hours: float):
@@ -63,52 +113,158 @@ class SaltFacilityBaseForm(GenericObservationForm):
             block: The block to update.
             hours: Number of hours in the future for the expiry date.
         """
-
-        # calculate expiry date
-        expires = Time.now() + TimeDelta(hours * u.hour)
-
-        # set it
-        block.expiry_date = expires
+        block.expiry_date = SaltFacilityBaseForm._expiry_date(hours)
 
 
 class SaltFacilityGrbForm(SaltFacilityBaseForm):
     """Form for following up GRBs, based on template grb.xml"""
 
+    def clean(self):
+        """Rejects targets that cannot be observed with SALT within the next 24 hours, if the 'observability' setting
+        is 'reject'."""
+        cleaned_data = SaltFacilityBaseForm.clean(self)
+        if settings.FACILITIES['SALT'].get('observability') == 'reject' and 'target_id' in cleaned_data:
+            from tom_targets.models import Target as TomTarget
+            target = TomTarget.objects.get(pk=cleaned_data['target_id'])
+            if not self._check_observability([target.ra], [target.dec], 24)[0]:
+                raise forms.ValidationError('Target %s cannot be observed with SALT within the next 24 hours.'
+                                            % target.name)
+        return cleaned_data
+
+    @classmethod
+    def _check_observability(cls, ra: typing.List[float], dec: typing.List[float], hours: float) -> 'np.ndarray':
+        """Checks which targets can be observed with SALT within the given time, while meeting the lunar constraints
+        of the template.
+
+        Args:
+            ra: Right ascensions in degrees.
+            dec: Declinations in degrees.
+            hours: Length of time range from now in hours.
+
+        Returns:
+            Boolean array for all targets.
+        """
+        from saltofi.moon import schedulable
+        from saltofi.observability import julian_date
+
+        # lunar constraints from template
+        defaults = renderers.get(os.path.join(cls.TEMPLATE_PATH, 'grb.xml')).defaults
+        max_phase, min_distance = (defaults.get((name, None)) for name in ('max_lunar_phase', 'min_lunar_distance'))
+
+        # check annulus, dark time and moon
+        start = julian_date()
+        return schedulable(ra, dec, float(max_phase) if max_phase else None,
+                           float(min_distance) if min_distance else None, start, start + hours / 24.)
+
     def observation_payload(self):
         """This method is called to extract the data from the form into a dictionary that can be used by the rest
         of the module, which also contains the created XML for the block.
         """
+        from tom_targets.models import Target as TomTarget
 
-        # get target
-        target = Target.objects.get(pk=self.cleaned_data['target_id'])
+        # get target and create payload for it
+        target = TomTarget.objects.get(pk=self.cleaned_data['target_id'])
+        return self.create_payload(target)
 
-        # load block template
-        block = Block(os.path.join(self.tpl_path, 'grb.xml'))
+    @classmethod
+    def create_payload(cls, target) -> dict:
+        """Creates the payload with the block for a GRB follow-up of the given target.
 
-        # set code and comment
-        block.code = str(uuid.uuid4())
-        block.name = target.name + ' ' + Time.now().isot
-        block.comment = target.name
+        Args:
+            target: Target to observe, usually a TOM Target, but anything with id, name, ra and dec (in degrees).
 
-        # update semester and set expiry date
-        self._set_current_semester(block)
-        self._set_expiry_date(block, 24)
+        Returns:
+            Dictionary with 'target_id', 'block_code' and the 'xml' of the block, and whether the target is
+            'observable', see create_payloads().
+        """
+        return cls.create_payloads([target])[0]
 
-        # set target
-        block.targets[0].name = target.name
-        block.targets[0].code = str(uuid.uuid4())
-        block.targets[0].coordinates = SkyCoord(ra=target.ra * u.deg, dec=target.dec * u.deg, frame='icrs')
-        block.targets[0].mag_filter = 'V'
-        # block.targets[0].mag_min = event.magnitude
-        # block.targets[0].mag_max = event.magnitude
-        block.targets[0].finding_charts = ['auto-generated']
+    @classmethod
+    def create_payloads(cls, targets: typing.Union[typing.Iterable[typing.Any], typing.List[int]]) \
+            -> typing.List[dict]:
+        """Creates the payloads with the blocks for GRB follow-ups of many targets at once.
 
-        # return dictionary
-        return {
-            'target_id': target.id,
-            'block_code': block.code,
-            'xml': block.to_string()
-        }
+        The targets are fetched with a single query, their coordinates are converted all at once, and the blocks are
+        rendered from the compiled template, see saltofi.xml.renderer. Each block and target gets a new unique code.
+        The result can be passed to SaltFacility.submit_observations(), which sends the blocks in as few requests as
+        possible.
+
+        Whether the targets can be observed with SALT before the blocks expire, meeting the lunar constraints of the
+        template, is checked for all of them at once, see saltofi.observability and saltofi.moon. Depending on the
+        'observability' setting, the result is stored as 'observable' in the payloads ('flag'), unobservable targets
+        are rejected ('reject'), or nothing is checked (None, the default).
+
+        Args:
+            targets: QuerySet of TOM Targets, list of their IDs, or list of objects with id, name, ra and dec (in
+                degrees).
+
+        Returns:
+            List of payloads as returned by create_payload(), in the same order as the targets.
+
+        Raises:
+            ValueError: If a target ID does not exist, or if a target is not observable and unobservable targets are
+                rejected.
+        """
+        from astropy.coordinates import SkyCoord
+        import astropy.units as u
+        from astropy.time import Time
+        from django.db.models import QuerySet
+        cfg = settings.FACILITIES['SALT']
+        metrics = get_metrics(cfg)
+
+        # fetch targets
+        with metrics.timer('query'):
+            if isinstance(targets, QuerySet):
+                targets = list(targets.only('id', 'name', 'ra', 'dec'))
+            else:
+                targets = list(targets)
+                ids = [t for t in targets if not hasattr(t, 'ra')]
+                if ids:
+                    # only import model when needed, so that plain objects work without TOM's apps
+                    from tom_targets.models import Target as TomTarget
+                    found = {t.pk: t for t in TomTarget.objects.filter(pk__in=ids).only('id', 'name', 'ra', 'dec')}
+                    missing = [i for i in ids if i not in found]
+                    if missing:
+                        raise ValueError('Unknown targets: %s' % ', '.join(str(i) for i in missing))
+                    targets = [t if hasattr(t, 'ra') else found[t] for t in targets]
+        if not targets:
+            return []
+
+        # convert all coordinates
+        with metrics.timer('coordinates'):
+            coords = Target.format_coordinates(SkyCoord(ra=[t.ra for t in targets] * u.deg,
+                                                        dec=[t.dec for t in targets] * u.deg, frame='icrs'))
+
+        # check observability until expiry
+        check = cfg.get('observability')
+        if check:
+            with metrics.timer('observability'):
+                flags = cls._check_observability([t.ra for t in targets], [t.dec for t in targets], 24)
+            if check == 'reject' and not flags.all():
+                raise ValueError('Targets not observable with SALT within the next 24 hours: %s' %
+                                 ', '.join(t.name for t, f in zip(targets, flags) if not f))
+
+        # values shared by all blocks
+        renderer = renderers.get(os.path.join(cls.TEMPLATE_PATH, 'grb.xml'))
+        now = Time.now().isot
+        year, semester = cls._current_semester()
+        expiry_date = cls._expiry_date(24).isot
+
+        # render blocks
+        payloads = []
+        with metrics.timer('render'):
+            for i, (target, coord) in enumerate(zip(targets, coords)):
+                code = str(uuid.uuid4())
+                xml = renderer.render(
+                    {'code': code, 'name': target.name + ' ' + now, 'comment': target.name, 'year': year,
+                     'semester': semester, 'expiry_date': expiry_date},
+                    [{'name': target.name, 'code': str(uuid.uuid4()), 'coordinates': coord, 'mag_filter': 'V',
+                      'finding_charts': ['auto-generated']}])
+                payloads.append({'target_id': target.id, 'block_code': code, 'xml': xml})
+                if check:
+                    payloads[-1]['observable'] = bool(flags[i])
+        metrics.count_bytes('render', sum(len(p['xml']) for p in payloads))
+        return payloads
 
 
 class SaltFacility(GenericObservationFacility):
@@ -117,11 +273,7 @@ class SaltFacility(GenericObservationFacility):
     observation_types = [('GRB', 'GRB Follow-Up')]
 
     SITES = {
-        'SALT': {
-            'latitude': -32.376006,
-            'longitude': 20.810678,
-            'elevation': 1783
-        }
+        'SALT': sites.SALT
     }
 
     def data_products(self, observation_id, product_id=None):
@@ -136,8 +288,127 @@ class SaltFacility(GenericObservationFacility):
             # by default, always show the GRB form
             return SaltFacilityGrbForm
 
+    """Mapping of SALT block statuses to observation states."""
+    BLOCK_STATES = {
+        'Active': 'IN_PROGRESS',
+        'On Hold': 'ON_HOLD',
+        'Completed': 'COMPLETED',
+        'Expired': 'EXPIRED',
+        'Superseded': 'CANCELED',
+        'Deleted': 'CANCELED',
+    }
+
+    """Cache for block statuses from the portal."""
+    status_cache = StatusCache()
+
     def get_observation_status(self, observation_id):
-        return ['IN_PROGRESS']
+        """Returns the status of an observation.
+
+        If the 'status_method' setting names a portal method for querying block statuses, statuses are fetched from
+        the portal and cached for 'status_ttl' seconds (default: 300), see update_all_observation_statuses() for
+        fetching statuses for many observations at once. Otherwise, or if the query fails, the observation is reported
+        as IN_PROGRESS.
+
+        If an outbox is used, blocks that have not been sent yet are reported as PENDING and blocks that were
+        rejected by the server as FAILED. In both cases, the status contains an additional entry 'outbox' with the
+        'state', number of 'attempts', 'age' and last 'error' of the block as well as 'queue_depth', 'queue_oldest_age',
+        'queue_retries' and 'queue_failed' of the whole outbox.
+
+        Args:
+            observation_id: Block code.
+
+        Returns:
+            Dictionary with 'state', 'scheduled_start' and 'scheduled_end'.
+        """
+        status = {'state': 'IN_PROGRESS', 'scheduled_start': None, 'scheduled_end': None}
+
+        # still in outbox?
+        cfg = settings.FACILITIES['SALT']
+        if cfg.get('outbox'):
+            outbox, _ = SaltFacility._get_outbox(cfg)
+            entry = outbox.status(observation_id)
+            if entry is not None and entry['state'] != 'done':
+                status['state'] = 'FAILED' if entry['state'] == 'failed' else 'PENDING'
+                status['outbox'] = dict(entry, **{'queue_' + k: v for k, v in outbox.stats().items()})
+                return status
+
+        # get status from portal
+        block_status = self.get_block_statuses([observation_id]).get(observation_id)
+        status['state'] = SaltFacility.BLOCK_STATES.get(block_status, 'IN_PROGRESS')
+        return status
+
+    def get_block_statuses(self, block_codes: typing.List[str]) -> typing.Dict[str, typing.Union[str, None]]:
+        """Returns the SALT statuses of the given blocks.
+
+        Statuses are only queried, if the 'status_method' setting names the portal method for it, see
+        saltofi.portal.status_params(). They are cached for 'status_ttl' seconds (default: 300). All missing statuses
+        are fetched from the portal with as few requests as possible, each for at most 'status_batch_size' blocks
+        (default: 200).
+
+        Args:
+            block_codes: Codes of blocks.
+
+        Returns:
+            Dictionary mapping block codes to their SALT status, or None, if the portal does not know the block, no
+            method is configured or the query failed.
+        """
+        cfg = settings.FACILITIES['SALT']
+        batch_size = cfg.get('status_batch_size', 200)
+        if not cfg.get('status_method'):
+            return {code: None for code in block_codes}
+
+        def fetch(codes: typing.List[str]) -> typing.Dict[str, str]:
+            statuses = {}
+            for i in range(0, len(codes), batch_size):
+                content_type, body = self._encode_multipart_formdata(status_params(cfg, codes[i:i + batch_size]), [])
+                headers = {"Content-Type": content_type, 'content-length': str(len(body))}
+                response = get_session(cfg).post(body, headers=headers)
+                statuses.update(parse_status_response(response.content))
+            return statuses
+
+        try:
+            return SaltFacility.status_cache.get(block_codes, fetch, cfg.get('status_ttl', 300.))
+        except (ValueError, ET.ParseError, requests.RequestException) as e:
+            log.warning('Could not query status of %d blocks: %s', len(block_codes), e)
+            return {code: None for code in block_codes}
+
+    def update_all_observation_statuses(self, target=None):
+        """Updates the statuses of all unfinished observations at SALT with as few requests to the portal as possible.
+
+        All statuses are fetched at once first, see get_block_statuses(). Only records whose state changed are then
+        updated via update_observation_status(), which saves them and runs the 'observation_change_state' hook, but
+        only hits the status cache.
+
+        Args:
+            target: If given, only update observations for this target.
+
+        Returns:
+            List of (observation_id, error) tuples for observations that could not be updated.
+        """
+        from tom_observations.models import ObservationRecord
+
+        # get all unfinished records
+        records = ObservationRecord.objects.filter(facility=self.name) \
+            .exclude(status__in=self.get_terminal_observing_states())
+        if target is not None:
+            records = records.filter(target=target)
+        records = list(records.only('id', 'observation_id', 'status'))
+
+        # fetch all statuses at once, failed queries are logged and reported as IN_PROGRESS
+        self.get_block_statuses([r.observation_id for r in records])
+
+        # update changed records one by one
+        failed = []
+        for r in records:
+            if self.get_observation_status(r.observation_id)['state'] == r.status:
+                continue
+            try:
+                self.update_observation_status(r.observation_id)
+            except Exception as e:
+                # like the base class, report failed records, e.g. if saving or the hook failed
+                log.exception('Could not update status of observation %s.', r.observation_id)
+                failed.append((r.observation_id, str(e)))
+        return failed
 
     def get_observation_url(self, observation_id):
         return ''
@@ -146,7 +417,7 @@ class SaltFacility(GenericObservationFacility):
         return SaltFacility.SITES
 
     def get_terminal_observing_states(self):
-        return ['IN_PROGRESS', 'COMPLETED']
+        return ['COMPLETED', 'EXPIRED', 'CANCELED', 'FAILED']
 
     def submit_observation(self, observation_payload: dict):
         """Submit an observation to SALT.
@@ -157,139 +428,475 @@ class SaltFacility(GenericObservationFacility):
         Returns:
             Block code for submitted block.
         """
+        return self.submit_observations([observation_payload])
 
-        # get XML
-        xml = observation_payload['xml']
+    def submit_observations(self, observation_payloads: typing.List[dict]) -> typing.List[str]:
+        """Submit many observations to SALT in as few requests as possible.
 
-        # create proposal ZIP from block
-        zip_file = self._create_zip_from_xml(xml)
+        If the 'outbox' setting contains the filename of an SQLite database, the blocks are only stored in that
+        outbox and sent by background workers, see saltofi.outbox. Otherwise they are sent immediately.
 
-        # send proposal
-        self._submit_block(zip_file)
+        If the 'dedup' setting contains the filename of an SQLite database, blocks that only differ in volatile fields
+        like their codes, name and expiry date from a block submitted within the last 'dedup_ttl' seconds (default:
+        one day) are not submitted again, and the code of the earlier block is returned instead, see saltofi.dedup.
+        Blocks that fail, either immediately or later in the outbox, do not count as submitted, unless their request
+        failed without an answer from the server, e.g. after a timeout, since they might have reached SALT.
 
-        # return code
-        return [observation_payload['block_code']]
+        Args:
+            observation_payloads: List of payloads from form.
+
+        Returns:
+            Block codes for submitted blocks in same order as payloads.
+
+        Raises:
+            SubmissionError: If submission of a block failed.
+            ValueError: If the server returned an error that is not caused by a block.
+        """
+        cfg = settings.FACILITIES['SALT']
+        if not cfg.get('dedup'):
+            return self._submit_observations(cfg, observation_payloads)
+
+        # claim hashes of all blocks, duplicates get the code of the earlier block
+        index = get_index(cfg)
+        codes, claimed = [], []
+        for i, payload in enumerate(observation_payloads):
+            block_hash = canonical_hash(payload['xml'])
+            existing = index.claim(block_hash, payload['block_code'])
+            codes.append(existing or payload['block_code'])
+            if existing is None:
+                claimed.append((i, block_hash))
+        if not claimed:
+            return codes
+
+        # submit new blocks and release the claims of all blocks that have never been sent in case of failure, with
+        # concurrent requests, these can be before and after the failed one, see _send_observations()
+        try:
+            self._submit_observations(cfg, [observation_payloads[i] for i, _ in claimed])
+        except BaseException as e:
+            sent = set(getattr(e, 'submitted', [])) | set(getattr(e, 'unconfirmed', []))
+            for i, block_hash in claimed:
+                if observation_payloads[i]['block_code'] not in sent:
+                    index.release(block_hash, observation_payloads[i]['block_code'])
+            if isinstance(e, SubmissionError):
+                error = SubmissionError(e.message, claimed[e.index][0], e.block_code, e.submitted)
+                error.unconfirmed = e.unconfirmed
+                raise error from e
+            raise
+        return codes
+
+    def _submit_observations(self, cfg: dict, observation_payloads: typing.List[dict]) -> typing.List[str]:
+        """Submit many observations via the outbox or immediately, see submit_observations().
+
+        Args:
+            cfg: Settings for SALT facility.
+            observation_payloads: List of payloads from form.
+
+        Returns:
+            Block codes for submitted blocks in same order as payloads.
+        """
+
+        # use outbox?
+        if cfg.get('outbox'):
+            outbox, workers = SaltFacility._get_outbox(cfg)
+            for payload in observation_payloads:
+                outbox.put(payload['block_code'], payload['xml'])
+            workers.wake()
+            return [payload['block_code'] for payload in observation_payloads]
+
+        # send now
+        with get_metrics(cfg).timer('submit'):
+            return self._send_observations(observation_payloads)
 
     @staticmethod
-    def _create_zip_from_xml(xml: str) -> bytes:
-        """Create a ZIP file in memory containing the given block XML.
+    def _get_outbox(cfg: dict) -> typing.Tuple[Outbox, OutboxWorkers]:
+        """Returns the outbox for the given settings and its workers, which are started on first call.
 
         Args:
-            xml: The XML for the block.
+            cfg: Settings for SALT facility.
 
         Returns:
-            The ZIP file as bytes array.
+            Outbox and its workers, see saltofi.outbox.get_outbox().
         """
+        return get_outbox(cfg, SaltFacility._send_from_outbox, failed=SaltFacility._release_from_outbox)
 
-        # create zip file in memory
-        with io.BytesIO() as bio:
-            # new ZIP file
-            with zipfile.ZipFile(bio, mode='w') as zip:
-                # write block XML
-                zip.writestr('Block.xml', xml)
+    @staticmethod
+    def _send_from_outbox(observation_payloads: typing.List[dict]):
+        """Send observations claimed from the outbox.
+
+        Args:
+            observation_payloads: List of payloads.
+        """
+        SaltFacility()._send_observations(observation_payloads)
+
+    @staticmethod
+    def _release_from_outbox(observation_payloads: typing.List[dict]):
+        """Release the claims of blocks that failed in the outbox, so that they are not reported as duplicates of
+        blocks that never reached SALT, see submit_observations().
+
+        Args:
+            observation_payloads: List of payloads of failed blocks.
+        """
+        cfg = settings.FACILITIES['SALT']
+        if cfg.get('dedup'):
+            index = get_index(cfg)
+            for payload in observation_payloads:
+                index.release(canonical_hash(payload['xml']), payload['block_code'])
 
-            # return ZIP file in memory
-            return bio.getvalue()
+    def _send_observations(self, observation_payloads: typing.List[dict]) -> typing.List[str]:
+        """Send observations to SALT.
+
+        The blocks are packed into ZIP files, which are limited in size by the 'max_archive_size' setting (in bytes,
+        defaults to 10MB), and each ZIP file is sent in a single request.
+
+        Whatever the error, the raised exception has the attributes 'submitted' with the codes of all blocks that
+        have been submitted successfully before, and 'unconfirmed' with the codes of all blocks whose request failed
+        without an answer from the server, e.g. after a timeout, so that they might have reached SALT.
+
+        Args:
+            observation_payloads: List of payloads from form.
+
+        Returns:
+            Block codes for submitted blocks in same order as payloads.
+
+        Raises:
+            SubmissionError: If submission of a block failed.
+            ValueError: If the server returned an error that is not caused by a block.
+        """
+
+        # get config
+        cfg = settings.FACILITIES['SALT']
+        max_size = cfg.get('max_archive_size', 10 * 1024 * 1024)
+
+        # split payloads into batches
+        batches, batch, size = [], [], 0
+        for i, payload in enumerate(observation_payloads):
+            # would this block exceed the limit?
+            length = len(payload['xml'])
+            if batch and size + length > max_size:
+                batches.append(batch)
+                batch, size = [], 0
+
+            # add it
+            batch.append(i)
+            size += length
+        if batch:
+            batches.append(batch)
+
+        # submit all batches, concurrently if configured
+        submitted = []
+        try:
+            if cfg.get('concurrency', 1) > 1 and len(batches) > 1:
+                self._submit_batches_async(cfg, observation_payloads, batches, submitted)
+            else:
+                for batch in batches:
+                    self._submit_batch(observation_payloads, batch, submitted)
+        except BaseException as e:
+            if not isinstance(e, SubmissionError):
+                e.submitted = submitted
+                e.unconfirmed = getattr(e, 'unconfirmed', [])
+            raise
+
+        # return codes
+        return [payload['block_code'] for payload in observation_payloads]
+
+    def _submit_batch(self, payloads: typing.List[dict], indices: typing.List[int], submitted: typing.List[str],
+                      error: ValueError = None):
+        """Submit the given payloads in a single request and find the failing block on error.
+
+        Since a rejected request does not change anything on the server, a failed batch is split in half and both
+        halves are submitted again, unless the error message names the failing block directly. If both halves fail
+        with the same error as the whole batch, a single block from each half is submitted. If those fail in the same
+        way, too, the error is not caused by a block, e.g. wrong credentials or an unknown proposal, and it is raised
+        unchanged. Otherwise failed halves are split further until the failing block is found.
+
+        Args:
+            payloads: List of all payloads.
+            indices: Indices of payloads to submit.
+            submitted: List of already submitted block codes, will be extended.
+            error: Error of a previous attempt to submit the whole batch, which is then not submitted again.
+
+        Raises:
+            SubmissionError: If submission of a block failed.
+            ValueError: If the server returned an error that is not caused by a block.
+        """
+
+        # submit whole batch, unless it has failed before
+        if error is None:
+            error = self._try_submit_batch(payloads, indices, submitted)
+            if error is None:
+                return
+        else:
+            SaltFacility._raise_for_named_block(payloads, indices, error, submitted)
+
+        # a single block always caused the error itself
+        if len(indices) == 1:
+            self._find_failing_block(payloads, indices, error, submitted)
+
+        # submit both halves
+        half = len(indices) // 2
+        halves = [indices[:half], indices[half:]]
+        errors = [self._try_submit_batch(payloads, h, submitted) for h in halves]
+
+        # if both fail like the whole batch, the error might not be caused by a block, but there might also be bad
+        # blocks in both halves, so submit a single block from each half
+        if all(e is not None and str(e) == str(error) for e in errors):
+            probes = [h[0] for h in halves]
+            probe_errors = [e if len(h) == 1 else self._try_submit_batch(payloads, h[:1], submitted)
+                            for h, e in zip(halves, errors)]
+            if all(e is not None and str(e) == str(error) for e in probe_errors):
+                raise error
+
+            # a failed probe is a bad block, otherwise go on without the submitted probes
+            for i, e in zip(probes, probe_errors):
+                if e is not None:
+                    self._find_failing_block(payloads, [i], e, submitted)
+            halves = [h[1:] for h in halves]
+
+        # find failing block in failed halves
+        for h, e in zip(halves, errors):
+            if e is not None and h:
+                self._find_failing_block(payloads, h, e, submitted)
+
+    def _find_failing_block(self, payloads: typing.List[dict], indices: typing.List[int], error: ValueError,
+                            submitted: typing.List[str]):
+        """Find the block that caused the error of a batch by splitting it in half until only one block is left.
+
+        Args:
+            payloads: List of all payloads.
+            indices: Indices of payloads in failed batch.
+            error: Error of batch.
+            submitted: List of already submitted block codes, will be extended.
+
+        Raises:
+            SubmissionError: If submission of a block failed.
+        """
+        if len(indices) == 1:
+            raise SubmissionError(str(error), indices[0], payloads[indices[0]]['block_code'], submitted)
+
+        # submit both halves and go on with the first failing one
+        half = len(indices) // 2
+        for h in (indices[:half], indices[half:]):
+            e = self._try_submit_batch(payloads, h, submitted)
+            if e is not None:
+                self._find_failing_block(payloads, h, e, submitted)
+
+    def _try_submit_batch(self, payloads: typing.List[dict], indices: typing.List[int],
+                          submitted: typing.List[str]) -> typing.Union[ValueError, None]:
+        """Submit the given payloads in a single request.
+
+        Args:
+            payloads: List of all payloads.
+            indices: Indices of payloads to submit.
+            submitted: List of already submitted block codes, will be extended on success.
+
+        Returns:
+            None on success, otherwise the error returned by the server.
+
+        Raises:
+            SubmissionError: If the error message names a block.
+            Exception: Any other error, e.g. a timeout, with the block codes in its 'unconfirmed' attribute.
+        """
+
+        # create proposal ZIP from blocks and send it
+        try:
+            with self._create_zip_from_xml([payloads[i]['xml'] for i in indices]) as zip_file:
+                try:
+                    self._submit_block(zip_file)
+                except Exception as e:
+                    # without an answer from the server, the blocks might have reached SALT
+                    if not isinstance(e, ValueError):
+                        e.unconfirmed = [payloads[i]['block_code'] for i in indices]
+                    raise
+        except ValueError as e:
+            SaltFacility._raise_for_named_block(payloads, indices, e, submitted)
+            return e
+
+        # success
+        submitted.extend([payloads[i]['block_code'] for i in indices])
+        return None
+
+    @staticmethod
+    def _raise_for_named_block(payloads: typing.List[dict], indices: typing.List[int], error: ValueError,
+                               submitted: typing.List[str]):
+        """Raise a SubmissionError, if the error message of a batch names one of its blocks.
+
+        Args:
+            payloads: List of all payloads.
+            indices: Indices of payloads in failed batch.
+            error: Error of batch.
+            submitted: List of already submitted block codes.
+
+        Raises:
+            SubmissionError: If the error message names a block.
+        """
+        message = str(error)
+        named = next((i for i in indices if payloads[i]['block_code'] in message), None)
+        if named is not None:
+            raise SubmissionError(message, named, payloads[named]['block_code'], submitted)
+
+    def _submit_batches_async(self, cfg: dict, payloads: typing.List[dict], batches: typing.List[typing.List[int]],
+                              submitted: typing.List[str]):
+        """Submit the given batches concurrently using the asyncio client.
+
+        Batches rejected by the server are handed to _submit_batch() afterwards to find the failing block, without
+        submitting them again as a whole.
+
+        Args:
+            cfg: Settings for SALT facility.
+            payloads: List of all payloads.
+            batches: List of batches, each a list of indices of payloads.
+            submitted: List of already submitted block codes, will be extended.
+
+        Raises:
+            SubmissionError: If submission of a block failed.
+            ValueError: If the server returned an error that is not caused by a block.
+        """
+        from saltofi.aioportal import AsyncPortalClient, run_sync
+
+        # create all ZIP files
+        zip_files = [self._create_zip_from_xml([payloads[i]['xml'] for i in batch]) for batch in batches]
+
+        # submit them
+        async def submit():
+            async with AsyncPortalClient.from_config(cfg) as client:
+                return await client.submit_many(zip_files)
+        try:
+            results = run_sync(submit())
+        finally:
+            for zip_file in zip_files:
+                zip_file.close()
+
+        # add successful batches first, so that an error reports all of them as submitted
+        for batch, result in zip(batches, results):
+            if isinstance(result, SubmissionResult):
+                submitted.extend([payloads[i]['block_code'] for i in batch])
+
+        # requests without an answer from the server, e.g. after a timeout, might have reached SALT
+        failed = [result for result in results if not isinstance(result, (SubmissionResult, ValueError))]
+        unconfirmed = [payloads[i]['block_code'] for batch, result in zip(batches, results) if result in failed
+                       for i in batch]
+
+        # find failing blocks in rejected batches, then raise the first other error
+        try:
+            for batch, result in zip(batches, results):
+                if isinstance(result, ValueError):
+                    self._submit_batch(payloads, batch, submitted, error=result)
+        except BaseException as e:
+            e.unconfirmed = getattr(e, 'unconfirmed', []) + unconfirmed
+            raise
+        if failed:
+            failed[0].unconfirmed = unconfirmed
+            raise failed[0]
+
+    @staticmethod
+    def _create_zip_from_xml(xml: typing.Union[str, bytes, Element, typing.List[typing.Union[str, bytes, Element]]]) \
+            -> typing.IO[bytes]:
+        """Create a ZIP file containing the given block XML.
+
+        Elements are serialized directly into the ZIP file, which itself is written into a temporary file that is
+        kept in memory up to 'zip_spool_size' bytes (default: 1MB) and moved to disk beyond that. It can be passed
+        directly to _submit_block() and must be closed afterwards.
+
+        Compression is configured with 'zip_compression', which can be 'stored' (default), 'deflated' or 'auto'.
+        The latter only compresses, if the total size of the XMLs exceeds 'zip_deflate_threshold' bytes (default:
+        64kB), Elements always count as large. The level for compression is given by 'zip_compresslevel' (default: 6).
+
+        Args:
+            xml: The XML for the block or a list of XMLs for several blocks.
+
+        Returns:
+            The ZIP file as file-like object, rewound to the beginning.
+        """
+        cfg = settings.FACILITIES['SALT']
+
+        # name files in ZIP
+        if isinstance(xml, list):
+            files = [('Block.xml' if len(xml) == 1 else 'Block%d.xml' % i, x) for i, x in enumerate(xml)]
+        else:
+            files = [('Block.xml', xml)]
+
+        # choose compression
+        compression = cfg.get('zip_compression', 'stored')
+        if compression == 'auto':
+            large = any(isinstance(x, Element) for _, x in files) or \
+                sum(len(x) for _, x in files) > cfg.get('zip_deflate_threshold', 64 * 1024)
+            compression = 'deflated' if large else 'stored'
+        compression = zipfile.ZIP_DEFLATED if compression == 'deflated' else zipfile.ZIP_STORED
+
+        # create zip file in temporary file
+        metrics = get_metrics(cfg)
+        spool = tempfile.SpooledTemporaryFile(max_size=cfg.get('zip_spool_size', 1024 * 1024))
+        with metrics.timer('zip'):
+            with zipfile.ZipFile(spool, mode='w', compression=compression,
+                                 compresslevel=cfg.get('zip_compresslevel', 6)) as zip:
+                # write block XMLs
+                for filename, x in files:
+                    if isinstance(x, Element):
+                        x.write_to_zip(zip, filename)
+                    else:
+                        zip.writestr(filename, x)
+        metrics.count_bytes('zip', spool.tell())
+
+        # return ZIP file
+        spool.seek(0)
+        return spool
 
     def validate_observation(self, observation_payload):
         pass
 
-    def _submit_block(self, zip_file: bytes):
+    def _submit_block(self, zip_file: typing.Union[bytes, typing.IO[bytes]]) -> SubmissionResult:
         """Submit a block to the SALT server.
 
         Args:
-            zip_file: Bytes array containing ZIP file with proposal.
+            zip_file: Bytes array or file-like object containing ZIP file with proposal.
+
+        Returns:
+            Result of submission.
+
+        Raises:
+            ValueError: If server returned an error.
         """
 
         # get config
         cfg = settings.FACILITIES['SALT']
+        metrics = get_metrics(cfg)
 
         # define parameters
-        params = {
-            'username': base64.b64encode(bytes(cfg['username'], 'utf-8')).decode('utf-8'),
-            'password': base64.b64encode(bytes(cfg['password'], 'utf-8')).decode('utf-8'),
-            'method': 'sendProposal',
-            'asyncCode': '',
-            'proposalCode': cfg['proposal_code'],
-            'emails': 'false',
-            'retainProposalStatus': 'false',
-            'semester': '2017-2',
-            'noValidation': 'false',
-            'blocksOnly': 'true'
-        }
+        params = submission_params(cfg)
 
         # encode body manually, since for whatever reason I cannot get requests
         # to encode the body in the correct form...
-        content_type, body = self._encode_multipart_formdata(params, [zip_file])
+        with metrics.timer('multipart'):
+            content_type, body = self._encode_multipart_formdata(params, [zip_file])
         headers = {"Content-Type": content_type, 'content-length': str(len(body))}
+        metrics.count_bytes('multipart', len(body))
 
-        # do actual request
-        response = requests.post(cfg['portal_url'], data=body, headers=headers)
+        # do actual request, which includes sending the body, and parse response while streaming it
+        with metrics.timer('http'):
+            response = get_session(cfg).post(body, headers=headers, stream=True)
+        try:
+            with metrics.timer('response'):
+                result = parse_submission_response(metrics.count_chunks('response', response.iter_content(64 * 1024)))
+        finally:
+            response.close()
 
-        # parse response and check for error
-        res = xmltodict.parse(response.content)
-        if 'Error' in res:
-            raise ValueError(res['Error'])
+        # check for error
+        result.raise_for_error()
+        return result
 
     @staticmethod
-    def _encode_multipart_formdata(fields: typing.Dict[str, str], files: list) -> typing.Tuple[str, bytes]:
+    def _encode_multipart_formdata(fields: typing.Dict[str, str], files: list) -> typing.Tuple[str, MultipartEncoder]:
         """Manually creates a Multipart Formdata.
 
         Args:
             fields: HTTP headers.
-            files: Files to add.
+            files: Files to add, each either a filename, a file-like object or bytes.
 
         Returns:
-            Content type and actual body.
+            Content type and actual body as a streaming file-like object with known length.
         """
-
-        # define some strings
-        boundary = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(16))
-        crlf = '\r\n'
-        body = b''
-
-        # add parameters
-        for key, value in fields.items():
-            if isinstance(value, bool):
-                value = 'true' if value else 'false'
-            body += bytes('--' + boundary + crlf +
-                          'Content-Disposition: form-data; name="%s"' % key + crlf +
-                          'Content-Type: text/plain; charset=US-ASCII' + crlf +
-                          'Content-Transfer-Encoding: 8bit' + crlf +
-                          crlf +
-                          str(value) + crlf, 'ascii')
-
-        # add files
-        for i, file_obj in enumerate(files):
-            # add part header for file
-            key = 'file_' + str(int(time.time())) + '_' + str(i)
-            header = '--' + boundary + crlf + \
-                     'Content-Disposition: form-data; name="%s"; filename="%s"' % (key, file_obj) + crlf + \
-                     'Content-Type: application/zip' + crlf + \
-                     'Content-Transfer-Encoding: binary' + crlf + crlf
-            body += bytes(header, 'ascii')
-
-            # add file itself, filename or file-like object?
-            if isinstance(file_obj, io.IOBase):
-                # file-like, read from it
-                file_obj.seek(0)
-                body += file_obj.read() + bytes(crlf, 'ascii')
-            elif isinstance(file_obj, str):
-                # filename, open and read
-                with open(file_obj, 'rb') as f:
-                    body += f.read() + bytes(crlf, 'ascii')
-            elif isinstance(file_obj, bytes):
-                # just bytes, write them
-                body += file_obj + bytes(crlf, 'ascii')
-            else:
-                raise ValueError('Unknown file type.')
-
-        # final boundary
-        body += bytes('--' + boundary + '--', 'ascii')
-
-        # return it
-        content_type = 'multipart/form-data; boundary=%s' % boundary
-        return content_type, body
+        body = MultipartEncoder(fields, files)
+        return body.content_type, body
 
 
-__all__ = ['SaltFacility', 'SaltFacilityBaseForm', 'SaltFacilityGrbForm']
+__all__ = ['SaltFacility', 'SaltFacilityBaseForm', 'SaltFacilityGrbForm', 'SubmissionError']
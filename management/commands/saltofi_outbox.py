@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Sends the blocks in the outbox of the SALT facility, e.g. blocks left pending by a process that died."""
+
+    help = 'Sends the blocks in the outbox of the SALT facility until interrupted, or with --once until none are due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit as soon as no more blocks are due.')
+
+    def handle(self, *args, **options):
+        from saltofi.facility import SaltFacility
+        from saltofi.outbox import Outbox, OutboxWorkers
+
+        # get outbox
+        cfg = settings.FACILITIES.get('SALT', {})
+        if not cfg.get('outbox'):
+            raise CommandError('No outbox configured for SALT facility.')
+        outbox = Outbox(cfg['outbox'])
+        workers = OutboxWorkers(outbox, SaltFacility._send_from_outbox, threads=cfg.get('outbox_workers', 2),
+                                batch_size=cfg.get('outbox_batch_size', 50),
+                                failed=SaltFacility._release_from_outbox)
+
+        # send all due blocks in this thread
+        if options['once']:
+            count = 0
+            while True:
+                processed = workers.process()
+                if not processed:
+                    break
+                count += processed
+            self.stdout.write('Processed %d blocks, %d left in outbox.' % (count, outbox.stats()['depth']))
+            outbox.close()
+            return
+
+        # run workers until interrupted
+        workers.start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            workers.stop()
+            outbox.close()
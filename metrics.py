@@ -0,0 +1,199 @@
+import bisect
+import threading
+import time
+import typing
+
+
+class _Timer(object):
+    """Context manager measuring the duration of a stage."""
+
+    __slots__ = ['_metrics', '_stage', '_start']
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self._metrics = metrics
+        self._stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._metrics.observe(self._stage, time.perf_counter() - self._start)
+
+
+class _NullTimer(object):
+    """Context manager doing nothing, used when metrics are disabled."""
+
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class Metrics(object):
+    """Durations and byte counts for the stages of building and submitting blocks.
+
+    Durations are collected in histograms and byte counts in counters, both per stage, and can be exported in the
+    Prometheus text format. Use it like this:
+
+        with metrics.timer('zip'):
+            ...
+        metrics.count_bytes('zip', size)
+
+    A disabled instance, see NullMetrics, does nothing, so instrumented code costs only a method call per stage.
+    """
+
+    """Upper bounds of histogram buckets in seconds."""
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+    def __init__(self, prefix: str = 'saltofi'):
+        """Creates a new, empty set of metrics.
+
+        Args:
+            prefix: Prefix for names of exported metrics.
+        """
+        self.prefix = prefix
+        self._durations = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str) -> typing.ContextManager:
+        """Returns a context manager measuring the duration of the given stage.
+
+        Args:
+            stage: Name of stage.
+
+        Returns:
+            Context manager.
+        """
+        return _Timer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        """Add a duration for a stage.
+
+        Args:
+            stage: Name of stage.
+            seconds: Duration in seconds.
+        """
+        with self._lock:
+            # histogram is a list of bucket counts plus an overflow bucket, the sum and the count
+            hist = self._durations.get(stage)
+            if hist is None:
+                hist = self._durations[stage] = [[0] * (len(Metrics.BUCKETS) + 1), 0., 0]
+            hist[0][bisect.bisect_left(Metrics.BUCKETS, seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def count_bytes(self, stage: str, size: int):
+        """Add a number of bytes processed in a stage.
+
+        Args:
+            stage: Name of stage.
+            size: Number of bytes.
+        """
+        with self._lock:
+            self._bytes[stage] = self._bytes.get(stage, 0) + size
+
+    def count_chunks(self, stage: str, chunks: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+        """Count the bytes in the given chunks while they are consumed.
+
+        Args:
+            stage: Name of stage.
+            chunks: Chunks of bytes.
+
+        Returns:
+            Iterator over the same chunks.
+        """
+        for chunk in chunks:
+            self.count_bytes(stage, len(chunk))
+            yield chunk
+
+    def snapshot(self) -> typing.Dict[str, typing.Dict[str, dict]]:
+        """Returns the current values.
+
+        Returns:
+            Dictionary with 'durations', mapping stages to dictionaries with 'count', 'sum' and 'buckets', which are
+            the non-cumulative counts per bucket including the overflow bucket, and 'bytes', mapping stages to counts.
+        """
+        with self._lock:
+            return {
+                'durations': {s: {'buckets': list(h[0]), 'sum': h[1], 'count': h[2]}
+                              for s, h in self._durations.items()},
+                'bytes': dict(self._bytes)
+            }
+
+    def reset(self):
+        """Remove all values."""
+        with self._lock:
+            self._durations.clear()
+            self._bytes.clear()
+
+    def to_prometheus(self) -> str:
+        """Export all values in the Prometheus text format.
+
+        Returns:
+            Metrics as text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        # durations
+        name = self.prefix + '_stage_duration_seconds'
+        lines += ['# HELP %s Duration of stages.' % name, '# TYPE %s histogram' % name]
+        for stage, hist in sorted(snapshot['durations'].items()):
+            cumulative = 0
+            for le, count in zip(list(Metrics.BUCKETS) + ['+Inf'], hist['buckets']):
+                cumulative += count
+                lines.append('%s_bucket{stage="%s",le="%s"} %d' % (name, stage, le, cumulative))
+            lines.append('%s_sum{stage="%s"} %r' % (name, stage, hist['sum']))
+            lines.append('%s_count{stage="%s"} %d' % (name, stage, hist['count']))
+
+        # bytes
+        name = self.prefix + '_stage_bytes_total'
+        lines += ['# HELP %s Bytes processed in stages.' % name, '# TYPE %s counter' % name]
+        for stage, size in sorted(snapshot['bytes'].items()):
+            lines.append('%s{stage="%s"} %d' % (name, stage, size))
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics(Metrics):
+    """Disabled metrics, which do not record anything."""
+
+    """Shared timer, since it has no state."""
+    _TIMER = _NullTimer()
+
+    def timer(self, stage: str) -> typing.ContextManager:
+        return NullMetrics._TIMER
+
+    def observe(self, stage: str, seconds: float):
+        pass
+
+    def count_bytes(self, stage: str, size: int):
+        pass
+
+    def count_chunks(self, stage: str, chunks: typing.Iterable[bytes]) -> typing.Iterable[bytes]:
+        return chunks
+
+
+"""Metrics for this process and disabled metrics, see get_metrics()."""
+metrics = Metrics()
+null_metrics = NullMetrics()
+
+
+def get_metrics(cfg: dict) -> Metrics:
+    """Returns the process-wide metrics, if enabled by the 'metrics' setting, otherwise disabled metrics.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+    Returns:
+        Metrics to record to.
+    """
+    return metrics if cfg.get('metrics', False) else null_metrics
+
+
+__all__ = ['Metrics', 'NullMetrics', 'metrics', 'null_metrics', 'get_metrics']
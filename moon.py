@@ -0,0 +1,387 @@
+import collections
+import datetime
+import os
+import tempfile
+import threading
+import typing
+import zipfile
+
+import numpy as np
+
+from saltofi.observability import LATITUDE, LONGITUDE, MIN_ALTITUDE, MAX_ALTITUDE, TWILIGHT, Night, gmst, \
+    sun_position, altitude
+
+
+"""Step of time grid in ephemeris tables in minutes."""
+GRID_STEP = 5.
+
+"""Version of table format, tables stored with another version are built again."""
+TABLE_VERSION = 1
+
+"""Maximum number of grid points evaluated at once in constraint checks, limits memory to a few 10MB."""
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def moon_position(jd: typing.Union[float, np.ndarray], lst: typing.Union[float, np.ndarray] = None) \
+        -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Position of the moon from the low precision formulae of the Astronomical Almanac, accurate to about 0.3 degrees.
+    Coordinates refer to the mean equinox of date, which, compared to ICRS coordinates of targets, adds an error of
+    less than half a degree in this century, which is negligible for lunar constraints.
+
+    Args:
+        jd: Julian date(s).
+        lst: Local sidereal time(s) at SALT in hours. If given, the topocentric position is returned, which differs by
+            up to a degree from the geocentric one.
+
+    Returns:
+        Right ascension in hours and declination in degrees.
+    """
+    t = (np.asarray(jd) - 2451545.) / 36525.
+
+    def s(a, b):
+        return np.sin(np.radians(a + b * t))
+
+    def c(a, b):
+        return np.cos(np.radians(a + b * t))
+
+    # ecliptic coordinates and horizontal parallax
+    lon = np.radians(218.32 + 481267.881 * t + 6.29 * s(135.0, 477198.87) - 1.27 * s(259.3, -413335.36) +
+                     0.66 * s(235.7, 890534.22) + 0.21 * s(269.9, 954397.74) - 0.19 * s(357.5, 35999.05) -
+                     0.11 * s(186.5, 966404.03))
+    lat = np.radians(5.13 * s(93.3, 483202.02) + 0.28 * s(228.2, 960400.89) - 0.28 * s(318.3, 6003.15) -
+                     0.17 * s(217.6, -407332.21))
+    parallax = np.radians(0.9508 + 0.0518 * c(135.0, 477198.87) + 0.0095 * c(259.3, -413335.36) +
+                          0.0078 * c(235.7, 890534.22) + 0.0028 * c(269.9, 954397.74))
+
+    # geocentric vector in Earth radii, in equatorial coordinates
+    eps = np.radians(23.439 - 0.013 * t)
+    r = 1. / np.sin(parallax)
+    x = r * np.cos(lat) * np.cos(lon)
+    y = r * (np.cos(eps) * np.cos(lat) * np.sin(lon) - np.sin(eps) * np.sin(lat))
+    z = r * (np.sin(eps) * np.cos(lat) * np.sin(lon) + np.cos(eps) * np.sin(lat))
+
+    # move to observer
+    if lst is not None:
+        phi, theta = np.radians(LATITUDE), np.radians(np.asarray(lst) * 15.)
+        x, y, z = x - np.cos(phi) * np.cos(theta), y - np.cos(phi) * np.sin(theta), z - np.sin(phi)
+
+    ra = np.degrees(np.arctan2(y, x)) / 15. % 24.
+    dec = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    return ra, dec
+
+
+def _unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    """Unit vectors for positions on the sky.
+
+    Args:
+        ra: Right ascensions in hours.
+        dec: Declinations in degrees.
+
+    Returns:
+        Array of shape (N, 3).
+    """
+    ra, dec = np.radians(np.asarray(ra, dtype=float) * 15.), np.radians(np.asarray(dec, dtype=float))
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=1)
+
+
+def semester_dates(year: int, semester: int) -> typing.Tuple[datetime.date, datetime.date]:
+    """Returns the first and last evening of a SALT semester, which runs from May to October or November to April.
+
+    Args:
+        year: Year of semester.
+        semester: Semester, 1 or 2.
+
+    Returns:
+        Dates of first and last evening.
+    """
+    if semester == 1:
+        return datetime.date(year, 5, 1), datetime.date(year, 10, 31)
+    elif semester == 2:
+        return datetime.date(year, 11, 1), datetime.date(year + 1, 4, 30)
+    raise ValueError('Invalid semester %s.' % semester)
+
+
+def semester_for(date: datetime.date) -> typing.Tuple[int, int]:
+    """Returns the semester containing the given evening.
+
+    Args:
+        date: Date of evening.
+
+    Returns:
+        Year and semester.
+    """
+    if 5 <= date.month <= 10:
+        return date.year, 1
+    return (date.year, 2) if date.month > 10 else (date.year - 1, 2)
+
+
+class LunarEphemeris(object):
+    """Table with the position and illuminated fraction of the moon on a fine time grid covering a SALT semester.
+
+    Each row also contains the local sidereal time and whether it is dark, so that constraints can be checked against
+    the table alone.
+    """
+
+    """Names of columns in table."""
+    COLUMNS = ['jd', 'lst', 'dark', 'moon_ra', 'moon_dec', 'moon_altitude', 'illumination']
+
+    def __init__(self, year: int, semester: int, columns: typing.Dict[str, np.ndarray] = None):
+        """Creates the table for a semester.
+
+        Args:
+            year: Year of semester.
+            semester: Semester, 1 or 2.
+            columns: If given, use these columns instead of computing them.
+        """
+        self.year, self.semester = year, semester
+        if columns is None:
+            columns = LunarEphemeris._compute(year, semester)
+        for name in LunarEphemeris.COLUMNS:
+            setattr(self, name, columns[name])
+
+    @staticmethod
+    def _compute(year: int, semester: int) -> typing.Dict[str, np.ndarray]:
+        """Computes the table for a semester.
+
+        Args:
+            year: Year of semester.
+            semester: Semester, 1 or 2.
+
+        Returns:
+            Columns of table.
+        """
+
+        # grid from local mean noon before first evening to local mean noon after last one
+        first, last = semester_dates(year, semester)
+        start = Night.noon(first)
+        steps = int(round(((last - first).days + 1) * 1440. / GRID_STEP))
+        jd = start + np.arange(steps + 1) * GRID_STEP / 1440.
+        lst = (gmst(jd) + LONGITUDE / 15.) % 24.
+
+        # sun for dark time and phase
+        sun_ra, sun_dec = sun_position(jd)
+        dark = altitude(sun_ra, sun_dec, lst) < TWILIGHT
+
+        # topocentric moon, its illuminated fraction follows from its elongation from the sun
+        moon_ra, moon_dec = moon_position(jd, lst)
+        cos_elongation = np.einsum('ij,ij->i', _unit_vectors(sun_ra, sun_dec), _unit_vectors(moon_ra, moon_dec))
+        illumination = (1. - cos_elongation) / 2. * 100.
+
+        return {'jd': jd, 'lst': lst, 'dark': dark, 'moon_ra': moon_ra, 'moon_dec': moon_dec,
+                'moon_altitude': altitude(moon_ra, moon_dec, lst), 'illumination': illumination}
+
+    @staticmethod
+    def filename(path: str, year: int, semester: int) -> str:
+        """Returns the filename for a stored table.
+
+        Args:
+            path: Directory for tables.
+            year: Year of semester.
+            semester: Semester, 1 or 2.
+
+        Returns:
+            Filename.
+        """
+        return os.path.join(path, 'moon-%d-%d-v%d.npz' % (year, semester, TABLE_VERSION))
+
+    def save(self, filename: str):
+        """Stores the table in a file, via a temporary file, so that concurrent readers never see partial tables.
+
+        Args:
+            filename: Name of file.
+        """
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **{name: getattr(self, name) for name in LunarEphemeris.COLUMNS})
+            os.replace(tmp, filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def load(filename: str, year: int, semester: int) -> 'LunarEphemeris':
+        """Loads a table from a file.
+
+        Args:
+            filename: Name of file.
+            year: Year of semester.
+            semester: Semester, 1 or 2.
+
+        Returns:
+            Table.
+        """
+        with np.load(filename) as data:
+            return LunarEphemeris(year, semester, {name: data[name] for name in LunarEphemeris.COLUMNS})
+
+    def rows(self, start: float, end: float) -> slice:
+        """Returns the rows for the given time range.
+
+        Args:
+            start: Julian date of start.
+            end: Julian date of end.
+
+        Returns:
+            Slice of rows.
+        """
+        return slice(np.searchsorted(self.jd, start), np.searchsorted(self.jd, end, side='right'))
+
+
+class EphemerisCache(object):
+    """Process-wide cache for lunar ephemeris tables, which are built once and stored on disk."""
+
+    """Maximum number of tables to keep in memory, enough for the previous, current and next semester."""
+    MAX_SIZE = 3
+
+    def __init__(self, path: str = None):
+        """Initializes a new, empty cache.
+
+        Args:
+            path: Directory for stored tables, a directory in the system's temporary directory if None.
+        """
+        self.path = path or os.path.join(tempfile.gettempdir(), 'saltofi-ephemeris')
+        self._tables = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, year: int, semester: int) -> LunarEphemeris:
+        """Returns the table for the given semester, loading or building it, if necessary.
+
+        Args:
+            year: Year of semester.
+            semester: Semester, 1 or 2.
+
+        Returns:
+            Table for semester.
+        """
+        with self._lock:
+            table = self._tables.get((year, semester))
+            if table is not None:
+                self._tables.move_to_end((year, semester))
+                return table
+
+            # load from disk or build and store it, a broken file is simply replaced
+            filename = LunarEphemeris.filename(self.path, year, semester)
+            table = None
+            if os.path.exists(filename):
+                try:
+                    table = LunarEphemeris.load(filename, year, semester)
+                except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+                    table = None
+            if table is None:
+                table = LunarEphemeris(year, semester)
+                try:
+                    table.save(filename)
+                except OSError:
+                    # not being able to store it only costs time
+                    pass
+            self._tables[(year, semester)] = table
+            while len(self._tables) > EphemerisCache.MAX_SIZE:
+                self._tables.popitem(last=False)
+            return table
+
+    def between(self, start: float, end: float) -> typing.List[LunarEphemeris]:
+        """Returns the tables for all semesters overlapping with a time range.
+
+        Args:
+            start: Julian date of start.
+            end: Julian date of end.
+
+        Returns:
+            List of tables.
+        """
+        semester, last = semester_for(Night.date_for(start)), semester_for(Night.date_for(end))
+        tables = []
+        while semester <= last:
+            tables.append(self.get(*semester))
+            semester = (semester[0], 2) if semester[1] == 1 else (semester[0] + 1, 1)
+        return tables
+
+
+"""Global ephemeris cache, the directory for tables can be set with the environment variable SALTOFI_EPHEMERIS_CACHE."""
+ephemerides = EphemerisCache(os.environ.get('SALTOFI_EPHEMERIS_CACHE'))
+
+
+def schedulable_hours(ra: typing.Union[typing.Sequence[float], np.ndarray],
+                      dec: typing.Union[typing.Sequence[float], np.ndarray],
+                      max_lunar_phase: typing.Union[float, typing.Sequence[float], np.ndarray, None],
+                      min_lunar_distance: typing.Union[float, typing.Sequence[float], np.ndarray, None],
+                      start: float, end: float) -> np.ndarray:
+    """Computes for how long targets can be observed with SALT within a time range, while also meeting their lunar
+    constraints.
+
+    A target counts as observable at a time in the ephemeris table, if it is dark, the target is within SALT's
+    accessible annulus, and the moon is either below the horizon or meets both constraints. Target positions and
+    the moon and zenith directions are unit vectors, so all angles for all targets and times follow from two
+    matrix products, which are computed in chunks of rows to limit memory.
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+        max_lunar_phase: Maximum illuminated fraction of the moon in percent, for all or for each target, or None.
+        min_lunar_distance: Minimum distance to the moon in degrees, for all or for each target, or None.
+        start: Julian date of start of range.
+        end: Julian date of end of range.
+
+    Returns:
+        Hours for each target, within the resolution of the table.
+    """
+    targets = _unit_vectors(np.asarray(ra, dtype=float) / 15., dec)
+    n = len(targets)
+    max_phase = np.broadcast_to(np.asarray(100. if max_lunar_phase is None else max_lunar_phase, dtype=float), n)
+    cos_distance = np.cos(np.radians(np.broadcast_to(
+        np.asarray(0. if min_lunar_distance is None else min_lunar_distance, dtype=float), n)))
+    sin_min, sin_max = np.sin(np.radians(MIN_ALTITUDE)), np.sin(np.radians(MAX_ALTITUDE))
+    counts = np.zeros(n, dtype=int)
+
+    for table in ephemerides.between(start, end):
+        # only dark rows in range matter
+        rows = table.rows(start, end)
+        dark = np.flatnonzero(table.dark[rows]) + (rows.start or 0)
+        if not len(dark):
+            continue
+        zenith = _unit_vectors(table.lst[dark], np.full(len(dark), LATITUDE))
+        moon = _unit_vectors(table.moon_ra[dark], table.moon_dec[dark])
+        moon_up = table.moon_altitude[dark] > 0.
+        illumination = table.illumination[dark]
+
+        # evaluate in chunks of rows
+        chunk = max(1, CHUNK_SIZE // max(n, 1))
+        for i in range(0, len(dark), chunk):
+            s = slice(i, i + chunk)
+            sin_alt = targets @ zenith[s].T
+            ok = (sin_alt >= sin_min) & (sin_alt <= sin_max)
+            moon_ok = (illumination[None, s] <= max_phase[:, None]) & \
+                (targets @ moon[s].T <= cos_distance[:, None])
+            ok &= ~moon_up[None, s] | moon_ok
+            counts += ok.sum(axis=1)
+
+    return counts * GRID_STEP / 60.
+
+
+def schedulable(ra: typing.Union[typing.Sequence[float], np.ndarray],
+                dec: typing.Union[typing.Sequence[float], np.ndarray],
+                max_lunar_phase: typing.Union[float, typing.Sequence[float], np.ndarray, None],
+                min_lunar_distance: typing.Union[float, typing.Sequence[float], np.ndarray, None],
+                start: float, end: float, min_hours: float = 0.) -> np.ndarray:
+    """Checks which targets can be observed meeting their lunar constraints within a time range, see
+    schedulable_hours().
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+        max_lunar_phase: Maximum illuminated fraction of the moon in percent, for all or for each target, or None.
+        min_lunar_distance: Minimum distance to the moon in degrees, for all or for each target, or None.
+        start: Julian date of start of range.
+        end: Julian date of end of range.
+        min_hours: Minimum time for which a target must be observable.
+
+    Returns:
+        Boolean array for all targets.
+    """
+    hours = schedulable_hours(ra, dec, max_lunar_phase, min_lunar_distance, start, end)
+    return hours > min_hours if min_hours <= 0 else hours >= min_hours
+
+
+__all__ = ['moon_position', 'semester_dates', 'semester_for', 'LunarEphemeris', 'EphemerisCache', 'ephemerides',
+           'schedulable_hours', 'schedulable']
@@ -0,0 +1,168 @@
+import io
+import os
+import random
+import string
+import time
+import typing
+
+
+class MultipartEncoder(object):
+    """Streaming encoder for a multipart/form-data body.
+
+    The body is never built in memory as a whole. Instead, its parts are produced chunk by chunk on reading, and files
+    are streamed from disk. Since the size of all parts is known in advance, the length of the body is available
+    before sending, so it can be used as the content-length header.
+
+    The encoder is a file-like object, which can be passed directly as body to requests.
+    """
+
+    """Size of chunks to read from files."""
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields: typing.Dict[str, typing.Any], files: list, boundary: str = None):
+        """Creates a new encoder.
+
+        Args:
+            fields: Form fields to add.
+            files: Files to add, each either a filename, a file-like object or bytes.
+            boundary: Boundary between parts, random if not given.
+        """
+
+        # define some strings
+        self.boundary = boundary if boundary else \
+            ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(16))
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        crlf = '\r\n'
+
+        # list of parts, each either bytes or a file source with its size
+        self._parts = []
+
+        # add parameters
+        for key, value in fields.items():
+            if isinstance(value, bool):
+                value = 'true' if value else 'false'
+            self._parts.append(bytes('--' + self.boundary + crlf +
+                                     'Content-Disposition: form-data; name="%s"' % key + crlf +
+                                     'Content-Type: text/plain; charset=US-ASCII' + crlf +
+                                     'Content-Transfer-Encoding: 8bit' + crlf +
+                                     crlf +
+                                     str(value) + crlf, 'ascii'))
+
+        # add files
+        for i, file_obj in enumerate(files):
+            # get filename and size of file
+            key = 'file_' + str(int(time.time())) + '_' + str(i)
+            if isinstance(file_obj, str):
+                filename, size = file_obj, os.path.getsize(file_obj)
+            elif hasattr(file_obj, 'read'):
+                name = getattr(file_obj, 'name', None)
+                filename = os.path.basename(name) if isinstance(name, str) else key + '.zip'
+                file_obj.seek(0, io.SEEK_END)
+                size = file_obj.tell()
+            elif isinstance(file_obj, bytes):
+                filename, size = key + '.zip', len(file_obj)
+            else:
+                raise ValueError('Unknown file type.')
+
+            # add part header for file
+            header = '--' + self.boundary + crlf + \
+                     'Content-Disposition: form-data; name="%s"; filename="%s"' % (key, filename) + crlf + \
+                     'Content-Type: application/zip' + crlf + \
+                     'Content-Transfer-Encoding: binary' + crlf + crlf
+            self._parts.append(bytes(header, 'ascii'))
+
+            # add file itself, bytes directly, files as source with size
+            self._parts.append(file_obj if isinstance(file_obj, bytes) else (file_obj, size))
+            self._parts.append(bytes(crlf, 'ascii'))
+
+        # final boundary
+        self._parts.append(bytes('--' + self.boundary + '--', 'ascii'))
+
+        # total length
+        self.len = sum(len(p) if isinstance(p, bytes) else p[1] for p in self._parts)
+
+        # start reading
+        self.seek(0)
+
+    def __len__(self) -> int:
+        """Returns total length of body."""
+        return self.len
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        """Iterate over chunks of the body, starting at the current position."""
+        while True:
+            chunk = self.read(MultipartEncoder.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def _chunks(self) -> typing.Iterator[bytes]:
+        """Produce all chunks of the body."""
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+            elif isinstance(part[0], str):
+                # filename, open and stream it
+                with open(part[0], 'rb') as f:
+                    yield from iter(lambda: f.read(MultipartEncoder.CHUNK_SIZE), b'')
+            else:
+                # file-like, stream from beginning
+                part[0].seek(0)
+                yield from iter(lambda: part[0].read(MultipartEncoder.CHUNK_SIZE), b'')
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from body.
+
+        Args:
+            size: Maximum number of bytes to read, or everything if negative.
+
+        Returns:
+            Read bytes, empty if the end of the body has been reached.
+        """
+
+        # fill buffer, until we have enough
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._iter, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        # return requested bytes
+        if size < 0:
+            data, self._buffer = bytes(self._buffer), bytearray()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self._pos += len(data)
+        return data
+
+    def tell(self) -> int:
+        """Returns current position in body."""
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Rewind body, only seeking to the beginning is supported.
+
+        Args:
+            offset: Must be 0.
+            whence: Must be io.SEEK_SET.
+
+        Returns:
+            New position.
+        """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('Can only rewind to beginning.')
+        self._iter = self._chunks()
+        self._buffer = bytearray()
+        self._pos = 0
+        return 0
+
+    def to_bytes(self) -> bytes:
+        """Returns the whole body as bytes, mainly for debugging."""
+        self.seek(0)
+        data = self.read()
+        self.seek(0)
+        return data
+
+
+__all__ = ['MultipartEncoder']
@@ -0,0 +1,339 @@
+import collections
+import datetime
+import threading
+import time
+import typing
+
+import numpy as np
+
+from saltofi.sites import SALT
+
+
+"""Location of SALT in degrees and metres, see SaltFacility.SITES."""
+LATITUDE = SALT['latitude']
+LONGITUDE = SALT['longitude']
+ELEVATION = SALT['elevation']
+
+"""Range of altitudes in degrees accessible to SALT, whose primary mirror is fixed at an altitude of 53 degrees, while
+the tracker can follow targets for 6 degrees around it."""
+MIN_ALTITUDE = 47.
+MAX_ALTITUDE = 59.
+
+"""Altitude of sun in degrees at end and start of night."""
+TWILIGHT = -18.
+
+"""Step of time grid for nights in minutes."""
+GRID_STEP = 1.
+
+"""Ratio of sidereal to solar time."""
+SIDEREAL_RATE = 1.00273790935
+
+"""Julian date of J2000 epoch and of 0001-01-01 00:00 UTC minus the ordinal of that date."""
+_J2000 = 2451545.
+_JD_ORDINAL = 1721424.5
+
+
+def julian_date(t: float = None) -> float:
+    """Returns the Julian date for the given Unix time.
+
+    Args:
+        t: Unix time, current time if None.
+
+    Returns:
+        Julian date.
+    """
+    return (time.time() if t is None else t) / 86400. + 2440587.5
+
+
+def gmst(jd: typing.Union[float, np.ndarray]) -> typing.Union[float, np.ndarray]:
+    """Greenwich mean sidereal time, accurate to about a second for the current century.
+
+    Args:
+        jd: Julian date(s).
+
+    Returns:
+        GMST in hours.
+    """
+    return (18.697374558 + 24.06570982441908 * (np.asarray(jd) - _J2000)) % 24.
+
+
+def sun_position(jd: typing.Union[float, np.ndarray]) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Position of the sun from the low precision formulae of the Astronomical Almanac, accurate to about 0.01 degrees,
+    which is more than sufficient for the times of twilight.
+
+    Args:
+        jd: Julian date(s).
+
+    Returns:
+        Right ascension in hours and declination in degrees.
+    """
+    n = np.asarray(jd) - _J2000
+    mean_lon = np.radians(280.460 + 0.9856474 * n)
+    anomaly = np.radians(357.528 + 0.9856003 * n)
+    ecl_lon = mean_lon + np.radians(1.915) * np.sin(anomaly) + np.radians(0.020) * np.sin(2 * anomaly)
+    obliquity = np.radians(23.439 - 0.0000004 * n)
+    ra = np.degrees(np.arctan2(np.cos(obliquity) * np.sin(ecl_lon), np.cos(ecl_lon))) / 15. % 24.
+    dec = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(ecl_lon)))
+    return ra, dec
+
+
+def altitude(ra: typing.Union[float, np.ndarray], dec: typing.Union[float, np.ndarray],
+             lst: typing.Union[float, np.ndarray]) -> np.ndarray:
+    """Altitude of objects at SALT, ignoring refraction.
+
+    Args:
+        ra: Right ascension(s) in hours.
+        dec: Declination(s) in degrees.
+        lst: Local sidereal time(s) in hours, must broadcast with ra and dec.
+
+    Returns:
+        Altitude(s) in degrees.
+    """
+    lat, dec = np.radians(LATITUDE), np.radians(dec)
+    hour_angle = np.radians((np.asarray(lst) - ra) * 15.)
+    return np.degrees(np.arcsin(np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(hour_angle)))
+
+
+class Night(object):
+    """Time grid for a single night at SALT with local sidereal time and altitude of the sun.
+
+    A night runs from local noon to local noon on the next day, and is named after the date of its evening.
+    """
+
+    def __init__(self, date: datetime.date):
+        """Computes the grid for a night.
+
+        Args:
+            date: Date of evening.
+        """
+        self.date = date
+
+        # grid from local mean noon
+        start = Night.noon(date)
+        steps = int(round(24 * 60 / GRID_STEP))
+        self.jd = start + np.arange(steps + 1) * GRID_STEP / 1440.
+        self.lst = (gmst(self.jd) + LONGITUDE / 15.) % 24.
+
+        # sun and dark time
+        sun_ra, sun_dec = sun_position(self.jd)
+        self.sun_altitude = altitude(sun_ra, sun_dec, self.lst)
+        self.dark = self.sun_altitude < TWILIGHT
+
+        # start and end of night, always defined, but equal for a night without dark time
+        dark = np.flatnonzero(self.dark)
+        first, last = (dark[0], dark[-1]) if len(dark) else (steps // 2, steps // 2)
+        self.dusk, self.dawn = self.jd[first], self.jd[last]
+        self.lst_dusk = self.lst[first]
+
+    @staticmethod
+    def noon(date: datetime.date) -> float:
+        """Returns the start of the night with the given date, i.e. local mean noon.
+
+        Args:
+            date: Date of evening.
+
+        Returns:
+            Julian date.
+        """
+        # Julian dates start at noon
+        return date.toordinal() + _JD_ORDINAL + .5 - LONGITUDE / 360.
+
+    @staticmethod
+    def date_for(jd: float) -> datetime.date:
+        """Returns the date of the night containing the given time.
+
+        Args:
+            jd: Julian date.
+
+        Returns:
+            Date of evening.
+        """
+        return datetime.date.fromordinal(int(np.floor(jd + LONGITUDE / 360. - _JD_ORDINAL - .5)))
+
+    @property
+    def duration(self) -> float:
+        """Length of dark time in hours."""
+        return (self.dawn - self.dusk) * 24.
+
+
+class NightCache(object):
+    """Process-wide cache for the grids of nights, which only depend on the date."""
+
+    """Maximum number of nights to keep, a bit more than a year."""
+    MAX_SIZE = 400
+
+    def __init__(self):
+        """Initializes a new, empty cache."""
+        self._nights = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, date: datetime.date) -> Night:
+        """Returns the grid for the given night.
+
+        Args:
+            date: Date of evening.
+
+        Returns:
+            Grid for night.
+        """
+        with self._lock:
+            night = self._nights.get(date)
+            if night is not None:
+                self._nights.move_to_end(date)
+                return night
+
+        # compute it outside of lock, in the worst case it is computed twice
+        night = Night(date)
+        with self._lock:
+            self._nights[date] = night
+            while len(self._nights) > NightCache.MAX_SIZE:
+                self._nights.popitem(last=False)
+        return night
+
+
+"""Global night cache."""
+nights = NightCache()
+
+
+class Windows(object):
+    """Windows in which targets can be observed with SALT during a single night.
+
+    Because of its fixed altitude, SALT can reach a target only when it passes through the annulus of accessible
+    altitudes, i.e. on a track in the east while rising and on a track in the west while setting. For targets that
+    culminate within the annulus, both tracks meet.
+    """
+
+    def __init__(self, night: Night, east: np.ndarray, west: np.ndarray):
+        """Creates new windows.
+
+        Args:
+            night: The night.
+            east: Start and end of eastern tracks as Julian dates, shape (N, 2), NaN if not observable.
+            west: Same for western tracks.
+        """
+        self.night = night
+        self.east = east
+        self.west = west
+
+    @property
+    def observable(self) -> np.ndarray:
+        """Whether each target can be observed in this night at all."""
+        return ~np.isnan(self.east[:, 0]) | ~np.isnan(self.west[:, 0])
+
+    @property
+    def duration(self) -> np.ndarray:
+        """Total time in hours for which each target can be observed."""
+        return (np.nan_to_num(self.east[:, 1] - self.east[:, 0]) +
+                np.nan_to_num(self.west[:, 1] - self.west[:, 0])) * 24.
+
+
+def hour_angle_limits(dec: typing.Union[float, np.ndarray]) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Range of absolute hour angles in which targets are within the accessible annulus.
+
+    Args:
+        dec: Declination(s) in degrees.
+
+    Returns:
+        Minimum and maximum absolute hour angle in hours, with the minimum not below the maximum for targets that
+        never pass through the annulus.
+    """
+
+    # solve sin(alt) = sin(lat) sin(dec) + cos(lat) cos(dec) cos(H) for the cosine of the hour angle at both edges
+    lat, dec = np.radians(LATITUDE), np.radians(np.asarray(dec, dtype=float))
+    a, b = np.sin(lat) * np.sin(dec), np.cos(lat) * np.cos(dec)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_top = (np.sin(np.radians(MAX_ALTITUDE)) - a) / b
+        cos_bottom = (np.sin(np.radians(MIN_ALTITUDE)) - a) / b
+
+    # outside of [-1, 1] the target is always above or never reaches an edge
+    h_min = np.degrees(np.arccos(np.clip(np.nan_to_num(cos_top, nan=2.), -1., 1.))) / 15.
+    h_max = np.degrees(np.arccos(np.clip(np.nan_to_num(cos_bottom, nan=2.), -1., 1.))) / 15.
+    return h_min, h_max
+
+
+def windows(ra: typing.Union[typing.Sequence[float], np.ndarray], dec: typing.Union[typing.Sequence[float], np.ndarray],
+            night: typing.Union[datetime.date, Night], start: float = None, end: float = None) -> Windows:
+    """Computes the windows in which the given targets can be observed in a night.
+
+    The hour angles at the edges of the annulus are computed analytically for all targets at once and converted into
+    times via the sidereal time at dusk from the night's grid, so the cost is linear in the number of targets and does
+    not depend on the resolution of the grid.
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+        night: Night or date of its evening.
+        start: If given, ignore times before this Julian date.
+        end: If given, ignore times after this Julian date.
+
+    Returns:
+        Windows for all targets.
+    """
+    if not isinstance(night, Night):
+        night = nights.get(night)
+    ra_hours = np.asarray(ra, dtype=float) / 15.
+    h_min, h_max = hour_angle_limits(dec)
+    reachable = h_min < h_max
+
+    # limits of dark time
+    begin = night.dusk if start is None else max(night.dusk, start)
+    finish = night.dawn if end is None else min(night.dawn, end)
+
+    tracks = []
+    for h_start, h_end in ((-h_max, -h_min), (h_min, h_max)):
+        # sidereal hours after dusk, at which target enters annulus, going back a day, if it is still in it at dusk
+        width = h_end - h_start
+        offset = (ra_hours + h_start - night.lst_dusk) % 24.
+        offset = np.where(offset + width > 24., offset - 24., offset)
+
+        # convert to Julian dates and clip to dark time
+        t_start = np.maximum(night.dusk + offset / SIDEREAL_RATE / 24., begin)
+        t_end = np.minimum(night.dusk + (offset + width) / SIDEREAL_RATE / 24., finish)
+        valid = reachable & (t_start < t_end)
+        tracks.append(np.where(valid[:, None], np.stack([t_start, t_end], axis=1), np.nan))
+    return Windows(night, tracks[0], tracks[1])
+
+
+def windows_between(ra: typing.Union[typing.Sequence[float], np.ndarray],
+                    dec: typing.Union[typing.Sequence[float], np.ndarray],
+                    start: float, end: float) -> typing.List[Windows]:
+    """Computes the windows for all nights in a given time range, e.g. a semester.
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+        start: Julian date of start of range.
+        end: Julian date of end of range.
+
+    Returns:
+        Windows for each night overlapping with the range.
+    """
+    first, last = Night.date_for(start), Night.date_for(end)
+    return [windows(ra, dec, first + datetime.timedelta(days=i), start=start, end=end)
+            for i in range((last - first).days + 1)]
+
+
+def observable(ra: typing.Union[typing.Sequence[float], np.ndarray],
+               dec: typing.Union[typing.Sequence[float], np.ndarray],
+               start: float = None, hours: float = 24.) -> np.ndarray:
+    """Checks which targets can be observed at all within the given time range.
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+        start: Julian date of start of range, now if None.
+        hours: Length of range in hours.
+
+    Returns:
+        Boolean array for all targets.
+    """
+    start = julian_date() if start is None else start
+    result = np.zeros(len(ra), dtype=bool)
+    for w in windows_between(ra, dec, start, start + hours / 24.):
+        result |= w.observable
+    return result
+
+
+__all__ = ['LATITUDE', 'LONGITUDE', 'ELEVATION', 'MIN_ALTITUDE', 'MAX_ALTITUDE', 'julian_date', 'gmst',
+           'sun_position', 'altitude', 'Night', 'NightCache', 'nights', 'Windows', 'hour_angle_limits', 'windows',
+           'windows_between', 'observable']
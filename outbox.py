@@ -0,0 +1,327 @@
+import logging
+import sqlite3
+import threading
+import time
+import typing
+
+from .portal import backoff_delay
+
+
+log = logging.getLogger(__name__)
+
+
+class Outbox(object):
+    """Durable local queue for block submissions, stored in SQLite.
+
+    Each entry is identified by its block code, so adding the same block twice has no effect. Entries are claimed by
+    workers for a limited time (the lease). If a worker dies before marking its entries as done or failed, the lease
+    expires and the entries are claimed again, so each block is delivered at least once.
+
+    States of entries are 'pending' (waiting for next attempt), 'sending' (claimed by a worker), 'done' and 'failed'.
+    """
+
+    def __init__(self, filename: str, lease: float = 300.):
+        """Opens or creates an outbox.
+
+        Args:
+            filename: Name of SQLite database file.
+            lease: Time in seconds, for which a claimed entry is reserved for a worker.
+        """
+        self.filename = filename
+        self.lease = lease
+        self._lock = threading.Lock()
+
+        # open database, autocommit mode, so that we can control transactions ourselves
+        self._db = sqlite3.connect(filename, timeout=30., isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                         'block_code TEXT PRIMARY KEY, '
+                         'payload BLOB NOT NULL, '
+                         'state TEXT NOT NULL, '
+                         'attempts INTEGER NOT NULL DEFAULT 0, '
+                         'created REAL NOT NULL, '
+                         'next_attempt REAL NOT NULL, '
+                         'error TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS outbox_next ON outbox (state, next_attempt)')
+
+    def close(self):
+        """Close database."""
+        with self._lock:
+            self._db.close()
+
+    def put(self, block_code: str, xml: typing.Union[str, bytes]) -> bool:
+        """Add a block to the outbox.
+
+        Args:
+            block_code: Code of block.
+            xml: XML of block.
+
+        Returns:
+            Whether the block was added, False if it was in the outbox already.
+        """
+        xml = xml.encode('utf-8') if isinstance(xml, str) else xml
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute('INSERT OR IGNORE INTO outbox (block_code, payload, state, created, next_attempt) '
+                                   'VALUES (?, ?, ?, ?, ?)', (block_code, xml, 'pending', now, now))
+            return cur.rowcount > 0
+
+    def claim(self, limit: int) -> typing.List[dict]:
+        """Claim entries that are due for sending.
+
+        Args:
+            limit: Maximum number of entries to claim.
+
+        Returns:
+            List of payloads with 'block_code' and 'xml'.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                # find pending entries that are due and entries with expired lease
+                rows = self._db.execute('SELECT block_code, payload FROM outbox '
+                                        'WHERE state IN (?, ?) AND next_attempt <= ? '
+                                        'ORDER BY next_attempt LIMIT ?', ('pending', 'sending', now, limit)).fetchall()
+
+                # reserve them
+                self._db.executemany('UPDATE outbox SET state=?, attempts=attempts+1, next_attempt=? '
+                                     'WHERE block_code=?', [('sending', now + self.lease, r[0]) for r in rows])
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return [{'block_code': r[0], 'xml': r[1]} for r in rows]
+
+    def done(self, block_codes: typing.List[str]):
+        """Mark entries as successfully sent.
+
+        Args:
+            block_codes: Codes of blocks.
+        """
+        with self._lock:
+            self._db.executemany('UPDATE outbox SET state=?, error=NULL WHERE block_code=?',
+                                 [('done', c) for c in block_codes])
+
+    def retry(self, block_codes: typing.List[str], delay: float, error: str = None):
+        """Put entries back into queue after a failed attempt.
+
+        Args:
+            block_codes: Codes of blocks.
+            delay: Time in seconds until next attempt.
+            error: Error message of failed attempt.
+        """
+        with self._lock:
+            self._db.executemany('UPDATE outbox SET state=?, next_attempt=?, error=? WHERE block_code=?',
+                                 [('pending', time.time() + delay, error, c) for c in block_codes])
+
+    def fail(self, block_code: str, error: str):
+        """Mark an entry as failed permanently.
+
+        Args:
+            block_code: Code of block.
+            error: Error message.
+        """
+        with self._lock:
+            self._db.execute('UPDATE outbox SET state=?, error=? WHERE block_code=?', ('failed', error, block_code))
+
+    def status(self, block_code: str) -> typing.Union[dict, None]:
+        """Returns status of an entry.
+
+        Args:
+            block_code: Code of block.
+
+        Returns:
+            Dictionary with 'state', 'attempts', 'age' in seconds and 'error' or None, if block is not in outbox.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT state, attempts, created, error FROM outbox WHERE block_code=?',
+                                   (block_code,)).fetchone()
+        if row is None:
+            return None
+        return {'state': row[0], 'attempts': row[1], 'age': time.time() - row[2], 'error': row[3]}
+
+    def stats(self) -> dict:
+        """Returns statistics for the queue.
+
+        Returns:
+            Dictionary with 'depth' (number of unsent entries), 'oldest_age' (age of oldest unsent entry in seconds),
+            'retries' (number of retries for unsent entries) and 'failed' (number of failed entries).
+        """
+        with self._lock:
+            depth, oldest, retries = self._db.execute(
+                'SELECT COUNT(*), MIN(created), SUM(MAX(attempts - 1, 0)) FROM outbox WHERE state IN (?, ?)',
+                ('pending', 'sending')).fetchone()
+            failed = self._db.execute('SELECT COUNT(*) FROM outbox WHERE state=?', ('failed',)).fetchone()[0]
+        return {'depth': depth, 'oldest_age': 0. if oldest is None else time.time() - oldest,
+                'retries': retries or 0, 'failed': failed}
+
+    def purge(self, age: float):
+        """Remove sent entries older than given age.
+
+        Args:
+            age: Minimum age in seconds.
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM outbox WHERE state=? AND created<?', ('done', time.time() - age))
+
+
+class OutboxWorkers(object):
+    """Pool of background threads that drain an outbox.
+
+    The given submit function is called with a list of payloads and must raise SubmissionError for blocks that were
+    rejected by the server. Those are marked as failed, while blocks from the same batch that have not been sent yet
+    are put back into the queue. All other exceptions are treated as temporary and the whole batch is retried later.
+    Blocks that are marked as failed, either because they were rejected or after too many attempts, are passed to the
+    optional failed function.
+    """
+
+    def __init__(self, outbox: Outbox, submit: typing.Callable[[typing.List[dict]], typing.Any], threads: int = 2,
+                 batch_size: int = 50, poll_interval: float = 1., retry_backoff: float = 5.,
+                 retry_backoff_max: float = 600., max_attempts: int = 20,
+                 failed: typing.Callable[[typing.List[dict]], typing.Any] = None):
+        """Creates a new worker pool.
+
+        Args:
+            outbox: Outbox to drain.
+            submit: Function for submitting a list of payloads.
+            threads: Number of worker threads.
+            batch_size: Maximum number of blocks to submit at once.
+            poll_interval: Time in seconds to wait when outbox is empty.
+            retry_backoff: Base delay in seconds before retrying a failed batch.
+            retry_backoff_max: Maximum delay in seconds before retrying a failed batch.
+            max_attempts: Number of attempts, after which a block is marked as failed.
+            failed: Function that is called with the payloads of blocks that have been marked as failed.
+        """
+        self.outbox = outbox
+        self.submit = submit
+        self.failed = failed
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start worker threads."""
+        self._stop.clear()
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, name='saltofi-outbox-%d' % i, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Stop worker threads.
+
+        Args:
+            timeout: Maximum time in seconds to wait for each thread.
+        """
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Wake up idle workers, e.g. after adding new blocks."""
+        self._wake.set()
+
+    def _run(self):
+        """Main loop of a worker thread."""
+        while not self._stop.is_set():
+            try:
+                # process a batch, wait for new work if there was nothing to do
+                if not self.process():
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+            except Exception:
+                log.exception('Error in outbox worker.')
+                self._stop.wait(self.poll_interval)
+
+    def process(self) -> int:
+        """Claim and submit a single batch.
+
+        Returns:
+            Number of processed blocks.
+        """
+        from .facility import SubmissionError
+
+        # get batch
+        payloads = self.outbox.claim(self.batch_size)
+        if not payloads:
+            return 0
+        codes = [p['block_code'] for p in payloads]
+
+        try:
+            # submit it
+            self.submit(payloads)
+            self.outbox.done(codes)
+
+        except SubmissionError as e:
+            # block was rejected, fail it and put back all unsent
+            self.outbox.done(e.submitted)
+            self._fail([p for p in payloads if p['block_code'] == e.block_code], e.message)
+            unsent = [c for c in codes if c != e.block_code and c not in e.submitted]
+            self.outbox.retry(unsent, 0.)
+
+        except Exception as e:
+            # temporary error, retry later or fail, if we tried too often
+            for payload in payloads:
+                code = payload['block_code']
+                status = self.outbox.status(code)
+                if status is not None and status['attempts'] >= self.max_attempts:
+                    self._fail([payload], str(e))
+                else:
+                    attempts = status['attempts'] if status else 1
+                    self.outbox.retry([code], backoff_delay(attempts - 1, self.retry_backoff, self.retry_backoff_max),
+                                      str(e))
+            log.warning('Submission of %d blocks failed, will retry: %s', len(codes), e)
+
+        return len(codes)
+
+    def _fail(self, payloads: typing.List[dict], error: str):
+        """Mark blocks as failed permanently and pass them to the failed function.
+
+        Args:
+            payloads: Payloads of failed blocks.
+            error: Error message.
+        """
+        for payload in payloads:
+            self.outbox.fail(payload['block_code'], error)
+        if self.failed is not None and payloads:
+            self.failed(payloads)
+
+
+"""Outboxes and their workers in this process, see get_outbox()."""
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_outbox(cfg: dict, submit: typing.Callable[[typing.List[dict]], typing.Any],
+               failed: typing.Callable[[typing.List[dict]], typing.Any] = None) -> typing.Tuple[Outbox, OutboxWorkers]:
+    """Returns the process-wide outbox for the given SALT facility settings and starts its workers on first call.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'], with the filename of the database in 'outbox'.
+        submit: Function for submitting a list of payloads, see OutboxWorkers.
+        failed: Function called with the payloads of failed blocks, see OutboxWorkers.
+
+    Returns:
+        Outbox and its workers.
+    """
+    filename = cfg['outbox']
+    with _outboxes_lock:
+        if filename not in _outboxes:
+            outbox = Outbox(filename)
+            workers = OutboxWorkers(outbox, submit, threads=cfg.get('outbox_workers', 2),
+                                    batch_size=cfg.get('outbox_batch_size', 50), failed=failed)
+            workers.start()
+            _outboxes[filename] = (outbox, workers)
+        return _outboxes[filename]
+
+
+__all__ = ['Outbox', 'OutboxWorkers', 'get_outbox']
@@ -0,0 +1,440 @@
+import base64
+import random
+import threading
+import time
+import typing
+from xml.etree import ElementTree as ET
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PortalSession(object):
+    """Pooled HTTP session for the SALT portal with timeouts and retries.
+
+    All requests to the portal go through a single requests.Session, so connections are kept alive and reused. Failed
+    requests are retried on connection errors and on the given HTTP status codes with an exponential backoff with full
+    jitter. Sending the same block twice only replaces it on the server, so retrying submissions is safe.
+    """
+
+    def __init__(self, url: str, pool_size: int = 4, connect_timeout: float = 5., read_timeout: float = 60.,
+                 retries: int = 3, retry_backoff: float = 0.5, retry_backoff_max: float = 10.,
+                 retry_status: typing.Iterable[int] = (500, 502, 503, 504)):
+        """Creates a new session.
+
+        Args:
+            url: URL of SALT portal.
+            pool_size: Maximum number of connections to keep open.
+            connect_timeout: Timeout in seconds for establishing a connection.
+            read_timeout: Timeout in seconds for waiting for a response.
+            retries: Number of retries for failed requests.
+            retry_backoff: Base delay in seconds for backoff between retries.
+            retry_backoff_max: Maximum delay in seconds between retries.
+            retry_status: HTTP status codes to retry on.
+        """
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.retry_status = set(retry_status)
+
+        # create session with connection pool
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def from_config(cfg: dict) -> 'PortalSession':
+        """Creates a new session from the SALT facility settings.
+
+        Args:
+            cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+        Returns:
+            New session.
+        """
+        kwargs = {k: cfg[k] for k in ['pool_size', 'connect_timeout', 'read_timeout', 'retries', 'retry_backoff',
+                                      'retry_backoff_max', 'retry_status'] if k in cfg}
+        return PortalSession(cfg['portal_url'], **kwargs)
+
+    def backoff(self, attempt: int) -> float:
+        """Returns delay before next retry.
+
+        Args:
+            attempt: Number of failed attempt, starting at 0.
+
+        Returns:
+            Delay in seconds.
+        """
+        return backoff_delay(attempt, self.retry_backoff, self.retry_backoff_max)
+
+    def post(self, data: typing.Any, headers: typing.Dict[str, str] = None, stream: bool = False) \
+            -> requests.Response:
+        """Send a POST request to the portal.
+
+        Args:
+            data: Body of request. If it is a file-like object, it is rewound before each retry.
+            headers: Additional HTTP headers.
+            stream: If True, the body of the response is not downloaded immediately and the response must be closed.
+
+        Returns:
+            Response from server.
+
+        Raises:
+            requests.RequestException: If request failed even after all retries.
+        """
+
+        for attempt in range(self.retries + 1):
+            # rewind body for retries
+            if attempt > 0 and hasattr(data, 'seek'):
+                data.seek(0)
+
+            try:
+                # send request
+                response = self.session.post(self.url, data=data, headers=headers, timeout=self.timeout,
+                                             stream=stream)
+
+                # success or no retries left?
+                if response.status_code not in self.retry_status:
+                    return response
+                if attempt == self.retries:
+                    response.raise_for_status()
+                    return response
+                response.close()
+
+            except requests.ConnectionError:
+                # no retries left?
+                if attempt == self.retries:
+                    raise
+
+            # wait a little
+            time.sleep(self.backoff(attempt))
+
+    def close(self):
+        """Close all connections."""
+        self.session.close()
+
+
+def backoff_delay(attempt: int, backoff: float, backoff_max: float) -> float:
+    """Returns delay before next retry for an exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of failed attempt, starting at 0.
+        backoff: Base delay in seconds.
+        backoff_max: Maximum delay in seconds.
+
+    Returns:
+        Delay in seconds.
+    """
+    return random.uniform(0, min(backoff_max, backoff * 2 ** attempt))
+
+
+def _credentials(cfg: dict) -> typing.Dict[str, str]:
+    """Returns the encoded credentials for the portal.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+    Returns:
+        Parameters for username and password.
+    """
+    return {
+        'username': base64.b64encode(bytes(cfg['username'], 'utf-8')).decode('utf-8'),
+        'password': base64.b64encode(bytes(cfg['password'], 'utf-8')).decode('utf-8'),
+    }
+
+
+def submission_params(cfg: dict) -> typing.Dict[str, str]:
+    """Returns the parameters for submitting blocks via sendProposal.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+    Returns:
+        Form fields for request.
+    """
+    params = _credentials(cfg)
+    params.update({
+        'method': 'sendProposal',
+        'asyncCode': '',
+        'proposalCode': cfg['proposal_code'],
+        'emails': 'false',
+        'retainProposalStatus': 'false',
+        'semester': '2017-2',
+        'noValidation': 'false',
+        'blocksOnly': 'true'
+    })
+    return params
+
+
+class SubmissionResult(object):
+    """Result of a submission to the portal."""
+
+    def __init__(self, success: bool, error: str = None, proposal_code: str = None,
+                 block_codes: typing.List[str] = None):
+        """Creates a new result.
+
+        Args:
+            success: Whether the submission was successful.
+            error: Error message from server, if any.
+            proposal_code: Code of proposal, if returned by server.
+            block_codes: Codes of submitted blocks, if returned by server.
+        """
+        self.success = success
+        self.error = error
+        self.proposal_code = proposal_code
+        self.block_codes = block_codes if block_codes is not None else []
+
+    def raise_for_error(self):
+        """Raises a ValueError, if submission was not successful."""
+        if not self.success:
+            raise ValueError(self.error)
+
+
+class SubmissionResponseParser(object):
+    """Incremental parser for the response to a submission.
+
+    The response is fed chunk by chunk and parsing stops as soon as the result is known, i.e. after the Error element
+    for failed submissions, and after the BlockCodes element (or the end of the document) for successful ones. All
+    other elements are discarded while parsing, so memory usage does not depend on the size of the response.
+    """
+
+    def __init__(self):
+        """Creates a new parser."""
+        self._parser = ET.XMLPullParser(events=['start', 'end'])
+        self._root = None
+        self._depth = 0
+        self._result = None
+        self._proposal_code = None
+        self._block_codes = []
+
+    @property
+    def done(self) -> bool:
+        """Whether the result is known."""
+        return self._result is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Feed next chunk of response.
+
+        Args:
+            chunk: Next chunk of bytes.
+
+        Returns:
+            Whether the result is known, so that no more data is required.
+        """
+        if self._result is None:
+            try:
+                self._parser.feed(chunk)
+            except ET.ParseError as e:
+                raise ValueError('Invalid response from portal: %s' % e)
+            self._process()
+        return self._result is not None
+
+    def close(self) -> SubmissionResult:
+        """Finish parsing and return result.
+
+        Returns:
+            Result of submission.
+
+        Raises:
+            ValueError: If response could not be parsed.
+        """
+        if self._result is None:
+            try:
+                self._parser.close()
+            except ET.ParseError as e:
+                raise ValueError('Invalid response from portal: %s' % e)
+            self._process()
+        if self._result is None:
+            raise ValueError('Empty response from portal.')
+        return self._result
+
+    def _process(self):
+        """Process all pending events."""
+        for event, el in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._root is None:
+                    self._root = el
+                continue
+
+            # end of element
+            self._depth -= 1
+            if el is self._root:
+                # end of document
+                self._finish()
+                return
+            elif self._root.tag == 'Error':
+                # keep everything within an error
+                continue
+            elif el.tag == 'ProposalCode':
+                self._proposal_code = el.text
+            elif el.tag == 'BlockCode':
+                self._block_codes.append(el.text)
+            elif el.tag == 'BlockCodes':
+                self._finish()
+                return
+
+            # discard element
+            el.clear()
+            if self._depth == 1:
+                self._root.remove(el)
+
+    def _finish(self):
+        """Set result."""
+        if self._root.tag == 'Error':
+            self._result = SubmissionResult(False, error=''.join(self._root.itertext()).strip())
+        else:
+            self._result = SubmissionResult(True, proposal_code=self._proposal_code, block_codes=self._block_codes)
+
+
+def parse_submission_response(chunks: typing.Iterable[bytes]) -> SubmissionResult:
+    """Parses the response to a submission, stopping as soon as the result is known.
+
+    Args:
+        chunks: Chunks of response body.
+
+    Returns:
+        Result of submission.
+
+    Raises:
+        ValueError: If response could not be parsed.
+    """
+    parser = SubmissionResponseParser()
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    return parser.close()
+
+
+def status_params(cfg: dict, block_codes: typing.List[str]) -> typing.Dict[str, str]:
+    """Returns the parameters for querying the status of blocks.
+
+    The name of the method is taken from the 'status_method' setting. There is no default, since the method depends on
+    the portal, which must answer as described in parse_status_response().
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+        block_codes: Codes of blocks to query.
+
+    Returns:
+        Form fields for request.
+
+    Raises:
+        ValueError: If no method is configured.
+    """
+    if not cfg.get('status_method'):
+        raise ValueError('No portal method for status queries configured in status_method.')
+    params = _credentials(cfg)
+    params.update({
+        'method': cfg['status_method'],
+        'proposalCode': cfg['proposal_code'],
+        'blockCodes': ','.join(block_codes)
+    })
+    return params
+
+
+def parse_status_response(content: bytes) -> typing.Dict[str, str]:
+    """Parses the response to a status query, which looks like this:
+
+        <BlockStatuses>
+          <BlockStatus BlockCode="...">Active</BlockStatus>
+          ...
+        </BlockStatuses>
+
+    Args:
+        content: Body of response.
+
+    Returns:
+        Dictionary mapping block codes to their status.
+
+    Raises:
+        ValueError: If response contains an error.
+    """
+    root = ET.fromstring(content)
+    if root.tag == 'Error':
+        raise ValueError(root.text)
+    return {el.get('BlockCode'): el.text for el in root.iter('BlockStatus')}
+
+
+class StatusCache(object):
+    """Cache for block statuses, whose entries expire after a given time.
+
+    Statuses for all requested blocks that are not in the cache or have expired are fetched with a single call to the
+    given fetch function. Blocks that were not included in its result are cached as None.
+    """
+
+    def __init__(self):
+        """Initializes a new, empty cache."""
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, block_codes: typing.List[str], fetch: typing.Callable[[typing.List[str]], typing.Dict[str, str]],
+            ttl: float) -> typing.Dict[str, typing.Union[str, None]]:
+        """Returns statuses for the given blocks, fetching them if necessary.
+
+        Args:
+            block_codes: Codes of blocks.
+            fetch: Function for fetching statuses for a list of block codes.
+            ttl: Maximum age of cached entries in seconds.
+
+        Returns:
+            Dictionary mapping block codes to their status.
+        """
+
+        # find missing and expired entries
+        now = time.time()
+        with self._lock:
+            missing = [c for c in dict.fromkeys(block_codes)
+                       if c not in self._entries or self._entries[c][1] < now - ttl]
+
+        # fetch and store them
+        if missing:
+            fetched = fetch(missing)
+            with self._lock:
+                for code in missing:
+                    self._entries[code] = (fetched.get(code), now)
+
+        # return requested
+        with self._lock:
+            return {c: self._entries[c][0] for c in block_codes if c in self._entries}
+
+    def invalidate(self, block_codes: typing.List[str] = None):
+        """Remove entries from cache.
+
+        Args:
+            block_codes: Codes of blocks to remove, all if None.
+        """
+        with self._lock:
+            if block_codes is None:
+                self._entries.clear()
+            else:
+                for code in block_codes:
+                    self._entries.pop(code, None)
+
+
+"""Sessions shared in this process, see get_session()."""
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(cfg: dict) -> PortalSession:
+    """Returns the process-wide session for the given SALT facility settings.
+
+    Args:
+        cfg: Settings for SALT facility, i.e. FACILITIES['SALT'].
+
+    Returns:
+        Shared session, which is created on first call.
+    """
+    key = repr(sorted(cfg.items()))
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = PortalSession.from_config(cfg)
+        return _sessions[key]
+
+
+__all__ = ['PortalSession', 'StatusCache', 'SubmissionResult', 'SubmissionResponseParser', 'get_session',
+           'backoff_delay', 'submission_params', 'parse_submission_response', 'status_params', 'parse_status_response']
@@ -0,0 +1,10 @@
+"""Location of SALT with 'latitude' and 'longitude' in degrees and 'elevation' in metres, as given by
+SaltFacility.SITES. Kept in a module of its own, so that saltofi.observability can use it without importing Django."""
+SALT = {
+    'latitude': -32.376006,
+    'longitude': 20.810678,
+    'elevation': 1783
+}
+
+
+__all__ = ['SALT']
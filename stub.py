@@ -0,0 +1,319 @@
+import base64
+import email.parser
+import io
+import random
+import threading
+import time
+import typing
+import zipfile
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+
+class PortalStub(object):
+    """Local stand-in for the SALT portal, e.g. for testing and benchmarking.
+
+    It speaks the multipart protocol used by SaltFacility and supports submitting blocks via sendProposal and querying
+    their status. Submitted blocks are stored in memory with status 'Active'.
+
+    For load tests, it can simulate a slow and unreliable portal: Each response can be delayed, requests can fail with
+    an HTTP error, and requests beyond a given rate are throttled with a 503 response. Blocks can be rejected with an
+    error naming the block like the real portal does, or with a generic error. Which blocks are rejected only depends
+    on their block codes, so a rejected block is rejected again when it is resubmitted. With a password, all requests
+    with another one are rejected, like the real portal does for wrong credentials.
+
+    Use it as a context manager:
+
+        with PortalStub() as stub:
+            cfg['portal_url'] = stub.url
+            ...
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, status_method: str = 'getBlockStatus',
+                 latency: float = 0., jitter: float = 0., reject_rate: float = 0., failure_rate: float = 0.,
+                 max_rate: float = None, seed: int = None, reject_codes: typing.Iterable[str] = (),
+                 anonymous: bool = False, password: str = None):
+        """Creates a new stand-in portal.
+
+        Args:
+            host: Host to bind to.
+            port: Port to bind to, 0 for a random free port.
+            status_method: Name of method for status queries.
+            latency: Minimum delay in seconds before each response.
+            jitter: Maximum additional random delay in seconds.
+            reject_rate: Fraction of blocks to reject.
+            failure_rate: Probability for a request to fail with HTTP status 500.
+            max_rate: If given, maximum number of requests per second, all others are answered with HTTP status 503.
+            seed: Seed for random numbers.
+            reject_codes: Codes of blocks to reject in any case.
+            anonymous: If True, errors for rejected blocks do not name the block.
+            password: If given, requests with another password are rejected.
+        """
+        self.status_method = status_method
+        self.latency = latency
+        self.jitter = jitter
+        self.reject_rate = reject_rate
+        self.failure_rate = failure_rate
+        self.max_rate = max_rate
+        self.reject_codes = set(reject_codes)
+        self.anonymous = anonymous
+        self.password = password
+        self._random = random.Random(seed)
+
+        # token bucket for throttling, holding at most one second worth of requests
+        self._tokens = None if max_rate is None else max(1., max_rate)
+        self._tokens_time = time.monotonic()
+
+        # submitted blocks with their status, number of handled requests in total and per method, and number of
+        # requests that were failed or throttled on purpose
+        self.blocks = {}
+        self.requests = 0
+        self.calls = {}
+        self.failed = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+        # create server
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                # read body and handle it
+                body = self.rfile.read(int(self.headers.get('content-length', 0)))
+                status, content = stub.handle(self.headers.get('content-type', ''), body)
+
+                # send response
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def handle(self):
+                # clients may drop kept-alive connections at any time, e.g. after an error
+                try:
+                    BaseHTTPRequestHandler.handle(self)
+                except ConnectionResetError:
+                    pass
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """URL of stand-in portal."""
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d/' % (host, port)
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'PortalStub':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def set_status(self, block_code: str, status: str):
+        """Change status of a block, e.g. to simulate its observation.
+
+        Args:
+            block_code: Code of block.
+            status: New status like 'Completed' or 'Expired'.
+        """
+        with self._lock:
+            self.blocks[block_code] = status
+
+    def handle(self, content_type: str, body: bytes) -> typing.Tuple[int, bytes]:
+        """Handle a request.
+
+        Args:
+            content_type: Content type of request.
+            body: Body of request.
+
+        Returns:
+            HTTP status and body of response.
+        """
+        with self._lock:
+            self.requests += 1
+
+            # throttle or fail?
+            if not self._take_token():
+                self.throttled += 1
+                return 503, PortalStub.error('Too many requests.')
+            if self.failure_rate > 0 and self._random.random() < self.failure_rate:
+                self.failed += 1
+                return 500, PortalStub.error('Internal server error.')
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter > 0 else self.latency
+
+        # simulate latency
+        if delay > 0:
+            time.sleep(delay)
+
+        # parse multipart body
+        fields, files = PortalStub._parse_multipart(content_type, body)
+
+        # call method
+        method = fields.get('method')
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.password is not None and \
+                base64.b64decode(fields.get('password', '')).decode('utf-8', 'replace') != self.password:
+            return 200, PortalStub.error('Invalid username or password.')
+        if method == 'sendProposal':
+            return self._send_proposal(fields, files)
+        elif method == self.status_method:
+            return self._block_status(fields)
+        else:
+            return 200, PortalStub.error('Unknown method %s.' % method)
+
+    def _take_token(self) -> bool:
+        """Take a token from the bucket for throttling, must be called with lock held.
+
+        Returns:
+            Whether a token was available, i.e. whether the request is allowed.
+        """
+        if self.max_rate is None:
+            return True
+
+        # refill bucket
+        now = time.monotonic()
+        self._tokens = min(max(1., self.max_rate), self._tokens + (now - self._tokens_time) * self.max_rate)
+        self._tokens_time = now
+
+        # take token
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def rejects(self, block_code: str) -> bool:
+        """Whether a block is rejected, which only depends on its code and the reject rate.
+
+        Args:
+            block_code: Code of block.
+
+        Returns:
+            True, if block will be rejected.
+        """
+        if block_code in self.reject_codes:
+            return True
+        return zlib.crc32(block_code.encode('utf-8')) / 2. ** 32 < self.reject_rate
+
+    def _send_proposal(self, fields: typing.Dict[str, str], files: typing.List[bytes]) -> typing.Tuple[int, bytes]:
+        """Store all blocks in the uploaded ZIP files.
+
+        Args:
+            fields: Form fields of request.
+            files: Uploaded files.
+
+        Returns:
+            HTTP status and body of response.
+        """
+
+        # collect block codes from all XML files in all ZIP files
+        codes = []
+        try:
+            for f in files:
+                with zipfile.ZipFile(io.BytesIO(f)) as zf:
+                    for name in zf.namelist():
+                        if name.endswith('.xml'):
+                            root = ET.fromstring(zf.read(name))
+                            code = next((el.text for el in root if el.tag.endswith('}BlockCode')), None)
+                            if not code:
+                                return 200, PortalStub.error('Block in %s has no BlockCode.' % name)
+                            codes.append(code)
+        except (zipfile.BadZipFile, ET.ParseError) as e:
+            return 200, PortalStub.error('Invalid proposal: %s' % e)
+        if not codes:
+            return 200, PortalStub.error('No blocks found.')
+
+        # reject a block? the whole proposal fails then
+        rejected = next((c for c in codes if self.rejects(c)), None)
+        if rejected is not None:
+            if self.anonymous:
+                return 200, PortalStub.error('Block is invalid: The requested observing time is not available.')
+            return 200, PortalStub.error('Block %s is invalid: The requested observing time is not available.' %
+                                         rejected)
+
+        # store them
+        with self._lock:
+            for code in codes:
+                self.blocks[code] = 'Active'
+
+        # success
+        return 200, ('<Success><ProposalCode>%s</ProposalCode><BlockCodes>%s</BlockCodes></Success>' %
+                     (escape(fields.get('proposalCode', '')),
+                      ''.join('<BlockCode>%s</BlockCode>' % escape(c) for c in codes))).encode('utf-8')
+
+    def _block_status(self, fields: typing.Dict[str, str]) -> typing.Tuple[int, bytes]:
+        """Return status of requested blocks.
+
+        Args:
+            fields: Form fields of request.
+
+        Returns:
+            HTTP status and body of response.
+        """
+        codes = [c for c in fields.get('blockCodes', '').split(',') if c]
+        with self._lock:
+            statuses = [(c, self.blocks[c]) for c in codes if c in self.blocks]
+        return 200, ('<BlockStatuses>%s</BlockStatuses>' %
+                     ''.join('<BlockStatus BlockCode=%s>%s</BlockStatus>' % (quoteattr(c), escape(s))
+                             for c, s in statuses)).encode('utf-8')
+
+    @staticmethod
+    def error(message: str) -> bytes:
+        """Returns an error response.
+
+        Args:
+            message: Error message.
+
+        Returns:
+            Body of response.
+        """
+        return ('<Error>%s</Error>' % escape(message)).encode('utf-8')
+
+    @staticmethod
+    def _parse_multipart(content_type: str, body: bytes) -> typing.Tuple[typing.Dict[str, str], typing.List[bytes]]:
+        """Parse a multipart/form-data body.
+
+        Args:
+            content_type: Content type of request including boundary.
+            body: Body of request.
+
+        Returns:
+            Form fields and contents of uploaded files.
+        """
+        msg = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode('ascii') +
+                                                    b'\r\n\r\n' + body)
+        fields, files = {}, []
+        if msg.is_multipart():
+            for part in msg.get_payload():
+                payload = part.get_payload(decode=True)
+                if part.get_filename() is not None:
+                    files.append(payload)
+                else:
+                    fields[part.get_param('name', header='content-disposition')] = payload.decode('utf-8')
+        return fields, files
+
+
+__all__ = ['PortalStub']
@@ -0,0 +1,11 @@
+def pytest_configure(config):
+    """Configures minimal Django settings for the facility, if Django is installed and we're not running within a
+    TOM."""
+    try:
+        import django
+        from django.conf import settings
+    except ImportError:
+        return
+    if not settings.configured:
+        settings.configure(FACILITIES={}, USE_TZ=True)
+        django.setup()
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import threading
+import typing
+import zipfile
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from saltofi.aioportal import AsyncPortalClient
+from saltofi.portal import SubmissionResult
+from saltofi.stub import PortalStub
+
+
+class CountingStub(PortalStub):
+    """Stand-in portal that records the maximum number of requests handled at the same time."""
+
+    def __init__(self, **kwargs):
+        PortalStub.__init__(self, **kwargs)
+        self.active = 0
+        self.max_active = 0
+        self._active_lock = threading.Lock()
+
+    def handle(self, content_type: str, body: bytes) -> typing.Tuple[int, bytes]:
+        with self._active_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            return PortalStub.handle(self, content_type, body)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+class FlakyStub(PortalStub):
+    """Stand-in portal that answers the first requests with the given HTTP errors."""
+
+    def __init__(self, errors: typing.List[int], **kwargs):
+        PortalStub.__init__(self, **kwargs)
+        self.errors = list(errors)
+
+    def handle(self, content_type: str, body: bytes) -> typing.Tuple[int, bytes]:
+        with self._lock:
+            status = self.errors.pop(0) if self.errors else None
+        if status is not None:
+            return status, PortalStub.error('Temporary failure.')
+        return PortalStub.handle(self, content_type, body)
+
+
+def _zip(block_code: str) -> bytes:
+    """Returns a ZIP file with a minimal block.
+
+    Args:
+        block_code: Code of block.
+
+    Returns:
+        ZIP file as bytes.
+    """
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('Block.xml', '<Block xmlns="http://www.salt.ac.za/PIPT/Proposal/Phase2/4.9">'
+                                 '<BlockCode>%s</BlockCode></Block>' % block_code)
+    return f.getvalue()
+
+
+def _cfg(stub: PortalStub, **kwargs) -> dict:
+    """Returns settings for the given stand-in portal.
+
+    Args:
+        stub: Stand-in portal.
+        **kwargs: Additional settings.
+
+    Returns:
+        Settings for SALT facility.
+    """
+    cfg = {'portal_url': stub.url, 'username': 'user', 'password': 'pass', 'proposal_code': '2020-1-TEST-001',
+           'retry_backoff': 0.01, 'retry_backoff_max': 0.05}
+    cfg.update(kwargs)
+    return cfg
+
+
+def _submit_many(cfg: dict, zip_files: typing.List[bytes]) -> typing.List[typing.Union[SubmissionResult, Exception]]:
+    """Submits the given ZIP files with a new client.
+
+    Args:
+        cfg: Settings for SALT facility.
+        zip_files: ZIP files to submit.
+
+    Returns:
+        Results from AsyncPortalClient.submit_many().
+    """
+    async def submit():
+        async with AsyncPortalClient.from_config(cfg) as client:
+            return await client.submit_many(zip_files)
+    return asyncio.run(submit())
+
+
+def test_submit_many():
+    with PortalStub() as stub:
+        results = _submit_many(_cfg(stub), [_zip('B%d' % i) for i in range(5)])
+    assert all(isinstance(r, SubmissionResult) and r.success for r in results)
+    assert [r.block_codes for r in results] == [['B%d' % i] for i in range(5)]
+    assert set(stub.blocks) == {'B%d' % i for i in range(5)}
+
+
+def test_concurrency_limit():
+    with CountingStub(latency=0.2) as stub:
+        results = _submit_many(_cfg(stub, concurrency=3), [_zip('B%d' % i) for i in range(9)])
+    assert all(isinstance(r, SubmissionResult) for r in results)
+
+    # requests overlapped, but never more than allowed
+    assert stub.max_active == 3
+
+
+def test_deadline():
+    with PortalStub(latency=1.) as stub:
+        results = _submit_many(_cfg(stub, deadline=0.2, retries=0), [_zip('B0'), _zip('B1')])
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+
+
+def test_deadline_includes_waiting_for_slot():
+    with PortalStub(latency=0.3) as stub:
+        results = _submit_many(_cfg(stub, concurrency=1, deadline=0.5, retries=0), [_zip('B0'), _zip('B1')])
+
+    # first request finishes, second one waits for the slot and then runs out of time
+    assert isinstance(results[0], SubmissionResult)
+    assert isinstance(results[1], asyncio.TimeoutError)
+
+
+@pytest.mark.parametrize('errors', [[500], [503], [500, 503, 500]])
+def test_retry_on_server_error(errors):
+    with FlakyStub(errors) as stub:
+        results = _submit_many(_cfg(stub, retries=3), [_zip('B0')])
+    assert isinstance(results[0], SubmissionResult) and results[0].block_codes == ['B0']
+    assert stub.requests == 1 and stub.errors == []
+    assert stub.blocks == {'B0': 'Active'}
+
+
+def test_retries_exhausted():
+    import aiohttp
+    with FlakyStub([503, 503, 503]) as stub:
+        results = _submit_many(_cfg(stub, retries=2), [_zip('B0')])
+    assert isinstance(results[0], aiohttp.ClientResponseError) and results[0].status == 503
+    assert stub.blocks == {}
+
+
+def test_rejected_block():
+    with PortalStub(reject_rate=1.) as stub:
+        results = _submit_many(_cfg(stub), [_zip('B0'), _zip('B1')])
+    assert all(isinstance(r, ValueError) for r in results)
+    assert 'B0' in str(results[0]) and 'B1' in str(results[1])
+    assert stub.blocks == {}
@@ -0,0 +1,110 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('lxml')
+
+from saltofi.xml import Block
+from saltofi.xml.backend import Backend, ElementTreeBackend, LxmlBackend, available_backends
+
+"""Template used for all tests."""
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'grb.xml')
+
+
+def _render(backend: str, modify=None) -> bytes:
+    """Loads the template with the given backend, modifies it and serializes it.
+
+    Args:
+        backend: Name of backend.
+        modify: If given, function that is called with the block before serializing it.
+
+    Returns:
+        Serialized XML.
+    """
+    block = Block(TEMPLATE, backend=backend)
+    assert block.backend.name == backend
+    if modify is not None:
+        modify(block)
+    return block.to_string()
+
+
+def _modify_block(block: Block):
+    """Changes the values of the block and its target."""
+    block.name = 'GRB 200101A & co'
+    block.code = 'a2a5c9e4-0b4e-4a3f-9d1e-0c7c1b2f3e4d'
+    block.comment = 'Follow-up <urgent>'
+    block.year, block.semester = 2020, 1
+    block.max_lunar_phase = 80
+    block.min_lunar_distance = 30
+    target = block.targets[0]
+    target.name = 'GRB 200101A'
+    target.code = '0f6b2f2e-7f5c-4a53-8f0e-6d5b9f3c2a1b'
+    target.mag_filter = 'R'
+
+
+def _append_finding_charts(block: Block):
+    """Replaces the finding chart of the target by two new ones."""
+    block.targets[0].finding_charts = ['chart1.pdf', 'chart2.pdf']
+
+
+def _remove_finding_charts(block: Block):
+    """Removes all finding charts of the target."""
+    block.targets[0].finding_charts = []
+
+
+def _all(block: Block):
+    """Applies all modifications."""
+    _modify_block(block)
+    _append_finding_charts(block)
+    _remove_finding_charts(block)
+    _append_finding_charts(block)
+
+
+@pytest.mark.parametrize('modify', [None, _modify_block, _append_finding_charts, _remove_finding_charts, _all])
+def test_backends_produce_identical_output(modify):
+    assert set(available_backends()) == {'etree', 'lxml'}
+    etree = _render('etree', modify)
+    lxml = _render('lxml', modify)
+    assert etree == lxml
+
+
+def test_finding_charts():
+    for backend in ('etree', 'lxml'):
+        block = Block(TEMPLATE, backend=backend)
+        _append_finding_charts(block)
+        assert block.targets[0].finding_charts == ['chart1.pdf', 'chart2.pdf']
+        _remove_finding_charts(block)
+        assert block.targets[0].finding_charts == []
+        assert b'FindingChart' not in block.to_string()
+
+
+def test_template_copies_produce_identical_output():
+    etree = Block.from_template(TEMPLATE, backend='etree')
+    lxml = Block.from_template(TEMPLATE, backend='lxml')
+    for block in (etree, lxml):
+        _all(block)
+    xml = etree.to_string()
+    assert xml == lxml.to_string()
+    assert b'GRB 200101A &amp; co' in xml and b'chart2.pdf' in xml
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        Backend()
+
+    class Incomplete(Backend):
+        def is_element(self, obj):
+            return False
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert isinstance(ElementTreeBackend(), Backend)
+    assert isinstance(LxmlBackend(), Backend)
+
+
+def test_lxml_imported_lazily():
+    code = ('import sys; from saltofi.xml import Block; from saltofi.xml.backend import get_backend; '
+            'assert "lxml" not in sys.modules; get_backend("lxml"); assert "lxml" in sys.modules')
+    subprocess.run([sys.executable, '-c', code], check=True, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
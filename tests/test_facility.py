@@ -0,0 +1,228 @@
+import time
+import typing
+
+import pytest
+
+pytest.importorskip('tom_observations')
+
+from django.conf import settings
+
+from saltofi.facility import SaltFacility, SaltFacilityGrbForm, SubmissionError
+from saltofi.stub import PortalStub
+
+
+@pytest.fixture
+def stub(monkeypatch) -> typing.Iterator[PortalStub]:
+    """Yields a stand-in portal with bad blocks B3 and B12, which is configured as SALT portal."""
+    with PortalStub(reject_codes=['B3', 'B12'], anonymous=True, password='secret') as stub:
+        monkeypatch.setattr(settings, 'FACILITIES', {'SALT': {
+            'portal_url': stub.url, 'username': 'user', 'password': 'secret', 'proposal_code': '2020-1-TEST-001',
+            'retries': 0}}, raising=False)
+        yield stub
+
+
+def _payloads(codes: typing.List[str]) -> typing.List[dict]:
+    """Returns payloads with minimal blocks.
+
+    Args:
+        codes: Codes of blocks.
+
+    Returns:
+        List of payloads.
+    """
+    return [{'block_code': c, 'xml': '<Block xmlns="http://www.salt.ac.za/PIPT/Proposal/Phase2/4.9">'
+                                     '<BlockCode>%s</BlockCode></Block>' % c} for c in codes]
+
+
+def test_submit_batch(stub):
+    codes = ['B%d' % i for i in range(16) if i not in (3, 12)]
+    assert SaltFacility().submit_observations(_payloads(codes)) == codes
+    assert stub.calls == {'sendProposal': 1}
+    assert set(stub.blocks) == set(codes)
+
+
+def test_named_block(stub):
+    stub.anonymous = False
+    with pytest.raises(SubmissionError) as e:
+        SaltFacility().submit_observations(_payloads(['B%d' % i for i in range(10)]))
+    assert e.value.block_code == 'B3' and e.value.index == 3
+    assert stub.calls == {'sendProposal': 1}
+
+
+def test_anonymous_bad_block(stub):
+    with pytest.raises(SubmissionError) as e:
+        SaltFacility().submit_observations(_payloads(['B%d' % i for i in range(10)]))
+    assert e.value.block_code == 'B3' and e.value.index == 3
+    assert set(e.value.submitted) == set(stub.blocks) and 'B3' not in stub.blocks
+
+
+def test_anonymous_bad_blocks_in_both_halves(stub):
+    with pytest.raises(SubmissionError) as e:
+        SaltFacility().submit_observations(_payloads(['B%d' % i for i in range(16)]))
+
+    # one of the bad blocks is blamed, and good blocks were submitted on the way
+    assert e.value.block_code in ('B3', 'B12')
+    assert stub.blocks and not {'B3', 'B12'} & set(stub.blocks)
+    assert set(e.value.submitted) == set(stub.blocks)
+
+
+def test_global_error(stub):
+    settings.FACILITIES['SALT']['password'] = 'wrong'
+    with pytest.raises(ValueError) as e:
+        SaltFacility().submit_observations(_payloads(['B%d' % i for i in range(16)]))
+
+    # not blamed on a block and found with a few requests
+    assert not isinstance(e.value, SubmissionError)
+    assert 'password' in str(e.value)
+    assert stub.calls['sendProposal'] <= 5 and not stub.blocks
+
+
+class _Records(list):
+    """Stand-in for the query set of observation records, supporting the methods used by the facility."""
+
+    def filter(self, **kwargs):
+        return _Records(r for r in self if all(getattr(r, k) == v for k, v in kwargs.items()))
+
+    def exclude(self, status__in):
+        return _Records(r for r in self if r.status not in status__in)
+
+    def only(self, *fields):
+        return self
+
+
+class _Record(object):
+    """Stand-in for an observation record."""
+
+    def __init__(self, observation_id: str, status: str, target: int = 1):
+        self.id, self.observation_id, self.status, self.target = observation_id, observation_id, status, target
+        self.facility = 'SALT'
+
+
+@pytest.fixture
+def statuses(stub) -> typing.Iterator[PortalStub]:
+    """Yields the stand-in portal, configured for status queries, with an empty status cache."""
+    settings.FACILITIES['SALT'].update({'status_method': stub.status_method, 'status_batch_size': 20})
+    SaltFacility.status_cache.invalidate()
+    yield stub
+    SaltFacility.status_cache.invalidate()
+
+
+def test_block_statuses_grouped(statuses):
+    codes = ['B%d' % i for i in range(50)]
+    for c in codes[:40]:
+        statuses.set_status(c, 'Completed')
+    assert SaltFacility().get_block_statuses(codes) == dict({c: 'Completed' for c in codes[:40]},
+                                                           **{c: None for c in codes[40:]})
+    assert statuses.calls == {'getBlockStatus': 3}
+
+    # all cached, also unknown blocks
+    for c in codes:
+        SaltFacility().get_observation_status(c)
+    assert statuses.calls == {'getBlockStatus': 3}
+
+
+def test_block_statuses_expire(statuses):
+    settings.FACILITIES['SALT']['status_ttl'] = 0.1
+    statuses.set_status('B0', 'Active')
+    assert SaltFacility().get_block_statuses(['B0']) == {'B0': 'Active'}
+    statuses.set_status('B0', 'Completed')
+    assert SaltFacility().get_block_statuses(['B0']) == {'B0': 'Active'}
+    time.sleep(0.2)
+    assert SaltFacility().get_block_statuses(['B0']) == {'B0': 'Completed'}
+    assert statuses.calls == {'getBlockStatus': 2}
+
+
+@pytest.mark.parametrize('block_status,state', list(SaltFacility.BLOCK_STATES.items()) + [('Unknown', 'IN_PROGRESS')])
+def test_block_states(statuses, block_status, state):
+    statuses.set_status('B0', block_status)
+    assert SaltFacility().get_observation_status('B0')['state'] == state
+
+    # unknown to portal
+    assert SaltFacility().get_observation_status('B1')['state'] == 'IN_PROGRESS'
+
+
+def test_update_all_observation_statuses(statuses, monkeypatch):
+    from tom_observations.models import ObservationRecord
+    records = _Records([_Record('B0', 'IN_PROGRESS'), _Record('B1', 'IN_PROGRESS'), _Record('B2', 'PENDING'),
+                        _Record('B3', 'COMPLETED'), _Record('B4', 'IN_PROGRESS', target=2)])
+    monkeypatch.setattr(ObservationRecord, 'objects', records, raising=False)
+    for code, status in [('B0', 'Completed'), ('B1', 'Active'), ('B2', 'Active'), ('B3', 'Active'),
+                         ('B4', 'Expired')]:
+        statuses.set_status(code, status)
+
+    # changed records go through update_observation_status(), which saves them and runs the hook
+    updated = []
+    monkeypatch.setattr(SaltFacility, 'update_observation_status', lambda self, o: updated.append(o), raising=False)
+    assert SaltFacility().update_all_observation_statuses() == []
+    assert updated == ['B0', 'B2', 'B4']
+    assert statuses.calls == {'getBlockStatus': 1}
+
+    # only for given target, failures are reported
+    def fail(self, observation_id):
+        raise ValueError('Hook failed.')
+    monkeypatch.setattr(SaltFacility, 'update_observation_status', fail)
+    assert SaltFacility().update_all_observation_statuses(target=2) == [('B4', 'Hook failed.')]
+
+
+class _Target(object):
+    """Stand-in for a TOM target."""
+
+    def __init__(self, id: int, name: str, ra: float, dec: float):
+        self.id, self.name, self.ra, self.dec = id, name, ra, dec
+
+
+@pytest.mark.parametrize('check', [None, 'flag'])
+def test_observability_opt_in(stub, check):
+    pytest.importorskip('astropy')
+    if check is not None:
+        settings.FACILITIES['SALT']['observability'] = check
+    payloads = SaltFacilityGrbForm.create_payloads([_Target(1, 'GRB 1', 10., -30.), _Target(2, 'GRB 2', 10., 60.)])
+    if check is None:
+        assert all('observable' not in p for p in payloads)
+    else:
+        assert payloads[1]['observable'] is False
+
+
+class FailingStub(PortalStub):
+    """Stand-in portal that answers all requests containing one of the given block codes with HTTP status 500."""
+
+    def __init__(self, fail_codes: typing.List[str], **kwargs):
+        PortalStub.__init__(self, **kwargs)
+        self.fail_codes = fail_codes
+
+    def handle(self, content_type: str, body: bytes) -> typing.Tuple[int, bytes]:
+        if any(('<BlockCode>%s</BlockCode>' % c).encode('utf-8') in body for c in self.fail_codes):
+            return 500, PortalStub.error('Internal error.')
+        return PortalStub.handle(self, content_type, body)
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_claims_kept_for_sent_blocks(monkeypatch, tmp_path, concurrency):
+    if concurrency > 1:
+        pytest.importorskip('aiohttp')
+
+    def payloads(prefix: str) -> typing.List[dict]:
+        # blocks with different content, which would be duplicates of each other otherwise
+        return [{'block_code': '%s%d' % (prefix, i),
+                 'xml': '<Block xmlns="http://www.salt.ac.za/PIPT/Proposal/Phase2/4.9"><BlockCode>%s%d</BlockCode>'
+                        '<Priority>%d</Priority></Block>' % (prefix, i, i)} for i in range(4)]
+
+    with FailingStub(['B2']) as stub:
+        monkeypatch.setattr(settings, 'FACILITIES', {'SALT': {
+            'portal_url': stub.url, 'username': 'user', 'password': 'pass', 'proposal_code': '2020-1-TEST-001',
+            'retries': 0, 'retry_backoff': 0.01, 'max_archive_size': 1, 'concurrency': concurrency,
+            'dedup': str(tmp_path / 'dedup.db')}}, raising=False)
+
+        # HTTP error for B2, which might have reached SALT, all blocks before it and concurrently sent ones are known
+        with pytest.raises(Exception) as e:
+            SaltFacility().submit_observations(payloads('B'))
+        assert not isinstance(e.value, ValueError)
+        assert e.value.unconfirmed == ['B2']
+        assert set(e.value.submitted) == set(stub.blocks)
+        assert {'B0', 'B1'} <= set(stub.blocks) and 'B2' not in stub.blocks
+
+        # only the claim of a block that was never sent has been released
+        sent = set(stub.blocks) | {'B2'}
+        codes = SaltFacility().submit_observations(payloads('C'))
+        assert codes == ['B%d' % i if 'B%d' % i in sent else 'C%d' % i for i in range(4)]
+        assert set(stub.blocks) == sent - {'B2'} | set(codes) - sent
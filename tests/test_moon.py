@@ -0,0 +1,64 @@
+import typing
+
+import numpy as np
+import pytest
+
+from saltofi import moon
+from saltofi.moon import EphemerisCache, LunarEphemeris
+
+
+@pytest.fixture
+def computed(monkeypatch) -> typing.List[typing.Tuple[int, int]]:
+    """Replaces the computation of tables by small dummy tables, yields the list of computed semesters."""
+    semesters = []
+
+    def compute(year: int, semester: int) -> typing.Dict[str, np.ndarray]:
+        semesters.append((year, semester))
+        return {name: np.arange(10.) + year * 10 + semester for name in LunarEphemeris.COLUMNS}
+
+    monkeypatch.setattr(LunarEphemeris, '_compute', staticmethod(compute))
+    return semesters
+
+
+def test_cache_hit(tmp_path, computed):
+    cache = EphemerisCache(str(tmp_path))
+    table = cache.get(2024, 1)
+    assert cache.get(2024, 1) is table
+    assert computed == [(2024, 1)]
+
+    # another process loads the stored table instead of computing it
+    loaded = EphemerisCache(str(tmp_path)).get(2024, 1)
+    assert computed == [(2024, 1)]
+    assert all(np.array_equal(getattr(loaded, c), getattr(table, c)) for c in LunarEphemeris.COLUMNS)
+
+
+def test_cache_expiry(tmp_path, computed):
+    cache = EphemerisCache(str(tmp_path))
+    first = cache.get(2024, 1)
+    for semester in [(2024, 2), (2025, 1), (2024, 1), (2025, 2)]:
+        cache.get(*semester)
+
+    # least recently used table was dropped from memory and is loaded from disk again
+    assert cache.get(2024, 1) is first
+    assert cache.get(2024, 2) is not None and len(cache._tables) == EphemerisCache.MAX_SIZE
+    assert computed == [(2024, 1), (2024, 2), (2025, 1), (2025, 2)]
+
+
+def test_cache_other_version(tmp_path, computed, monkeypatch):
+    EphemerisCache(str(tmp_path)).get(2024, 1)
+    monkeypatch.setattr(moon, 'TABLE_VERSION', moon.TABLE_VERSION + 1)
+    EphemerisCache(str(tmp_path)).get(2024, 1)
+    assert computed == [(2024, 1), (2024, 1)]
+
+
+@pytest.mark.parametrize('content', [b'', b'garbage', b'PK\x03\x04broken'])
+def test_corrupt_file(tmp_path, computed, content):
+    filename = LunarEphemeris.filename(str(tmp_path), 2024, 1)
+    with open(filename, 'wb') as f:
+        f.write(content)
+
+    # table is built again and replaces the broken file
+    table = EphemerisCache(str(tmp_path)).get(2024, 1)
+    assert computed == [(2024, 1)]
+    loaded = LunarEphemeris.load(filename, 2024, 1)
+    assert np.array_equal(loaded.jd, table.jd)
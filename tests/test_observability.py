@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from saltofi.observability import MAX_ALTITUDE, MIN_ALTITUDE, altitude, nights, observable, windows, windows_between
+
+"""Night used for all tests."""
+DATE = datetime.date(2024, 6, 15)
+
+
+def _minutes_in_annulus(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    """Counts the minutes of dark time, in which targets are within the accessible annulus, on the grid of the night.
+
+    Args:
+        ra: Right ascensions in degrees.
+        dec: Declinations in degrees.
+
+    Returns:
+        Number of minutes for all targets.
+    """
+    night = nights.get(DATE)
+    alt = altitude(ra[:, None] / 15., dec[:, None], night.lst[None, :])
+    inside = (alt >= MIN_ALTITUDE) & (alt <= MAX_ALTITUDE) & night.dark[None, :]
+    return inside[:, :-1].sum(axis=1)
+
+
+def test_windows_match_grid():
+    rng = np.random.default_rng(42)
+    ra, dec = rng.uniform(0., 360., 500), rng.uniform(-90., 30., 500)
+    w = windows(ra, dec, DATE)
+    minutes = _minutes_in_annulus(ra, dec)
+
+    # durations agree within a few grid steps, and so does observability, except for very short windows
+    assert np.all(np.abs(w.duration * 60. - minutes) <= 3.)
+    certain = (minutes > 3) | (w.duration * 60. > 3.)
+    assert np.array_equal(w.observable[certain], minutes[certain] > 0)
+    assert w.observable.any() and not w.observable.all()
+
+
+@pytest.mark.parametrize('dec,expected', [(-32.4, True), (60., False), (-89.9, False)])
+def test_windows_special_declinations(dec, expected):
+    # through the zenith, never rising, and always below the annulus near the pole
+    ra = np.arange(0., 360., 15.)
+    assert windows(ra, np.full(len(ra), dec), DATE).observable.any() == expected
+
+
+def test_windows_clipped():
+    night = nights.get(DATE)
+    ra, dec = np.arange(0., 360., 10.), np.full(36, -30.)
+    middle = (night.dusk + night.dawn) / 2.
+    w = windows(ra, dec, DATE, start=middle)
+    for track in (w.east, w.west):
+        assert np.all(np.isnan(track) | (track >= middle))
+
+    # nothing after dawn
+    assert not windows(ra, dec, DATE, start=night.dawn + 0.01).observable.any()
+
+
+def test_observable():
+    night = nights.get(DATE)
+    rng = np.random.default_rng(1)
+    ra, dec = rng.uniform(0., 360., 200), rng.uniform(-90., 30., 200)
+
+    # same as union of windows of all nights in range
+    start = night.dusk - 0.5
+    expected = np.zeros(len(ra), dtype=bool)
+    for w in windows_between(ra, dec, start, start + 2.):
+        expected |= w.observable
+    assert np.array_equal(observable(ra, dec, start, 48.), expected)
+
+    # nothing during daytime
+    assert not observable(ra, dec, night.dawn + 0.01, 1.).any()
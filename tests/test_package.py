@@ -0,0 +1,100 @@
+import io
+import os
+import struct
+import zipfile
+
+import pytest
+
+from saltofi.xml import ProposalPackage
+
+"""Format of a local file header, see the ZIP specification."""
+LOCAL_HEADER = '<4s2B4HL2L2H'
+
+
+def _package(**kwargs) -> io.BytesIO:
+    """Returns a ZIP file with a stored, a deflated and a ZIP64 member.
+
+    Args:
+        **kwargs: Arguments for ZipFile.
+
+    Returns:
+        ZIP file.
+    """
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', **kwargs) as zf:
+        zf.writestr('Block.xml', b'<Block xmlns="http://www.salt.ac.za/PIPT/Proposal/Phase2/4.9"/>')
+        zf.writestr('Included/stored.bin', os.urandom(5000), compress_type=zipfile.ZIP_STORED)
+        zf.writestr('Included/deflated.txt', b'finding chart ' * 1000, compress_type=zipfile.ZIP_DEFLATED)
+        with zf.open('Included/zip64.bin', 'w', force_zip64=True) as m:
+            m.write(os.urandom(300))
+    f.seek(0)
+    return f
+
+
+def _zip64_fields(data: bytes, info: zipfile.ZipInfo) -> int:
+    """Returns the number of ZIP64 fields in the local header of a member.
+
+    Args:
+        data: ZIP file.
+        info: Info for member.
+
+    Returns:
+        Number of fields.
+    """
+    header = struct.unpack(LOCAL_HEADER, data[info.header_offset:info.header_offset + struct.calcsize(LOCAL_HEADER)])
+    start = info.header_offset + struct.calcsize(LOCAL_HEADER) + header[10]
+    extra, count, i = data[start:start + header[11]], 0, 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[i:i + 4])
+        count += header_id == 1
+        i += 4 + size
+    return count
+
+
+def _round_trip(source: io.BytesIO) -> bytes:
+    """Writes the given package unchanged into a new ZIP file and compares all members.
+
+    Args:
+        source: ZIP file.
+
+    Returns:
+        New ZIP file.
+    """
+    target = io.BytesIO()
+    with ProposalPackage(source) as package:
+        package.write(target, compression=zipfile.ZIP_STORED)
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(target) as dst:
+        assert dst.testzip() is None
+        assert dst.namelist() == src.namelist()
+        for info in src.infolist():
+            new_info = dst.getinfo(info.filename)
+            assert (new_info.CRC, new_info.file_size, new_info.compress_type) == \
+                   (info.CRC, info.file_size, info.compress_type)
+            assert dst.read(info.filename) == src.read(info.filename)
+            assert _zip64_fields(target.getvalue(), new_info) <= 1
+    return target.getvalue()
+
+
+def test_copy_raw():
+    source = _package()
+    _round_trip(source)
+
+    # data is copied without compressing it again
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(io.BytesIO(_round_trip(source))) as dst:
+        assert [i.compress_size for i in dst.infolist()] == [i.compress_size for i in src.infolist()]
+
+
+def test_copy_raw_zip64(monkeypatch):
+    # all members larger than the limit are written and copied with ZIP64 extensions
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 1000)
+    target = _round_trip(_package())
+    with zipfile.ZipFile(io.BytesIO(target)) as dst:
+        assert _zip64_fields(target, dst.getinfo('Included/stored.bin')) == 1
+
+
+@pytest.mark.parametrize('zip64_limit', [None, 1000])
+def test_copy_without_private_attributes(monkeypatch, zip64_limit):
+    if zip64_limit is not None:
+        monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', zip64_limit)
+    monkeypatch.setattr(ProposalPackage, '_RAW_ZIP_ATTRIBUTES', ProposalPackage._RAW_ZIP_ATTRIBUTES + ('_missing',))
+    _round_trip(_package())
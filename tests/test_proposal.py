@@ -0,0 +1,20 @@
+import io
+
+from saltofi.xml import Proposal
+
+"""Proposal with two blocks and namespaces that must be escaped when reading a single block."""
+PROPOSAL = (b'<?xml version="1.0" encoding="UTF-8"?>'
+            b'<Proposal xmlns="http://www.salt.ac.za/PIPT/Proposal/Phase2/4.9"'
+            b' xmlns:x="urn:x?a=1&amp;b=&quot;&lt;&#9;">'
+            b'<Block><BlockCode>B0</BlockCode><x:Comment>first</x:Comment></Block>'
+            b'<Block><BlockCode>B1</BlockCode><x:Comment>second</x:Comment></Block>'
+            b'</Proposal>')
+
+
+def test_get_block_with_escaped_namespaces():
+    proposal = Proposal(io.BytesIO(PROPOSAL))
+    assert proposal.block_codes() == ['B0', 'B1']
+    block = proposal.get_block('B1')
+    assert block.code == 'B1'
+    xml = block.to_string()
+    assert b'urn:x?a=1&amp;b=&quot;&lt;&#09;' in xml and b'>second<' in xml
@@ -0,0 +1,46 @@
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from saltofi.xml.backend import available_backends, get_backend
+from saltofi.xml.xpath import XPath
+
+"""Document, in which only the second of two siblings has the child searched for."""
+XML = b'<Root xmlns="urn:test"><A><C>1</C></A><A><B>2</B></A><A><B>3</B></A></Root>'
+
+"""Namespace mapping for XML."""
+NAMESPACES = {'/test': '{urn:test}'}
+
+
+def _parse(backend: str):
+    """Parses XML with the given backend.
+
+    Args:
+        backend: Name of backend.
+
+    Returns:
+        Root element.
+    """
+    if backend == 'lxml':
+        from lxml import etree
+        return etree.fromstring(XML)
+    return ET.fromstring(XML)
+
+
+@pytest.mark.parametrize('backend', available_backends())
+@pytest.mark.parametrize('compiled', [False, True])
+def test_find_searches_all_siblings(backend, compiled):
+    root = _parse(backend)
+    xpath = XPath('./{/test}A/{/test}B', NAMESPACES, get_backend(backend) if compiled else None)
+    assert xpath.find(root).text == '2'
+    assert [el.text for el in xpath.findall(root)] == ['2', '3']
+
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_find_agrees_with_elementtree(backend):
+    root = _parse(backend)
+    for path in ('./{/test}A/{/test}C', './{/test}A/{/test}B', './{/test}A/{/test}D', './{/test}A'):
+        xpath = XPath(path, NAMESPACES)
+        expected = root.find(path.format(**NAMESPACES))
+        assert xpath.find(root) is expected
+        assert xpath.findall(root) == root.findall(path.format(**NAMESPACES))
@@ -1,6 +1,10 @@
 from .block import Block
 from .observation import Observation
+from .package import ProposalPackage
 from .pointing import Pointing
+from .proposal import Proposal
+from .renderer import BlockRenderer, RendererCache, renderers
 from .rss import RSS
 from .salticam import Salticam
 from .target import Target
+from .template import TemplateCache, templates
@@ -0,0 +1,254 @@
+import abc
+import copy
+import os
+import sys
+import typing
+from xml.etree import ElementTree as ET
+
+
+class Backend(abc.ABC):
+    """Base class for XML libraries that Element can work on.
+
+    Trees are always written with the serializer from ElementTree, which works on the trees of all backends, so that
+    the output does not depend on the backend.
+    """
+
+    """Name of backend, and name of the module its elements are defined in, see backend_for()."""
+    name = None
+    module = None
+
+    @abc.abstractmethod
+    def is_element(self, obj: typing.Any) -> bool:
+        """Whether the given object is an XML element of this backend.
+
+        Args:
+            obj: Object to check.
+
+        Returns:
+            True, if object is an element.
+        """
+
+    @abc.abstractmethod
+    def parse(self, filename: str) -> typing.Tuple[typing.Any, typing.List[str]]:
+        """Parse an XML file, ignoring comments and processing instructions.
+
+        Args:
+            filename: Name of file or binary file-like object to parse.
+
+        Returns:
+            Root element and list of URIs of all declared namespaces.
+        """
+
+    @abc.abstractmethod
+    def make_element(self, tag: str) -> typing.Any:
+        """Create a new element.
+
+        Args:
+            tag: Fully qualified tag of new element.
+
+        Returns:
+            New element.
+        """
+
+    def copy(self, root: typing.Any) -> typing.Any:
+        """Create a deep copy of a tree.
+
+        Args:
+            root: Root of tree to copy.
+
+        Returns:
+            Root of copy.
+        """
+        return copy.deepcopy(root)
+
+    @abc.abstractmethod
+    def remove(self, root: typing.Any, elements: typing.List[typing.Any]):
+        """Remove the given elements from the tree.
+
+        Args:
+            root: Root of tree.
+            elements: Elements within tree to remove.
+        """
+
+    def compile(self, steps: typing.Tuple[str, ...]) -> typing.Union[typing.Callable, None]:
+        """Compile a path of simple steps into a function returning all matching elements for a given root.
+
+        Args:
+            steps: Fully qualified tags of child steps.
+
+        Returns:
+            Compiled function or None, if backend does not compile paths.
+        """
+        return None
+
+    def write(self, root: typing.Any, file_obj: typing.BinaryIO):
+        """Write a tree into a file-like object.
+
+        Args:
+            root: Root of tree.
+            file_obj: File-like object to write into.
+        """
+        ET.ElementTree(root).write(file_obj)
+
+
+class ElementTreeBackend(Backend):
+    """Backend using xml.etree.ElementTree from the standard library."""
+
+    name = 'etree'
+    module = 'xml.etree.ElementTree'
+
+    def is_element(self, obj: typing.Any) -> bool:
+        return isinstance(obj, ET.Element)
+
+    def parse(self, filename: str) -> typing.Tuple[ET.Element, typing.List[str]]:
+        # collect namespace declarations while parsing
+        uris = []
+        it = ET.iterparse(filename, events=['start-ns'])
+        for _, (prefix, uri) in it:
+            uris.append(uri)
+        return it.root, uris
+
+    def make_element(self, tag: str) -> ET.Element:
+        return ET.Element(tag)
+
+    def remove(self, root: ET.Element, elements: typing.List[ET.Element]):
+        # there are no parent pointers in ElementTree
+        parents = {c: p for p in root.iter() for c in p}
+        for el in elements:
+            parents[el].remove(el)
+
+
+class LxmlBackend(Backend):
+    """Backend using lxml, which parses and copies trees faster and evaluates compiled XPaths in C.
+
+    Note that accessing single nodes and serializing, which is done with ElementTree's serializer, is slower than with
+    ElementTree itself, since lxml has to create Python objects for all nodes visited.
+    """
+
+    name = 'lxml'
+    module = 'lxml.etree'
+
+    def __init__(self):
+        """Creates the backend, raises ImportError, if lxml is not installed."""
+        from lxml import etree
+        self._etree = etree
+
+    def is_element(self, obj: typing.Any) -> bool:
+        return isinstance(obj, self._etree._Element)
+
+    def parse(self, filename: str) -> typing.Tuple[typing.Any, typing.List[str]]:
+        # comments and processing instructions are dropped like in ElementTree
+        uris = []
+        it = self._etree.iterparse(filename, events=['start-ns'], remove_comments=True, remove_pis=True)
+        for _, (prefix, uri) in it:
+            uris.append(uri)
+        return it.root, uris
+
+    def make_element(self, tag: str) -> typing.Any:
+        return self._etree.Element(tag)
+
+    def remove(self, root: typing.Any, elements: typing.List[typing.Any]):
+        for el in elements:
+            el.getparent().remove(el)
+
+    def compile(self, steps: typing.Tuple[str, ...]) -> typing.Callable:
+        # map namespaces in steps to prefixes
+        prefixes, path = {}, []
+        for step in steps:
+            if step.startswith('{'):
+                uri, tag = step[1:].split('}', 1)
+                prefix = prefixes.setdefault(uri, 'ns%d' % len(prefixes))
+                path.append('%s:%s' % (prefix, tag))
+            else:
+                path.append(step)
+
+        # compile XPath
+        return self._etree.XPath('./' + '/'.join(path), namespaces={p: uri for uri, p in prefixes.items()})
+
+
+"""Classes of all backends by name, their instances, which are only created when needed, since importing lxml takes
+a while, and the name of the default backend."""
+_classes = {'etree': ElementTreeBackend, 'lxml': LxmlBackend}
+_backends = {}
+_default = os.environ.get('SALTOFI_XML_BACKEND') or 'etree'
+
+
+def _create_backend(name: str) -> typing.Optional[Backend]:
+    """Returns the backend with the given name, creating it on first use.
+
+    Args:
+        name: Name of backend.
+
+    Returns:
+        Backend, or None, if it is not available.
+    """
+    if name not in _backends:
+        try:
+            _backends[name] = _classes[name]()
+        except ImportError:
+            return None
+    return _backends[name]
+
+
+def available_backends() -> typing.List[str]:
+    """Returns the names of all available backends."""
+    return [name for name in _classes if _create_backend(name) is not None]
+
+
+def get_backend(name: str = None) -> Backend:
+    """Returns the backend with the given name.
+
+    Args:
+        name: Name of backend, the default backend if None.
+
+    Returns:
+        Backend.
+
+    Raises:
+        ValueError: If backend is not available.
+    """
+    name = _default if name is None else name
+    backend = _create_backend(name) if name in _classes else None
+    if backend is None:
+        raise ValueError('XML backend %s is not available.' % name)
+    return backend
+
+
+def set_default_backend(name: str):
+    """Sets the default backend for parsing files, which is ElementTree, unless set differently with the
+    SALTOFI_XML_BACKEND environment variable.
+
+    Args:
+        name: Name of backend.
+
+    Raises:
+        ValueError: If backend is not available.
+    """
+    global _default
+    get_backend(name)
+    _default = name
+
+
+def backend_for(obj: typing.Any) -> Backend:
+    """Returns the backend for the given XML element.
+
+    Args:
+        obj: XML element.
+
+    Returns:
+        Backend the element belongs to.
+
+    Raises:
+        ValueError: If object is no element of any available backend.
+    """
+    for name, cls in _classes.items():
+        # elements can only exist, if their module has been imported
+        if cls.module in sys.modules:
+            backend = _create_backend(name)
+            if backend is not None and backend.is_element(obj):
+                return backend
+    raise ValueError('Unknown input.')
+
+
+__all__ = ['Backend', 'ElementTreeBackend', 'LxmlBackend', 'available_backends', 'get_backend',
+           'set_default_backend', 'backend_for']
@@ -1,12 +1,14 @@
 import typing
 from xml.etree import ElementTree as ET
 
-from astropy.time import Time
-
 from .element import Element
 from .pointing import Pointing
 from .target import Target
 
+# astropy is expensive to import, so it is only imported when times are actually used
+if typing.TYPE_CHECKING:
+    from astropy.time import Time
+
 
 class Block(Element):
     """A block in a SALT proposal."""
@@ -18,6 +20,14 @@ class Block(Element):
     YEAR = './{/PIPT/Proposal/Phase2}BlockSemester/{/PIPT/Proposal/Phase2}Year'
     SEMESTER = './{/PIPT/Proposal/Phase2}BlockSemester/{/PIPT/Proposal/Phase2}Semester'
     EXPIRYDATE = './{/PIPT/Proposal/Phase2}ExpiryDate'
+    MAX_LUNAR_PHASE = './{/PIPT/Proposal/Phase2}MaximumLunarPhase/{/PIPT/Proposal/Shared}Value'
+    MIN_LUNAR_DISTANCE = './{/PIPT/Proposal/Phase2}MinimumLunarAngularDistance/{/PIPT/Proposal/Phase2}Value'
+    POINTING = './{/PIPT/Proposal/Phase2}SubBlock' \
+               '/{/PIPT/Proposal/Phase2}SubSubBlock' \
+               '/{/PIPT/Proposal/Phase2}Pointing'
+    TARGET = POINTING + '/{/PIPT/Proposal/Phase2}Observation' \
+                       '/{/PIPT/Proposal/Phase2}Acquisition' \
+                       '/{/PIPT/Proposal/Shared}Target'
 
     @property
     def name(self) -> str:
@@ -109,6 +119,44 @@ class Block(Element):
         """
         self.set(Block.YEAR, str(v))
 
+    @property
+    def max_lunar_phase(self) -> typing.Union[float, None]:
+        """Returns the maximum lunar phase for this block.
+
+        Returns:
+            Maximum illuminated fraction of the moon in percent, or None, if not constrained.
+        """
+        v = self.get(Block.MAX_LUNAR_PHASE, default='')
+        return float(v) if v else None
+
+    @max_lunar_phase.setter
+    def max_lunar_phase(self, v: float):
+        """Sets new maximum lunar phase for this block.
+
+        Args:
+            v: New maximum illuminated fraction of the moon in percent.
+        """
+        self.set(Block.MAX_LUNAR_PHASE, str(float(v)))
+
+    @property
+    def min_lunar_distance(self) -> typing.Union[float, None]:
+        """Returns the minimum angular distance to the moon for this block.
+
+        Returns:
+            Minimum distance in degrees, or None, if not constrained.
+        """
+        v = self.get(Block.MIN_LUNAR_DISTANCE, default='')
+        return float(v) if v else None
+
+    @min_lunar_distance.setter
+    def min_lunar_distance(self, v: float):
+        """Sets new minimum angular distance to the moon for this block.
+
+        Args:
+            v: New minimum distance in degrees.
+        """
+        self.set(Block.MIN_LUNAR_DISTANCE, str(float(v)))
+
     @property
     def pointings(self) -> typing.List[Pointing]:
         """Returns all Pointings within this block.
@@ -116,10 +164,7 @@ class Block(Element):
         Returns:
             List of Pointing objects.
         """
-        xpath = './{/PIPT/Proposal/Phase2}SubBlock' \
-                '/{/PIPT/Proposal/Phase2}SubSubBlock' \
-                '/{/PIPT/Proposal/Phase2}Pointing'.format(**self.namespaces)
-        return [Pointing(p) for p in self.root.findall(xpath)]
+        return self.get_objects(Block.POINTING, Pointing)
 
     @property
     def targets(self) -> typing.List[Target]:
@@ -128,26 +173,22 @@ class Block(Element):
         Returns:
             List of Target objects.
         """
-        xpath = './{/PIPT/Proposal/Phase2}SubBlock' \
-                '/{/PIPT/Proposal/Phase2}SubSubBlock' \
-                '/{/PIPT/Proposal/Phase2}Pointing' \
-                '/{/PIPT/Proposal/Phase2}Observation' \
-                '/{/PIPT/Proposal/Phase2}Acquisition' \
-                '/{/PIPT/Proposal/Shared}Target' .format(**self.namespaces)
-        return [Target(t) for t in self.root.findall(xpath)]
+        return self.get_objects(Block.TARGET, Target)
 
     @property
-    def expiry_date(self) -> typing.Union[Time, None]:
+    def expiry_date(self) -> typing.Union['Time', None]:
         """Returns the expiry date of this block, if any."""
+        from astropy.time import Time
         return Time(self.get(Block.EXPIRYDATE))
 
     @expiry_date.setter
-    def expiry_date(self, v: typing.Union[Time, None]):
+    def expiry_date(self, v: typing.Union['Time', None]):
         """Sets the expiry date.
 
         Args:
             v: New expiry date.
         """
+        from astropy.time import Time
         if v is None:
             self.set(Block.EXPIRYDATE, None)
         elif isinstance(v, Time):
@@ -1,37 +1,108 @@
 import io
+import zipfile
 from xml.etree import ElementTree as ET
 
 import typing
 
+from .backend import get_backend, backend_for
+from .xpath import XPath, xpaths
+
 
 class Element(object):
     """Base class for all XML elements in a SALT proposal."""
 
-    def __init__(self, source: typing.Union[str, ET.Element]):
+    def __init__(self, source: typing.Union[str, ET.Element], namespaces: typing.Dict[str, str] = None,
+                 parent: 'Element' = None, backend: str = None):
         """Initializes a new XML element.
 
         Args:
-            source: XML source for this element, either as filename or as ET.Element object.
+            source: XML source for this element, either as filename or as element of any XML backend, e.g. an
+                ET.Element object.
+            namespaces: If given, use this namespace mapping instead of extracting it from the XML.
+            parent: If given, source must be an element within the parent's document and this object will share
+                namespaces, backend and structure revision with the parent.
+            backend: Name of XML backend for parsing files, see saltofi.xml.backend.
         """
 
-        # what format is proposal?
-        if isinstance(source, ET.Element):
-            # XML element
+        # cached lists of child objects, see get_objects()
+        self._views = {}
+
+        # share state with parent?
+        if parent is not None:
             self.root = source
-        elif isinstance(source, str):
-            # filename
-            xml = ET.parse(source)
-            self.root = xml.getroot()
+            self.namespaces = parent.namespaces
+            self.backend = parent.backend
+            self._xpaths = parent._xpaths
+            self._revision = parent._revision
+            return
+
+        # what format is proposal?
+        if isinstance(source, str):
+            # filename, collect namespace declarations while parsing
+            self.backend = get_backend(backend)
+            self.root, uris = self.backend.parse(source)
+            self.namespaces = namespaces if namespaces is not None else Element._map_namespaces(uris)
         else:
-            raise ValueError('Unknown input.')
+            # XML element, use given namespaces or collect them from the tree
+            self.backend = backend_for(source)
+            self.root = source
+            self.namespaces = namespaces if namespaces is not None else Element._namespaces_from_tree(source)
+
+        # compiled XPaths for our namespaces and backend
+        self._xpaths = xpaths.get_map(self.namespaces, self.backend)
+
+        # revision of document structure, shared with all child objects and increased on changes, see invalidate()
+        self._revision = [0]
+
+    @staticmethod
+    def _map_namespaces(uris: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """Create the namespace mapping from a list of namespace URIs.
+
+        This will create a dictionary with entries like this:
+          '/PIPT/Proposal/Phase2': '{http://www.salt.ac.za/PIPT/Proposal/Phase2/4.8}'
+        which is used to map namespaces to the latest version
+
+        Args:
+            uris: Namespace URIs.
+
+        Returns:
+            Dictionary mapping namespaces without version to full namespaces.
+        """
+        return {n[n.find('/PIPT'):n.rfind('/')]: '{%s}' % n for n in uris}
 
-        # get XML ns string and extract namespaces
-        # this will create a dictionary self.namespaces with entries like this:
-        #   '/PIPT/Proposal/Phase2': '{http://www.salt.ac.za/PIPT/Proposal/Phase2/4.8}'
-        # which is used to map namespaces to the latest version
-        xml = ET.tostring(self.root).decode('utf-8')
-        tmp = dict([node for _, node in ET.iterparse(io.StringIO(xml), events=['start-ns'])])
-        self.namespaces = {n[n.find('/PIPT'):n.rfind('/')]: '{%s}' % n for n in tmp.values()}
+    @staticmethod
+    def _namespaces_from_tree(root: ET.Element) -> typing.Dict[str, str]:
+        """Collect all namespaces used for tags and attributes in the given tree.
+
+        Args:
+            root: Root of tree to search.
+
+        Returns:
+            Dictionary mapping namespaces without version to full namespaces.
+        """
+        uris = set()
+        for el in root.iter():
+            # ignore comments and processing instructions
+            if isinstance(el.tag, str) and el.tag[:1] == '{':
+                uris.add(el.tag[1:el.tag.find('}')])
+            for key in el.keys():
+                if key[:1] == '{':
+                    uris.add(key[1:key.find('}')])
+        return Element._map_namespaces(uris)
+
+    @classmethod
+    def from_template(cls, filename: str, backend: str = None):
+        """Creates a new object from a template file, which is only parsed once per process.
+
+        Args:
+            filename: Name of template file.
+            backend: Name of XML backend, see saltofi.xml.backend.
+
+        Returns:
+            New object of this class, working on a private copy of the template.
+        """
+        from .template import templates
+        return templates.load(filename, cls, backend=backend)
 
     def write(self, file_obj):
         """Write XML into a file-like object.
@@ -39,8 +110,17 @@ class Element(object):
         Args:
             file_obj: File-like object.
         """
-        et = ET.ElementTree(self.root)
-        et.write(file_obj)
+        self.backend.write(self.root, file_obj)
+
+    def write_to_zip(self, zip_file: zipfile.ZipFile, filename: str):
+        """Write XML directly into a new file in a ZIP file, without serializing it into memory first.
+
+        Args:
+            zip_file: ZIP file opened for writing.
+            filename: Name of new file in ZIP file.
+        """
+        with zip_file.open(filename, mode='w') as f:
+            self.write(f)
 
     def to_string(self):
         """Returns XML as string."""
@@ -48,19 +128,91 @@ class Element(object):
             self.write(bio)
             return bio.getvalue()
 
+    def xpath(self, xpath: str) -> XPath:
+        """Returns compiled version of the given XPath, which is only compiled once per namespace mapping.
+
+        Args:
+            xpath: XPath for element, will be mapped using self.namespaces.
+
+        Returns:
+            Compiled XPath.
+        """
+        try:
+            return self._xpaths[xpath]
+        except KeyError:
+            return xpaths.compile(self._xpaths, xpath, self.namespaces, self.backend)
+
+    def make_element(self, tag: str) -> ET.Element:
+        """Create a new XML element with the backend of this object, which can then be appended to it.
+
+        Args:
+            tag: Tag for new element, will be mapped using self.namespaces.
+
+        Returns:
+            New element.
+        """
+        return self.backend.make_element(tag.format(**self.namespaces))
+
+    def invalidate(self):
+        """Notify all objects for this document that its structure has changed.
+
+        Must be called after adding or removing nodes directly in the tree, so that cached lists of child objects are
+        rebuilt. append() and remove() do this automatically. Changing text values does not require it.
+        """
+        self._revision[0] += 1
+
+    def append(self, element: ET.Element, xpath: str = None):
+        """Append an element or a fragment of XML to a node.
+
+        Args:
+            element: Element to append.
+            xpath: XPath for node to append to, will be mapped using self.namespaces. Defaults to self.root.
+        """
+        node = self.root if xpath is None else self.xpath(xpath).find(self.root)
+        node.append(element)
+        self.invalidate()
+
+    def remove(self, xpath: str):
+        """Remove all nodes described by xpath.
+
+        Args:
+            xpath: XPath for elements to remove, will be mapped using self.namespaces.
+        """
+
+        self.backend.remove(self.root, self.xpath(xpath).findall(self.root))
+        self.invalidate()
+
     def get_objects(self, xpath: str, klass, root=None) -> list:
         """Find all nodes described by a given xpath and create objects of the given class from it.
 
+        Objects found from this object's root are cached, i.e. repeated calls return the same objects for the same
+        nodes. After changes to the structure of the document, the list is rebuilt on the next call.
+
         Args:
             xpath: XPath for elements to search for, will be mapped using self.namespaces.
-            klass: Class to use for creating objects.
+            klass: Class to use for creating objects, which share namespaces and structure revision with this object.
             root: Alternative root for search.
 
         Returns:
             List of objects of type klass.
         """
-        root = root if root else self.root
-        return [klass(c) for c in root.findall(xpath.format(**self.namespaces))]
+
+        # alternative root?
+        if root is not None:
+            return [klass(c, parent=self) for c in self.xpath(xpath).findall(root)]
+
+        # still valid in cache?
+        key = (xpath, klass)
+        view = self._views.get(key)
+        if view is None or view[0] != self._revision[0]:
+            # build and store new list, keep existing objects for nodes that are still there
+            existing = {} if view is None else {o.root: o for o in view[1]}
+            objects = [existing.get(c) or klass(c, parent=self) for c in self.xpath(xpath).findall(self.root)]
+            view = (self._revision[0], objects)
+            self._views[key] = view
+
+        # return copy of list
+        return list(view[1])
 
     def get(self, xpath: str, root=None, default=None) -> str:
         """Get the text attribute of a single node described by xpath.
@@ -73,8 +225,8 @@ class Element(object):
         Returns:
             Text value of given node.
         """
-        root = root if root else self.root
-        el = root.find(xpath.format(**self.namespaces))
+        root = root if root is not None else self.root
+        el = self.xpath(xpath).find(root)
         if el is None and default is not None:
             return default
         return el.text
@@ -87,8 +239,8 @@ class Element(object):
             value: New value for element's text attribute.
             root: Alternative root for search.
         """
-        root = root if root else self.root
-        root.find(xpath.format(**self.namespaces)).text = str(value)
+        root = root if root is not None else self.root
+        self.xpath(xpath).find(root).text = str(value)
 
 
 __all__ = ['Element']
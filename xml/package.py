@@ -0,0 +1,304 @@
+import io
+import os
+import shutil
+import struct
+import typing
+import zipfile
+
+from .backend import get_backend
+from .block import Block
+from .element import Element
+from .proposal import Proposal
+
+
+class ProposalPackage(object):
+    """ZIP package with the XML of a proposal or block and its attachments, e.g. finding charts.
+
+    Nothing is read from the package on opening, except for its central directory. The XML is only parsed when it is
+    accessed, and attachments are opened as streams, which decompress their contents while being read.
+
+    When writing the package, all members that have not been changed are copied as they are, i.e. without
+    decompressing and compressing them again. The XML counts as changed, once it has been accessed via the xml
+    property, since the returned object can be modified.
+    """
+
+    """Names of the XML file in the package, in order of preference."""
+    XML_NAMES = ['Proposal.xml', 'Block.xml']
+
+    """Size of chunks for copying raw member data."""
+    CHUNK_SIZE = 64 * 1024
+
+    """Indices of the lengths of filename and extra field in a local file header."""
+    _FILENAME_LENGTH = 10
+    _EXTRA_FIELD_LENGTH = 11
+
+    """Header ID of the ZIP64 extended information in extra fields."""
+    _ZIP64_EXTRA = 1
+
+    """Non-public attributes of zipfile used for copying raw member data, see _can_copy_raw()."""
+    _RAW_MODULE_ATTRIBUTES = ('structFileHeader', 'sizeFileHeader', 'stringFileHeader')
+    _RAW_ZIP_ATTRIBUTES = ('_lock', 'fp', '_seekable', 'start_dir', 'filelist', 'NameToInfo', '_didModify')
+
+    def __init__(self, source: typing.Union[str, typing.BinaryIO] = None, backend: str = None):
+        """Opens a package or creates a new one.
+
+        Args:
+            source: Filename or seekable binary file-like object of package to open, a new empty package if None.
+            backend: Name of XML backend for parsing the XML, see saltofi.xml.backend.
+        """
+        self._zip = zipfile.ZipFile(source) if source is not None else None
+        self._source = source
+        self._backend = backend
+
+        # parsed XML, new or changed members by name, and removed members
+        self._xml = None
+        self._members = {}
+        self._removed = set()
+
+        # find XML in package
+        self.xml_name = self._find_xml_name()
+
+    def _find_xml_name(self) -> typing.Union[str, None]:
+        """Returns the name of the XML file in the package.
+
+        Returns:
+            Name of XML file, or None, if there is none.
+        """
+        if self._zip is None:
+            return None
+        names = self._zip.namelist()
+        for name in ProposalPackage.XML_NAMES:
+            if name in names:
+                return name
+        return next((n for n in names if n.lower().endswith('.xml') and '/' not in n), None)
+
+    def __enter__(self) -> 'ProposalPackage':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Closes the underlying ZIP file."""
+        if self._zip is not None:
+            self._zip.close()
+
+    def names(self) -> typing.List[str]:
+        """Returns the names of all members of the package.
+
+        Returns:
+            List of names, including the XML.
+        """
+        names = [] if self._zip is None else [n for n in self._zip.namelist() if n not in self._removed]
+        return names + [n for n in self._members.keys() if n not in names]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names()
+
+    @property
+    def attachments(self) -> typing.List[str]:
+        """Names of all attachments, i.e. all members except for the XML."""
+        return [n for n in self.names() if n != self.xml_name]
+
+    @property
+    def xml(self) -> typing.Union[Element, None]:
+        """XML of the package, which is parsed on first access. A Block, if the XML is a block, an Element otherwise."""
+        if self._xml is None and self.xml_name is not None:
+            with self.open(self.xml_name) as f:
+                root, uris = get_backend(self._backend).parse(f)
+            klass = Block if root.tag.endswith('}Block') else Element
+            self._xml = klass(root, namespaces=Element._map_namespaces(uris))
+        return self._xml
+
+    @xml.setter
+    def xml(self, xml: Element):
+        if self.xml_name is None:
+            self.xml_name = 'Block.xml' if isinstance(xml, Block) else 'Proposal.xml'
+        self._xml = xml
+
+    def proposal(self) -> Proposal:
+        """Returns a streaming reader for the blocks in the XML, which does not parse the whole document.
+
+        Returns:
+            Reader for the XML as stored in the package, changes to the xml property are not visible to it.
+
+        Raises:
+            ValueError: If the package contains no stored XML.
+        """
+        if self._zip is None or self.xml_name not in self._zip.namelist():
+            raise ValueError('No XML stored in package.')
+        return Proposal(self._zip.open(self.xml_name))
+
+    def open(self, name: str) -> typing.BinaryIO:
+        """Opens a member of the package for reading. Compressed members are decompressed while being read.
+
+        Args:
+            name: Name of member.
+
+        Returns:
+            Binary file-like object, which must be closed by the caller.
+
+        Raises:
+            KeyError: If there is no member with the given name.
+        """
+        if name in self._members:
+            data = self._members[name]
+            return open(data, 'rb') if isinstance(data, str) else io.BytesIO(data)
+        if self._zip is None or name in self._removed:
+            raise KeyError('There is no member %s in package.' % name)
+        return self._zip.open(name)
+
+    def add(self, name: str, data: typing.Union[str, bytes]):
+        """Adds a new member to the package or replaces an existing one.
+
+        Args:
+            name: Name of member.
+            data: Contents of member, or name of file to read them from, which is only read when writing.
+        """
+        if name == self.xml_name:
+            raise ValueError('Use the xml property for changing the XML.')
+        self._members[name] = data
+        self._removed.discard(name)
+
+    def remove(self, name: str):
+        """Removes a member from the package.
+
+        Args:
+            name: Name of member.
+
+        Raises:
+            KeyError: If there is no member with the given name.
+        """
+        if name not in self:
+            raise KeyError('There is no member %s in package.' % name)
+        self._members.pop(name, None)
+        self._removed.add(name)
+
+    def write(self, target: typing.Union[str, typing.BinaryIO], compression: int = zipfile.ZIP_DEFLATED,
+              compresslevel: int = None):
+        """Writes the package into a new ZIP file.
+
+        Args:
+            target: Filename or binary file-like object to write into, must not be the source of this package.
+            compression: Compression for new and changed members, unchanged members are copied as they are.
+            compresslevel: Level for compression.
+
+        Raises:
+            ValueError: If target is the source of this package.
+        """
+        if target is self._source or (isinstance(target, str) and isinstance(self._source, str) and
+                                      os.path.abspath(target) == os.path.abspath(self._source)):
+            raise ValueError('Cannot write package into its own source.')
+
+        with zipfile.ZipFile(target, mode='w', compression=compression, compresslevel=compresslevel) as zip_file:
+            # copy unchanged members from source, and write XML, if it has been accessed
+            for info in [] if self._zip is None else self._zip.infolist():
+                if info.filename in self._removed or info.filename in self._members:
+                    continue
+                if info.filename == self.xml_name and self._xml is not None:
+                    self._xml.write_to_zip(zip_file, info.filename)
+                else:
+                    self._copy_raw(info, zip_file)
+
+            # new XML
+            if self._xml is not None and (self._zip is None or self.xml_name not in self._zip.namelist()):
+                self._xml.write_to_zip(zip_file, self.xml_name)
+
+            # new and changed members
+            for name, data in self._members.items():
+                if isinstance(data, str):
+                    zip_file.write(data, arcname=name)
+                else:
+                    zip_file.writestr(name, data)
+
+    def _can_copy_raw(self, zip_file: zipfile.ZipFile) -> bool:
+        """Whether the non-public attributes of zipfile required for copying raw member data exist in this version of
+        Python.
+
+        Args:
+            zip_file: ZIP file opened for writing.
+
+        Returns:
+            True, if raw data can be copied.
+        """
+        return all(hasattr(zipfile, a) for a in ProposalPackage._RAW_MODULE_ATTRIBUTES) and \
+            all(hasattr(z, a) for z in (self._zip, zip_file) for a in ProposalPackage._RAW_ZIP_ATTRIBUTES)
+
+    @staticmethod
+    def _strip_zip64(extra: bytes) -> bytes:
+        """Removes the ZIP64 extended information from extra fields, since ZipInfo.FileHeader() adds a new one.
+
+        Args:
+            extra: Extra fields of a member.
+
+        Returns:
+            Extra fields without ZIP64 information.
+        """
+        stripped, i = b'', 0
+        while i + 4 <= len(extra):
+            header_id, size = struct.unpack('<HH', extra[i:i + 4])
+            if header_id != ProposalPackage._ZIP64_EXTRA:
+                stripped += extra[i:i + 4 + size]
+            i += 4 + size
+        return stripped
+
+    def _copy_raw(self, info: zipfile.ZipInfo, zip_file: zipfile.ZipFile):
+        """Copy the compressed data of a member into another ZIP file.
+
+        If the non-public attributes of zipfile this relies on are missing, the member is decompressed and compressed
+        again, streamed through the public API.
+
+        Args:
+            info: Info for member in source.
+            zip_file: ZIP file opened for writing.
+        """
+
+        # new info, with sizes and CRC in local header instead of a data descriptor after the data
+        new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+        for attr in ('compress_type', 'comment', 'extra', 'create_system', 'create_version', 'extract_version',
+                     'flag_bits', 'volume', 'internal_attr', 'external_attr', 'CRC', 'compress_size', 'file_size'):
+            setattr(new_info, attr, getattr(info, attr))
+        new_info.flag_bits &= ~0x08
+        new_info.extra = ProposalPackage._strip_zip64(new_info.extra)
+
+        # fall back to public API
+        if not self._can_copy_raw(zip_file):
+            zip64 = new_info.file_size > zipfile.ZIP64_LIMIT
+            with self._zip.open(info) as src, zip_file.open(new_info, 'w', force_zip64=zip64) as dst:
+                shutil.copyfileobj(src, dst, ProposalPackage.CHUNK_SIZE)
+            return
+
+        # the data of a member starts after its local header, whose variable length is given in the header itself
+        with self._zip._lock:
+            src = self._zip.fp
+            src.seek(info.header_offset)
+            header = struct.unpack(zipfile.structFileHeader, src.read(zipfile.sizeFileHeader))
+            if header[0] != zipfile.stringFileHeader:
+                raise ValueError('Bad local header for member %s.' % info.filename)
+            src.seek(header[ProposalPackage._FILENAME_LENGTH] + header[ProposalPackage._EXTRA_FIELD_LENGTH],
+                     os.SEEK_CUR)
+            data_offset = src.tell()
+
+        # write header and copy data, like ZipFile itself does for directories
+        with zip_file._lock:
+            if zip_file._seekable:
+                zip_file.fp.seek(zip_file.start_dir)
+            new_info.header_offset = zip_file.fp.tell()
+            zip64 = new_info.file_size > zipfile.ZIP64_LIMIT or new_info.compress_size > zipfile.ZIP64_LIMIT
+            zip_file.fp.write(new_info.FileHeader(zip64))
+            remaining = info.compress_size
+            with self._zip._lock:
+                while remaining > 0:
+                    self._zip.fp.seek(data_offset + info.compress_size - remaining)
+                    chunk = self._zip.fp.read(min(remaining, ProposalPackage.CHUNK_SIZE))
+                    if not chunk:
+                        raise ValueError('Member %s is truncated.' % info.filename)
+                    zip_file.fp.write(chunk)
+                    remaining -= len(chunk)
+            zip_file.filelist.append(new_info)
+            zip_file.NameToInfo[new_info.filename] = new_info
+            zip_file.start_dir = zip_file.fp.tell()
+            zip_file._didModify = True
+
+
+__all__ = ['ProposalPackage']
@@ -0,0 +1,242 @@
+import typing
+from xml.etree import ElementTree as ET
+from xml.parsers import expat
+
+from .block import Block
+from .element import Element
+
+
+class Proposal(object):
+    """Reader for large proposal documents with many blocks.
+
+    Blocks are read with an incremental parser and yielded one at a time. Each block is detached from the document as
+    soon as it has been parsed completely, so the memory used does not grow with the number of blocks, unless the
+    caller keeps them.
+
+    For random access, an index with the byte offsets of all blocks by their BlockCode is built in a single pass over
+    the file, which keeps neither a tree nor the blocks themselves. A single block is then parsed by reading only its
+    bytes from the file.
+    """
+
+    def __init__(self, source: typing.Union[str, typing.BinaryIO]):
+        """Creates a new reader.
+
+        Args:
+            source: Filename or seekable binary file-like object.
+        """
+        self.source = source
+        self._index = None
+        self._encoding = 'utf-8'
+
+    def _open(self) -> typing.BinaryIO:
+        """Returns the file, rewound to the beginning."""
+        if isinstance(self.source, str):
+            return open(self.source, 'rb')
+        self.source.seek(0)
+        return _Unclosable(self.source)
+
+    @staticmethod
+    def _is_block(tag: str) -> bool:
+        """Whether the given tag is a block tag.
+
+        Args:
+            tag: Fully qualified tag.
+
+        Returns:
+            True, if it is the tag of a block.
+        """
+        return isinstance(tag, str) and tag.endswith('}Block') and '/PIPT/Proposal/Phase2/' in tag
+
+    def __iter__(self) -> typing.Iterator[Block]:
+        return self.blocks()
+
+    def blocks(self) -> typing.Iterator[Block]:
+        """Reads all blocks one at a time.
+
+        Yields:
+            Block objects in document order.
+        """
+        with self._open() as f:
+            uris = []
+            namespaces = {}
+            stack = []
+            for event, data in ET.iterparse(f, events=['start-ns', 'start', 'end']):
+                if event == 'start-ns':
+                    # blocks often declare the same namespaces again, only a new one changes the mapping
+                    if data[1] not in uris:
+                        uris.append(data[1])
+                        namespaces = None
+                elif event == 'start':
+                    stack.append(data)
+                else:
+                    stack.pop()
+
+                    # top-level block?
+                    if Proposal._is_block(data.tag) and not any(Proposal._is_block(el.tag) for el in stack):
+                        # detach it from document, including the whitespace following it
+                        if stack:
+                            stack[-1].remove(data)
+                        data.tail = None
+
+                        # and yield it
+                        if namespaces is None:
+                            namespaces = Element._map_namespaces(uris)
+                        yield Block(data, namespaces=dict(namespaces))
+
+    def index(self) -> typing.Dict[str, typing.Tuple[int, int, typing.Tuple[typing.Tuple[str, str], ...]]]:
+        """Returns the index of all blocks, which is built on first access.
+
+        Returns:
+            Dictionary mapping block codes to the byte offsets of the start of the block and of the start of its end
+            tag, and the namespace declarations in scope at the start of the block as (prefix, uri) tuples.
+        """
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    def _build_index(self) -> typing.Dict[str, typing.Tuple[int, int, typing.Tuple[typing.Tuple[str, str], ...]]]:
+        """Builds the index of all blocks in a single pass over the file.
+
+        Returns:
+            Index as described in index().
+        """
+        parser = expat.ParserCreate(namespace_separator='}')
+        parser.buffer_text = True
+        index = {}
+
+        # state: stack of namespace declarations, current depth, depth and offset of current block, and the text of
+        # its BlockCode, if we're in it
+        decls = []
+        state = {'depth': 0, 'block': None, 'start': 0, 'code': None, 'in_code': False, 'decls': ()}
+
+        def start_ns(prefix, uri):
+            decls.append((prefix, uri))
+
+        def end_ns(prefix):
+            for i in range(len(decls) - 1, -1, -1):
+                if decls[i][0] == prefix:
+                    del decls[i]
+                    break
+
+        def start(name, attrs):
+            state['depth'] += 1
+            if state['block'] is None:
+                if Proposal._is_block('{' + name):
+                    state.update(block=state['depth'], start=parser.CurrentByteIndex, code=None, decls=tuple(decls))
+            elif state['depth'] == state['block'] + 1 and name.endswith('}BlockCode'):
+                # only collect text within BlockCode
+                state.update(in_code=True, code='')
+                parser.CharacterDataHandler = text
+
+        def end(name):
+            if state['in_code']:
+                state['in_code'] = False
+                parser.CharacterDataHandler = None
+            elif state['block'] == state['depth']:
+                if state['code']:
+                    index[state['code'].strip()] = (state['start'], parser.CurrentByteIndex, state['decls'])
+                state['block'] = None
+            state['depth'] -= 1
+
+        def text(data):
+            state['code'] += data
+
+        def xml_decl(version, encoding, standalone):
+            if encoding:
+                self._encoding = encoding.lower()
+
+        parser.StartNamespaceDeclHandler = start_ns
+        parser.EndNamespaceDeclHandler = end_ns
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.XmlDeclHandler = xml_decl
+
+        # parse file
+        with self._open() as f:
+            try:
+                parser.ParseFile(f)
+            except expat.ExpatError as e:
+                raise ValueError('Invalid proposal: %s' % e)
+        return index
+
+    def block_codes(self) -> typing.List[str]:
+        """Returns the codes of all blocks in document order.
+
+        Returns:
+            List of block codes.
+        """
+        return list(self.index().keys())
+
+    def __len__(self) -> int:
+        return len(self.index())
+
+    def __contains__(self, block_code: str) -> bool:
+        return block_code in self.index()
+
+    def get_block(self, block_code: str) -> Block:
+        """Reads a single block by its code, using the index.
+
+        Args:
+            block_code: Code of block.
+
+        Returns:
+            The block.
+
+        Raises:
+            KeyError: If there is no block with the given code.
+        """
+        start, end, decls = self.index()[block_code]
+
+        # read bytes of block up to the end of its end tag
+        with self._open() as f:
+            f.seek(start)
+            data = f.read(end - start)
+            tail = b''
+            while b'>' not in tail:
+                chunk = f.read(256)
+                if not chunk:
+                    break
+                tail += chunk
+            data += tail[:tail.find(b'>') + 1]
+        if self._encoding not in ('utf-8', 'utf8', 'us-ascii', 'ascii'):
+            data = data.decode(self._encoding).encode('utf-8')
+
+        # wrap it in an element declaring all namespaces in scope, and parse it, collecting the namespaces declared
+        # within the block as well
+        attrs = ''.join(' xmlns%s="%s"' % (':' + prefix if prefix else '', Proposal._escape_attribute(uri))
+                        for prefix, uri in decls)
+        parser = ET.XMLPullParser(events=['start-ns', 'start'])
+        parser.feed(('<wrapper%s>' % attrs).encode('utf-8') + data + b'</wrapper>')
+        parser.close()
+        uris, elements = [], []
+        for event, data in parser.read_events():
+            if event == 'start-ns':
+                uris.append(data[1])
+            elif len(elements) < 2:
+                elements.append(data)
+        return Block(elements[1], namespaces=Element._map_namespaces(uris))
+
+    @staticmethod
+    def _escape_attribute(value: str) -> str:
+        """Escape value for an attribute in double quotes, without importing xml.sax.saxutils, which is slow."""
+        for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('"', '&quot;'), ('\n', '&#10;'), ('\r', '&#13;'),
+                             ('\t', '&#9;')):
+            if char in value:
+                value = value.replace(char, entity)
+        return value
+
+
+class _Unclosable(object):
+    """Context manager for a file-like object given by the caller, which must not be closed."""
+
+    def __init__(self, file_obj: typing.BinaryIO):
+        self._file_obj = file_obj
+
+    def __enter__(self) -> typing.BinaryIO:
+        return self._file_obj
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+__all__ = ['Proposal']
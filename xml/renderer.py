@@ -0,0 +1,230 @@
+import os
+import re
+import threading
+import typing
+from xml.etree import ElementTree as ET
+
+from .block import Block
+from .element import Element
+from .target import Target
+
+
+class BlockRenderer(object):
+    """Renders blocks from a template, in which only the texts of a few nodes (slots) change.
+
+    The template is compiled once: All slots are filled with sentinels, the block is serialized, and the result is
+    split at the sentinels into constant fragments. Rendering a block then only joins the constant fragments with the
+    escaped values for the slots, without creating or serializing a tree. The finding charts of each target are
+    rendered from a fragment for a single chart, which is repeated for each chart.
+
+    The output is identical to loading the template into a Block, setting the same values via its properties, and
+    calling to_string(). Since finding charts are always rendered like the Target.finding_charts setter writes them,
+    i.e. at the end of the target, this includes setting the finding charts, even if no new ones are given.
+    """
+
+    """XPaths of slots in block by name."""
+    BLOCK_SLOTS = {
+        'code': Block.BLOCK_CODE,
+        'name': Block.NAME,
+        'comment': Block.COMMENTS,
+        'year': Block.YEAR,
+        'semester': Block.SEMESTER,
+        'expiry_date': Block.EXPIRYDATE,
+        'max_lunar_phase': Block.MAX_LUNAR_PHASE,
+        'min_lunar_distance': Block.MIN_LUNAR_DISTANCE,
+    }
+
+    """XPaths of slots in each target by name, coordinates are handled separately."""
+    TARGET_SLOTS = {
+        'name': Target.NAME,
+        'code': Target.TARGET_CODE,
+        'mag_filter': Target.MAG_FILTER,
+        'mag_min': Target.MAG_MIN,
+        'mag_max': Target.MAG_MAX,
+    }
+
+    """Sentinel for slots in serialized template, a NUL character cannot appear in XML."""
+    _SENTINEL = '\x00%d\x00'
+    _SENTINEL_RE = re.compile('\x00(\\d+)\x00')
+
+    def __init__(self, filename: str):
+        """Compiles a new renderer.
+
+        Args:
+            filename: Name of template file.
+        """
+
+        # load template, always with ElementTree, whose serializer we need to match
+        block = Block.from_template(filename, backend='etree')
+
+        # slots as tuples of (name, target index or None), and their default values from the template
+        self._slots = []
+        self.defaults = {}
+
+        # fill block slots
+        for name, xpath in BlockRenderer.BLOCK_SLOTS.items():
+            self._fill(block, xpath, (name, None))
+
+        # fill target slots, the finding charts are replaced by a single chart
+        self.targets = len(block.targets)
+        for i, target in enumerate(block.targets):
+            for name, xpath in BlockRenderer.TARGET_SLOTS.items():
+                self._fill(target, xpath, (name, i))
+            for j, xpath in enumerate(Target.COORDINATE_NODES):
+                self._fill(target, xpath, ('coordinates', i, j))
+            self.defaults[('finding_charts', i)] = target.finding_charts
+            target.finding_charts = [BlockRenderer._SENTINEL % len(self._slots)]
+            self._slots.append(('finding_charts', i))
+
+        # serialize and split at sentinels, every other entry in parts is a slot index
+        parts = BlockRenderer._SENTINEL_RE.split(ET.tostring(block.root, encoding='unicode'))
+        self._parts = [int(p) if i % 2 else p for i, p in enumerate(parts)]
+
+        # cut fragment for a single finding chart from surrounding parts, the sentinel is the text of the inner
+        # Path element, so the fragment starts two tags before and ends two tags after it
+        self._charts = {}
+        for k in range(1, len(self._parts), 2):
+            slot = self._slots[self._parts[k]]
+            if slot[0] == 'finding_charts':
+                before, after = self._parts[k - 1], self._parts[k + 1]
+                start = before.rfind('<', 0, before.rfind('<'))
+                end = after.find('>', after.find('>') + 1) + 1
+                self._charts[slot] = (before[start:], after[:end])
+                self._parts[k - 1], self._parts[k + 1] = before[:start], after[end:]
+
+        # for each slot, length of the closing tag that follows it, for writing empty elements
+        self._close = {}
+        for k in range(1, len(self._parts), 2):
+            after = self._parts[k + 1]
+            self._close[self._parts[k]] = after.find('>') + 1
+
+    def _fill(self, element: Element, xpath: str, slot: tuple):
+        """Store default text of a node and fill it with a sentinel.
+
+        Args:
+            element: Element containing the node.
+            xpath: XPath for node.
+            slot: Name of slot.
+        """
+        node = element.xpath(xpath).find(element.root)
+        if node is None:
+            return
+        self.defaults[slot] = node.text
+        node.text = BlockRenderer._SENTINEL % len(self._slots)
+        self._slots.append(slot)
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        """Escape text like ElementTree does."""
+        if '&' in text:
+            text = text.replace('&', '&amp;')
+        if '<' in text:
+            text = text.replace('<', '&lt;')
+        if '>' in text:
+            text = text.replace('>', '&gt;')
+        return text
+
+    def render(self, block: typing.Dict[str, typing.Any] = None,
+               targets: typing.List[typing.Dict[str, typing.Any]] = None) -> bytes:
+        """Renders a block.
+
+        Args:
+            block: Values for block slots, see BLOCK_SLOTS. Values are converted to strings, except for Time objects,
+                for which the ISO format is used like in Block.expiry_date.
+            targets: For each target in the template, values for the target slots, see TARGET_SLOTS. Additionally,
+                'coordinates' can be a SkyCoord or a tuple of strings as returned by Target.format_coordinates(), and
+                'finding_charts' can be a filename or a list of filenames.
+
+        Returns:
+            XML for block like Block.to_string().
+        """
+        block = block or {}
+        targets = targets or []
+
+        # collect values for all given slots
+        values = {}
+        for name, value in block.items():
+            if name not in BlockRenderer.BLOCK_SLOTS:
+                raise ValueError('Unknown slot %s.' % name)
+            values[(name, None)] = value.isot if hasattr(value, 'isot') else str(value)
+        for i, target in enumerate(targets):
+            for name, value in target.items():
+                if name == 'coordinates':
+                    texts = value if isinstance(value, tuple) else Target.format_coordinates(value)[0]
+                    for j, text in enumerate(texts):
+                        values[('coordinates', i, j)] = text
+                elif name == 'finding_charts':
+                    values[('finding_charts', i)] = [value] if isinstance(value, str) else value
+                elif name in BlockRenderer.TARGET_SLOTS:
+                    values[(name, i)] = str(value)
+                else:
+                    raise ValueError('Unknown slot %s.' % name)
+
+        # join fragments
+        escape, slots, parts, defaults = BlockRenderer._escape, self._slots, self._parts, self.defaults
+        out = [parts[0]]
+        skip = 0
+        for k in range(1, len(parts), 2):
+            index = parts[k]
+            slot = slots[index]
+            if slot[0] == 'finding_charts':
+                # repeat fragment for each chart
+                before, after = self._charts[slot]
+                for chart in values.get(slot, defaults[slot]):
+                    out += [before, escape(chart), after]
+                skip = 0
+            else:
+                text = values.get(slot, defaults[slot])
+                if text:
+                    out.append(escape(text))
+                    skip = 0
+                else:
+                    # empty element like <ns0:Sign />, replace '>' of opening tag and skip closing tag
+                    out[-1] = out[-1][:-1] + ' />'
+                    skip = self._close[index]
+            out.append(parts[k + 1][skip:])
+
+        # encode like Element.write() does
+        return ''.join(out).encode('us-ascii', 'xmlcharrefreplace')
+
+
+class RendererCache(object):
+    """Process-wide cache for compiled renderers, which are compiled again, if their template file changes."""
+
+    def __init__(self):
+        """Initializes a new, empty cache."""
+        self._renderers = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> BlockRenderer:
+        """Returns the renderer for the given template file.
+
+        Args:
+            filename: Name of template file.
+
+        Returns:
+            Compiled renderer.
+        """
+
+        # get state of file
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        state = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            # is there an up-to-date entry in the cache?
+            entry = self._renderers.get(filename)
+            if entry is not None and entry[0] == state:
+                return entry[1]
+
+            # compile renderer and store it
+            renderer = BlockRenderer(filename)
+            self._renderers[filename] = (state, renderer)
+            return renderer
+
+
+"""Global renderer cache."""
+renderers = RendererCache()
+
+
+__all__ = ['BlockRenderer', 'RendererCache', 'renderers']
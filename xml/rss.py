@@ -18,8 +18,7 @@ class RSS(Element):
         Returns:
             Name of this RSS config.
         """
-        xpath = RSS.NAME.format(**self.namespaces)
-        return self.root.find(xpath).text
+        return self.get(RSS.NAME)
 
     @name.setter
     def name(self, v: str):
@@ -28,8 +27,7 @@ class RSS(Element):
         Args:
             v: New name.
         """
-        xpath = RSS.NAME.format(**self.namespaces)
-        self.root.find(xpath).text = v
+        self.set(RSS.NAME, v)
 
     @property
     def exposure_time(self) -> float:
@@ -17,8 +17,7 @@ class Salticam(Element):
         Returns:
             Name of this Salticam config.
         """
-        xpath = Salticam.NAME.format(**self.namespaces)
-        return self.root.find(xpath).text
+        return self.get(Salticam.NAME)
 
     @name.setter
     def name(self, v: str):
@@ -27,8 +26,7 @@ class Salticam(Element):
         Args:
             v: New name.
         """
-        xpath = Salticam.NAME.format(**self.namespaces)
-        self.root.find(xpath).text = v
+        self.set(Salticam.NAME, v)
 
 
 __all__ = ['Salticam']
@@ -1,11 +1,14 @@
-from astropy.coordinates import SkyCoord
-import astropy.units as u
-from astropy.time import Time
 import typing
 from xml.etree import ElementTree as ET
 
 from .element import Element
 
+# astropy and numpy are expensive to import, so they are only imported when coordinates or times are actually used
+if typing.TYPE_CHECKING:
+    from astropy.coordinates import SkyCoord
+    from astropy.time import Time
+    import numpy as np
+
 
 class Target(Element):
     """A target in a SALT proposal."""
@@ -23,6 +26,21 @@ class Target(Element):
     MAG_MAX = './{/PIPT/Proposal/Shared}MagnitudeRange/{/PIPT/Proposal/Shared}Maximum'
     FINDING_CHART = './{/PIPT/Proposal/Shared}FindingChart'
     FINDING_CHART_PATH = './{/PIPT/Proposal/Shared}FindingChart/{/PIPT/Proposal/Shared}Path'
+    COORDINATES = './{/PIPT/Proposal/Shared}Coordinates'
+    RA = COORDINATES + '/{/PIPT/Shared}RightAscension'
+    RA_HOURS = RA + '/{/PIPT/Shared}Hours'
+    RA_MINUTES = RA + '/{/PIPT/Shared}Minutes'
+    RA_SECONDS = RA + '/{/PIPT/Shared}Seconds'
+    DEC = COORDINATES + '/{/PIPT/Shared}Declination'
+    DEC_SIGN = DEC + '/{/PIPT/Shared}Sign'
+    DEC_DEGREES = DEC + '/{/PIPT/Shared}Degrees'
+    DEC_ARCMINUTES = DEC + '/{/PIPT/Shared}Arcminutes'
+    DEC_ARCSECONDS = DEC + '/{/PIPT/Shared}Arcseconds'
+    EQUINOX = COORDINATES + '/{/PIPT/Shared}Equinox'
+
+    """XPaths for all coordinate nodes, in the order used by read_coordinates() and write_coordinates()."""
+    COORDINATE_NODES = [RA_HOURS, RA_MINUTES, RA_SECONDS, DEC_SIGN, DEC_DEGREES, DEC_ARCMINUTES, DEC_ARCSECONDS,
+                        EQUINOX]
 
     @property
     def name(self) -> str:
@@ -79,61 +97,106 @@ class Target(Element):
         self.set(Target.TARGET_TYPE, v)
 
     @property
-    def coordinates(self) -> SkyCoord:
+    def coordinates(self) -> 'SkyCoord':
         """Returns coordinates of this target."""
+        from astropy.coordinates import SkyCoord
+        import astropy.units as u
+        from astropy.time import Time
 
-        # coordinates
-        coords = self.root.find('./{/PIPT/Proposal/Shared}Coordinates'.format(**self.namespaces))
-
-        # RA
-        ra = coords.find('./{/PIPT/Shared}RightAscension'.format(**self.namespaces))
-        ra_h = ra.find('./{/PIPT/Shared}Hours'.format(**self.namespaces)).text
-        ra_m = ra.find('./{/PIPT/Shared}Minutes'.format(**self.namespaces)).text
-        ra_s = ra.find('./{/PIPT/Shared}Seconds'.format(**self.namespaces)).text
-
-        # Dec
-        dec = coords.find('./{/PIPT/Shared}Declination'.format(**self.namespaces))
-        dec_sign = dec.find('./{/PIPT/Shared}Sign'.format(**self.namespaces)).text
-        dec_d = dec.find('./{/PIPT/Shared}Degrees'.format(**self.namespaces)).text
-        dec_m = dec.find('./{/PIPT/Shared}Arcminutes'.format(**self.namespaces)).text
-        dec_s = dec.find('./{/PIPT/Shared}Arcseconds'.format(**self.namespaces)).text
-
-        # equinox
-        equinox = float(coords.find('./{/PIPT/Shared}Equinox'.format(**self.namespaces)).text)
-
-        # return SkyCoord
-        return SkyCoord('%s:%s:%s %s%s:%s:%s' % (ra_h, ra_m, ra_s, dec_sign, dec_d, dec_m, dec_s),
-                        unit=(u.hourangle, u.deg), equinox=equinox)
+        ra, dec, equinox = Target.read_coordinates([self])
+        return SkyCoord(ra=ra[0] * u.deg, dec=dec[0] * u.deg, equinox=Time(equinox[0], format='jyear'))
 
     @coordinates.setter
-    def coordinates(self, v: SkyCoord):
+    def coordinates(self, v: 'SkyCoord'):
         """Sets coordinates of this target.
 
         Args:
             v: New coordinates.
         """
+        Target.write_coordinates([self], v)
+
+    def _coordinate_nodes(self) -> typing.List[ET.Element]:
+        """Returns all nodes for the coordinates in the order given by COORDINATE_NODES."""
+        return [self.xpath(xpath).find(self.root) for xpath in Target.COORDINATE_NODES]
+
+    @staticmethod
+    def read_coordinates(targets: typing.Sequence['Target']) \
+            -> typing.Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        """Reads the coordinates of many targets at once.
+
+        Args:
+            targets: List of targets to read coordinates from.
+
+        Returns:
+            Tuple of arrays containing RA in degrees, Dec in degrees and equinox as Julian year.
+        """
+        import numpy as np
 
-        # coordinates
-        coords = self.root.find('./{/PIPT/Proposal/Shared}Coordinates'.format(**self.namespaces))
+        # collect texts of all nodes
+        texts = [[n.text for n in t._coordinate_nodes()] for t in targets]
 
-        # RA
-        hms = v.ra.hms
-        ra = coords.find('./{/PIPT/Shared}RightAscension'.format(**self.namespaces))
-        ra.find('./{/PIPT/Shared}Hours'.format(**self.namespaces)).text = '%d' % hms.h
-        ra.find('./{/PIPT/Shared}Minutes'.format(**self.namespaces)).text = '%d' % hms.m
-        ra.find('./{/PIPT/Shared}Seconds'.format(**self.namespaces)).text = '%f' % hms.s
+        # convert to numbers, sign is at position 3
+        values = np.array([row[:3] + row[4:] for row in texts], dtype=float).reshape((len(texts), 7))
+        sign = np.array([-1. if row[3] == '-' else 1. for row in texts])
 
-        # Dec
-        dms = v.dec.dms
-        dec = coords.find('./{/PIPT/Shared}Declination'.format(**self.namespaces))
-        dec.find('./{/PIPT/Shared}Sign'.format(**self.namespaces)).text = '-' if dms.d < 0 else ''
-        dec.find('./{/PIPT/Shared}Degrees'.format(**self.namespaces)).text = '%d' % abs(dms.d)
-        dec.find('./{/PIPT/Shared}Arcminutes'.format(**self.namespaces)).text = '%d' % abs(dms.m)
-        dec.find('./{/PIPT/Shared}Arcseconds'.format(**self.namespaces)).text = '%f' % abs(dms.s)
+        # calculate coordinates
+        ra = 15. * (values[:, 0] + values[:, 1] / 60. + values[:, 2] / 3600.)
+        dec = sign * (values[:, 3] + values[:, 4] / 60. + values[:, 5] / 3600.)
+        return ra, dec, values[:, 6]
+
+    @staticmethod
+    def format_coordinates(coords: 'SkyCoord') -> typing.List[typing.Tuple[str, ...]]:
+        """Formats coordinates into the texts for the coordinate nodes.
+
+        Args:
+            coords: Scalar SkyCoord or array-valued SkyCoord.
+
+        Returns:
+            List with one tuple per coordinate, containing the texts in the order given by COORDINATE_NODES.
+        """
+        import numpy as np
+        count = coords.size if coords.shape else 1
+
+        # convert to sexagesimal, sign is taken from declination itself, since the degrees are 0 for -1<dec<0
+        hms = coords.ra.hms
+        dms = coords.dec.dms
+        negative = np.atleast_1d(coords.dec.degree < 0).tolist()
+
+        # format all values
+        ra_h = ['%d' % v for v in np.atleast_1d(hms.h).tolist()]
+        ra_m = ['%d' % v for v in np.atleast_1d(hms.m).tolist()]
+        ra_s = ['%f' % v for v in np.atleast_1d(hms.s).tolist()]
+        sign = ['-' if v else '' for v in negative]
+        dec_d = ['%d' % v for v in np.abs(np.atleast_1d(dms.d)).tolist()]
+        dec_m = ['%d' % v for v in np.abs(np.atleast_1d(dms.m)).tolist()]
+        dec_s = ['%f' % v for v in np.abs(np.atleast_1d(dms.s)).tolist()]
 
         # equinox
-        coords.find('./{/PIPT/Shared}Equinox'.format(**self.namespaces)).text = '%f' % v.equinox \
-            if v.equinox else "2000"
+        if coords.equinox is None:
+            equinox = ['2000'] * count
+        else:
+            equinox = ['%f' % v for v in np.broadcast_to(coords.equinox.jyear, (count,)).tolist()]
+
+        # combine them
+        return list(zip(ra_h, ra_m, ra_s, sign, dec_d, dec_m, dec_s, equinox))
+
+    @staticmethod
+    def write_coordinates(targets: typing.Sequence['Target'], coords: 'SkyCoord'):
+        """Writes coordinates into many targets at once.
+
+        Args:
+            targets: List of targets to write coordinates to.
+            coords: Scalar SkyCoord for a single target or array-valued SkyCoord with one entry per target.
+        """
+
+        # check length
+        if len(targets) != (coords.size if coords.shape else 1):
+            raise ValueError('Number of coordinates does not match number of targets.')
+
+        # write them
+        for target, texts in zip(targets, Target.format_coordinates(coords)):
+            for node, text in zip(target._coordinate_nodes(), texts):
+                node.text = text
 
     @property
     def pm_ra(self) -> float:
@@ -164,13 +227,14 @@ class Target(Element):
         self.set(Target.PM_DEC, str(v))
 
     @property
-    def epoch(self) -> typing.Union[Time, None]:
+    def epoch(self) -> typing.Union['Time', None]:
         """Returns epoch for coordinates."""
+        from astropy.time import Time
         time = self.get(Target.PM_EPOCH, default=0.)
         return Time(time) if time != 0 else None
 
     @epoch.setter
-    def epoch(self, v: Time):
+    def epoch(self, v: 'Time'):
         """Set epoch for coordinates.
 
         Args:
@@ -227,7 +291,7 @@ class Target(Element):
         Returns:
             List of finding charts.
         """
-        return [fc.text for fc in self.root.findall(Target.FINDING_CHART_PATH.format(**self.namespaces))]
+        return [fc.text for fc in self.xpath(Target.FINDING_CHART_PATH).findall(self.root)]
 
     @finding_charts.setter
     def finding_charts(self, charts: typing.Union[str, typing.List[str]]):
@@ -241,16 +305,15 @@ class Target(Element):
         charts = [charts] if isinstance(charts, str) else charts
 
         # remove all from XML
-        for fc in self.root.findall(Target.FINDING_CHART.format(**self.namespaces)):
-            self.root.remove(fc)
+        self.remove(Target.FINDING_CHART)
 
         # add new
         for fc in charts:
-            chart = ET.Element('{/PIPT/Proposal/Shared}FindingChart'.format(**self.namespaces))
-            path = ET.Element('{/PIPT/Proposal/Shared}Path'.format(**self.namespaces))
+            chart = self.make_element('{/PIPT/Proposal/Shared}FindingChart')
+            path = self.make_element('{/PIPT/Proposal/Shared}Path')
             path.text = fc
             chart.append(path)
-            self.root.append(chart)
+            self.append(chart)
 
 
 __all__ = ['Target']
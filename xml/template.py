@@ -0,0 +1,77 @@
+import os
+import threading
+import typing
+
+from .backend import Backend, get_backend
+from .element import Element
+
+
+class TemplateCache(object):
+    """Process-wide cache for parsed XML templates.
+
+    Each template file is parsed only once and kept as a prototype, which is never modified. Callers get a deep copy
+    of it, so they can change their copy at will. If the modification time or size of a template file changes, it
+    is parsed again on next access. Prototypes are kept separately for each XML backend.
+    """
+
+    def __init__(self):
+        """Initializes a new, empty template cache."""
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def load(self, filename: str, klass: typing.Type[Element] = Element, backend: str = None) -> Element:
+        """Returns a new object of the given class working on a copy of the given template.
+
+        Args:
+            filename: Name of template file.
+            klass: Class to create object from, must be Element or derived from it.
+            backend: Name of XML backend, see saltofi.xml.backend.
+
+        Returns:
+            New object of type klass.
+        """
+
+        # get prototype, parse file, if necessary
+        prototype = self._get(filename, get_backend(backend))
+
+        # copy it, the prototype itself is only ever read, so this is safe without a lock
+        return klass(prototype.backend.copy(prototype.root), namespaces=dict(prototype.namespaces))
+
+    def clear(self):
+        """Removes all templates from cache."""
+        with self._lock:
+            self._templates.clear()
+
+    def _get(self, filename: str, backend: Backend) -> Element:
+        """Returns the prototype for the given template file and parses it first, if necessary.
+
+        Args:
+            filename: Name of template file.
+            backend: XML backend to parse with.
+
+        Returns:
+            Element for template, must not be modified.
+        """
+
+        # get state of file
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        state = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            # is there an up-to-date entry in the cache?
+            entry = self._templates.get((filename, backend.name))
+            if entry is not None and entry[0] == state:
+                return entry[1]
+
+            # parse template and store it
+            prototype = Element(filename, backend=backend.name)
+            self._templates[(filename, backend.name)] = (state, prototype)
+            return prototype
+
+
+"""Global template cache."""
+templates = TemplateCache()
+
+
+__all__ = ['TemplateCache', 'templates']
@@ -0,0 +1,144 @@
+import re
+import threading
+import typing
+from xml.etree import ElementTree as ET
+
+if typing.TYPE_CHECKING:
+    from .backend import Backend
+
+
+class XPath(object):
+    """An XPath with resolved namespaces, compiled for fast repeated access.
+
+    Paths that consist only of simple child steps, like all the XPaths defined in the element classes, are split into
+    a tuple of fully qualified tags. Those are then walked one by one, which ElementTree handles without going through
+    its generic path machinery, or compiled by the backend, if it supports it, like lxml does into an XPath object.
+    All other paths are passed on to the find methods of the elements unchanged.
+    """
+
+    """Regular expressions for splitting an XPath into steps and for checking for simple steps."""
+    _STEP = re.compile(r'(?:\{[^}]*\}|[^/{])+')
+    _SIMPLE_STEP = re.compile(r'(?:\{[^}]*\})?[^/{}\[\]*@.]+')
+
+    def __init__(self, xpath: str, namespaces: typing.Dict[str, str], backend: 'Backend' = None):
+        """Compiles a new XPath.
+
+        Args:
+            xpath: XPath for element, will be mapped using namespaces.
+            namespaces: Mapping of namespaces as in Element.namespaces.
+            backend: XML backend to compile for.
+        """
+
+        # resolve namespaces in full path
+        self.path = xpath.format(**namespaces)
+
+        # try to split into simple steps
+        self.steps = None
+        if xpath.startswith('./'):
+            steps = tuple(s.format(**namespaces) for s in XPath._STEP.findall(xpath[2:]))
+            if steps and all(XPath._SIMPLE_STEP.fullmatch(s) for s in steps):
+                self.steps = steps
+
+        # compile with backend
+        self._compiled = None if self.steps is None or backend is None else backend.compile(self.steps)
+
+    def find(self, root: ET.Element) -> typing.Union[ET.Element, None]:
+        """Find first matching element.
+
+        Args:
+            root: Root for search.
+
+        Returns:
+            First matching element or None.
+        """
+        if self._compiled is not None:
+            elements = self._compiled(root)
+            return elements[0] if elements else None
+        if self.steps is None:
+            return root.find(self.path)
+
+        # follow first child at each step, if that reaches the end, it is the first match in document order
+        el = root
+        for step in self.steps:
+            el = el.find(step)
+            if el is None:
+                break
+        else:
+            return el
+
+        # otherwise a later sibling at some step might still have a match
+        elements = self.findall(root)
+        return elements[0] if elements else None
+
+    def findall(self, root: ET.Element) -> typing.List[ET.Element]:
+        """Find all matching elements.
+
+        Args:
+            root: Root for search.
+
+        Returns:
+            List of all matching elements in document order.
+        """
+        if self._compiled is not None:
+            return self._compiled(root)
+        if self.steps is None:
+            return root.findall(self.path)
+        elements = [root]
+        for step in self.steps:
+            elements = [c for el in elements for c in el.findall(step)]
+        return elements
+
+
+class XPathCache(object):
+    """Cache for compiled XPaths, keyed on XPath template, namespace mapping and backend."""
+
+    def __init__(self):
+        """Initializes a new, empty cache."""
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def get_map(self, namespaces: typing.Dict[str, str], backend: 'Backend' = None) -> typing.Dict[str, XPath]:
+        """Returns the dictionary of compiled XPaths for the given namespace mapping and backend.
+
+        Args:
+            namespaces: Mapping of namespaces as in Element.namespaces.
+            backend: XML backend to compile for.
+
+        Returns:
+            Dictionary mapping XPath templates to compiled XPaths, see compile().
+        """
+        key = (None if backend is None else backend.name, frozenset(namespaces.items()))
+        try:
+            return self._maps[key]
+        except KeyError:
+            with self._lock:
+                return self._maps.setdefault(key, {})
+
+    @staticmethod
+    def compile(xpaths: typing.Dict[str, XPath], xpath: str, namespaces: typing.Dict[str, str],
+                backend: 'Backend' = None) -> XPath:
+        """Returns the compiled version of the given XPath and adds it to the given map, if necessary.
+
+        Args:
+            xpaths: Dictionary of compiled XPaths for namespaces and backend as returned by get_map().
+            xpath: XPath for element, will be mapped using namespaces.
+            namespaces: Mapping of namespaces as in Element.namespaces.
+            backend: XML backend to compile for.
+
+        Returns:
+            Compiled XPath.
+        """
+        try:
+            return xpaths[xpath]
+        except KeyError:
+            # compiling twice in concurrent threads does no harm, both results are identical
+            compiled = XPath(xpath, namespaces, backend)
+            xpaths[xpath] = compiled
+            return compiled
+
+
+"""Global cache for compiled XPaths."""
+xpaths = XPathCache()
+
+
+__all__ = ['XPath', 'XPathCache', 'xpaths']